@@ -0,0 +1,96 @@
+"""
+Compare the STT upload formats: encoding time against bytes and time saved.
+
+Usage: python benchmarks/compression_benchmark.py [seconds ...]
+
+A speech-like test signal (16 kHz, 16-bit mono, as voice satellites send it)
+is encoded with ffmpeg into each upload format, the same way the
+integration does. For each utterance length the script prints the encoding
+time (including starting ffmpeg), the size, and on a few uplink speeds the
+upload still left when the recording ends: the upload follows the
+recording, so that is what the user waits for. The last columns show which
+format the automatic setting picks for each uplink.
+"""
+from __future__ import annotations
+import importlib.util
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+UPLINKS_KBPS = [64, 200, 1000]
+RUNS = 3
+
+_MODULE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "custom_components", "openai_stt", "openaistt_codec.py"
+)
+
+
+def _load_codec():
+    # Loaded from its file so the benchmark doesn't need Home Assistant installed.
+    spec = importlib.util.spec_from_file_location("openaistt_codec", _MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_speech(seconds: float) -> bytes:
+    # Harmonics of a gliding pitch, shaped into syllables, over a little noise.
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t), 0.05, None)
+    signal = 0.2 * envelope * voiced + 0.003 * rng.standard_normal(len(t))
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def encode(codec, upload_format, pcm: bytes) -> bytes:
+    if not upload_format.ffmpeg_args:
+        return pcm
+    # The integration feeds ffmpeg a WAV stream of unknown length.
+    header = (b"RIFF\xff\xff\xff\xffWAVEfmt " + struct.pack("<IHHIIHH", 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16)
+              + b"data\xff\xff\xff\xff")
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-threads", "1",
+         *codec.FFMPEG_INPUT_ARGS, *upload_format.ffmpeg_args, "pipe:1"],
+        input=header + pcm, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    ).stdout
+
+
+def main() -> None:
+    if not shutil.which("ffmpeg"):
+        sys.exit("ffmpeg not found")
+    codec = _load_codec()
+    lengths = [float(arg) for arg in sys.argv[1:]] or [0.3, 1, 3, 10]
+    backlog_header = " ".join(f"{f'left@{kbps}k ms':>14}" for kbps in UPLINKS_KBPS)
+    auto_header = " ".join(f"{f'auto@{kbps}k':>10}" for kbps in UPLINKS_KBPS)
+    print(f"{'length':>7} {'format':>6} {'encode ms':>10} {'bytes':>9} {'ratio':>6} {backlog_header} {auto_header}")
+    for seconds in lengths:
+        pcm = make_speech(seconds)
+        choices = " ".join(
+            f"{codec.choose_format(seconds, SAMPLE_RATE * 2, kbps).name:>10}" for kbps in UPLINKS_KBPS
+        )
+        for upload_format in codec.UPLOAD_FORMATS.values():
+            start = time.perf_counter()
+            for _ in range(RUNS):
+                encoded = encode(codec, upload_format, pcm)
+            elapsed = (time.perf_counter() - start) / RUNS
+            # Measured size, with the encoder's start and flush as estimated.
+            backlog = " ".join(
+                f"{(upload_format.startup_time + max(0.0, len(encoded) * 8 / (kbps * 1000) - seconds)) * 1000:>14.0f}"
+                for kbps in UPLINKS_KBPS
+            )
+            print(f"{seconds:>6.1f}s {upload_format.name:>6} {elapsed * 1000:>10.1f} {len(encoded):>9}"
+                  f" {len(encoded) / len(pcm):>6.2f} {backlog} {choices}")
+
+
+if __name__ == "__main__":
+    main()
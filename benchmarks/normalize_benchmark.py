@@ -0,0 +1,113 @@
+"""
+Compare the in-process NumPy loudness normalization with the ffmpeg loudnorm path.
+
+Usage: python benchmarks/normalize_benchmark.py [seconds ...]
+
+A speech-like test signal (noise shaped by a syllable-rate envelope, with a
+few hot transients) is normalized by both engines and delivered as MP3, the
+default format, the way the integration does it: NumPy normalizes and ffmpeg
+encodes, or ffmpeg's loudnorm filter does both. NumPy with WAV output, which
+needs no ffmpeg, is shown as well. For each length the script prints the wall
+time per run and the loudness and true peak of the result, as measured by the
+NumPy implementation after decoding (outside the timed runs). The ffmpeg rows
+are skipped if it isn't installed.
+"""
+from __future__ import annotations
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 24000
+RUNS = 5
+
+_MODULE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "custom_components", "openai_tts", "openaitts_loudness.py"
+)
+
+
+def _load_loudness():
+    # Loaded from its file so the benchmark doesn't need Home Assistant installed.
+    spec = importlib.util.spec_from_file_location("openaitts_loudness", _MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_signal(seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    length = int(seconds * SAMPLE_RATE)
+    t = np.arange(length) / SAMPLE_RATE
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t) + 0.3 * np.sin(2 * np.pi * 0.5 * t), 0, None)
+    signal = 0.05 * rng.standard_normal(length) * envelope
+    signal[rng.integers(0, length, 5)] = 0.95
+    return signal
+
+
+def run_numpy(loudness, pcm: bytes) -> bytes:
+    normalized = loudness.normalize(loudness.pcm16_to_float(pcm), SAMPLE_RATE)
+    return loudness.float_to_pcm16(normalized)
+
+
+def _ffmpeg(args: list[str], audio: bytes) -> bytes:
+    # Mirrors the integration's ffmpeg jobs: audio in over stdin, out over stdout.
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-threads", "1", *args],
+        input=audio, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    ).stdout
+
+
+def _encode_args(filters: list[str]) -> list[str]:
+    return ["-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-i", "pipe:0", *filters,
+            "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "libmp3lame", "-b:a", "128k", "-f", "mp3", "pipe:1"]
+
+
+def run_numpy_mp3(loudness, pcm: bytes) -> bytes:
+    return _ffmpeg(_encode_args([]), run_numpy(loudness, pcm))
+
+
+def run_ffmpeg(loudness, pcm: bytes) -> bytes:
+    return _ffmpeg(_encode_args(["-af", "loudnorm=I=-16:TP=-1:LRA=5"]), pcm)
+
+
+def decode_mp3(audio: bytes) -> bytes:
+    return _ffmpeg(["-f", "mp3", "-i", "pipe:0", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"], audio)
+
+
+def measure(loudness, pcm: bytes) -> tuple[float, float]:
+    samples = loudness.pcm16_to_float(pcm)
+    return loudness.integrated_loudness(samples, SAMPLE_RATE), loudness.true_peak(samples)
+
+
+def main() -> None:
+    loudness = _load_loudness()
+    lengths = [float(arg) for arg in sys.argv[1:]] or [5, 30, 120]
+    # Engine name -> (normalize and encode, decode back to PCM for measuring).
+    engines = {"numpy wav": (run_numpy, None)}
+    if shutil.which("ffmpeg"):
+        engines["numpy mp3"] = (run_numpy_mp3, decode_mp3)
+        engines["ffmpeg mp3"] = (run_ffmpeg, decode_mp3)
+    else:
+        print("ffmpeg not found; benchmarking the NumPy engine only")
+
+    print(f"{'length':>8} {'engine':>10} {'ms/run':>10} {'LUFS':>8} {'dBTP':>8}")
+    for seconds in lengths:
+        pcm = loudness.float_to_pcm16(make_signal(seconds))
+        for name, (engine, decode) in engines.items():
+            start = time.perf_counter()
+            for _ in range(RUNS):
+                result = engine(loudness, pcm)
+            elapsed = (time.perf_counter() - start) / RUNS * 1000
+            if decode is not None:
+                result = decode(result)
+            integrated, peak = measure(loudness, result)
+            print(f"{seconds:>7.0f}s {name:>10} {elapsed:>10.1f} {integrated:>8.2f} {peak:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measure the STT audio front end: bytes saved and the CPU time it costs.
+
+Usage: python benchmarks/pcm_benchmark.py [seconds]
+
+A speech-like test signal is captured in a few common formats and converted
+to 16-bit mono at no more than 16 kHz in 20 ms chunks, like a live stream.
+For each format the script prints the bytes received and sent, the CPU time
+per second of audio, and how closely the result matches the same signal
+generated at the output rate directly (signal-to-error ratio).
+"""
+from __future__ import annotations
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+
+CHUNK_MS = 20
+RUNS = 3
+FORMATS = [(48000, 16, 2), (44100, 16, 2), (48000, 24, 1), (22000, 16, 1), (16000, 16, 1), (8000, 16, 1)]
+
+_MODULE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "custom_components", "openai_stt", "openaistt_pcm.py"
+)
+
+
+def _load_pcm():
+    # Loaded from its file so the benchmark doesn't need Home Assistant installed.
+    spec = importlib.util.spec_from_file_location("openaistt_pcm", _MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def speech(sample_rate: int, seconds: float) -> np.ndarray:
+    # Harmonics of a gliding pitch up to 3.5 kHz, shaped into syllables.
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    # The integral of a pitch of 140 + 30 sin(2 pi 0.7 t) Hz, the same at every rate.
+    phase = 2 * np.pi * (140 * t - 30 / (2 * np.pi * 0.7) * np.cos(2 * np.pi * 0.7 * t))
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 20))
+    return 0.2 * np.clip(np.sin(2 * np.pi * 3.5 * t), 0.05, None) * voiced
+
+
+def capture(pcm, signal: np.ndarray, bits: int, channels: int) -> bytes:
+    samples = np.repeat(signal[:, None], channels, axis=1).ravel()
+    if bits == 24:
+        raw = np.clip(np.rint(samples * 8388608), -8388608, 8388607).astype("<i4").view(np.uint8)
+        return raw.reshape(-1, 4)[:, :3].tobytes()
+    return pcm.encode_pcm16(samples)
+
+
+def convert(pcm, data: bytes, pcm_format) -> bytes:
+    normalizer = pcm.PCMNormalizer(pcm_format, min(pcm_format.sample_rate, pcm.TARGET_SAMPLE_RATE))
+    chunk = pcm_format.sample_rate * pcm_format.channels * pcm_format.bits_per_sample // 8 * CHUNK_MS // 1000
+    pieces = [normalizer.process(data[offset:offset + chunk]) for offset in range(0, len(data), chunk)]
+    pieces.append(normalizer.flush())
+    return b"".join(pieces)
+
+
+def main() -> None:
+    pcm = _load_pcm()
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    print(f"{'format':>18} {'bytes in':>9} {'bytes out':>9} {'saved':>6} {'CPU ms/s':>9} {'SER dB':>7}")
+    for sample_rate, bits, channels in FORMATS:
+        pcm_format = pcm.PCMFormat(sample_rate, bits, channels)
+        data = capture(pcm, speech(sample_rate, seconds), bits, channels)
+        start = time.perf_counter()
+        for _ in range(RUNS):
+            output = convert(pcm, data, pcm_format)
+        elapsed = (time.perf_counter() - start) / RUNS
+        result = np.frombuffer(output, "<i2") / 32768
+        reference = speech(min(sample_rate, pcm.TARGET_SAMPLE_RATE), seconds)
+        length = min(len(result), len(reference))
+        error = result[:length] - reference[:length]
+        ser = 10 * np.log10(np.sum(reference[:length] ** 2) / max(np.sum(error ** 2), 1e-20))
+        name = f"{sample_rate} Hz {bits}-bit {'stereo' if channels == 2 else 'mono'}"
+        print(f"{name:>18} {len(data):>9} {len(output):>9} {1 - len(output) / len(data):>6.0%}"
+              f" {elapsed * 1000 / seconds:>9.2f} {ser:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
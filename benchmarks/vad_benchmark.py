@@ -0,0 +1,130 @@
+"""
+Measure what trimming silence before the STT upload saves.
+
+Usage: python benchmarks/vad_benchmark.py [max_pause_ms]
+
+Synthetic utterances the way satellites record them (silence after the wake
+word, speech, silence until the recording stops, with a little background
+noise) are run through the silence trimmer in 20 ms chunks, like a live
+stream. For each the script prints the audio sent, the bytes saved, the CPU
+time of the detector per second of audio and the upload time saved on a
+1 Mbit/s uplink (what a hedged or retried request has to resend at once).
+
+With OPENAI_API_KEY set, both versions are also transcribed by the API
+(STT_URL and STT_MODEL override the endpoint and model) and the response
+times compared, as transcription time grows with the length of the audio.
+"""
+from __future__ import annotations
+import importlib.util
+import os
+import struct
+import sys
+import time
+import uuid
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+CHUNK_MS = 20
+UPLINK_BITS_PER_SECOND = 1_000_000
+RUNS = 5
+
+_MODULE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "custom_components", "openai_stt", "openaistt_vad.py"
+)
+
+
+def _load_vad():
+    # Loaded from its file so the benchmark doesn't need Home Assistant installed.
+    spec = importlib.util.spec_from_file_location("openaistt_vad", _MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def silence(rng, seconds: float) -> np.ndarray:
+    return 0.002 * rng.standard_normal(int(seconds * SAMPLE_RATE))
+
+
+def speech(rng, seconds: float) -> np.ndarray:
+    # Harmonics of a gliding pitch, shaped into syllables.
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t), 0.05, None)
+    return 0.2 * envelope * voiced + 0.002 * rng.standard_normal(len(t))
+
+
+def scenarios() -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(0)
+    return {
+        "command": np.concatenate([silence(rng, 1.0), speech(rng, 2.0), silence(rng, 1.5)]),
+        "two phrases": np.concatenate([silence(rng, 0.8), speech(rng, 1.5), silence(rng, 1.5),
+                                       speech(rng, 1.5), silence(rng, 1.5)]),
+        "dictation": np.concatenate([part for _ in range(6) for part in (speech(rng, 4.0), silence(rng, 1.2))]),
+    }
+
+
+def to_pcm(signal: np.ndarray) -> bytes:
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def trim(vad, pcm: bytes, max_pause_ms: int) -> bytes:
+    trimmer = vad.SilenceTrimmer(SAMPLE_RATE, max_pause_ms=max_pause_ms)
+    chunk = SAMPLE_RATE * 2 * CHUNK_MS // 1000
+    pieces = []
+    for offset in range(0, len(pcm), chunk):
+        pieces.extend(trimmer.process(pcm[offset:offset + chunk]))
+    pieces.extend(trimmer.flush())
+    return b"".join(pieces)
+
+
+def transcribe_seconds(pcm: bytes) -> float:
+    url = os.environ.get("STT_URL", "https://api.openai.com/v1/audio/transcriptions")
+    wav = (b"RIFF" + struct.pack("<I", 36 + len(pcm)) + b"WAVEfmt "
+           + struct.pack("<IHHIIHH", 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16)
+           + b"data" + struct.pack("<I", len(pcm)) + pcm)
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="model"\r\n\r\n'
+            f'{os.environ.get("STT_MODEL", "gpt-4o-mini-transcribe")}\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="audio.wav"\r\n'
+            f'Content-Type: audio/wav\r\n\r\n').encode() + wav + f'\r\n--{boundary}--\r\n'.encode()
+    request = Request(url, data=body, method="POST", headers={
+        "Authorization": f"Bearer {os.environ['OPENAI_API_KEY']}",
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+    })
+    start = time.perf_counter()
+    with urlopen(request, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    vad = _load_vad()
+    max_pause_ms = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    use_api = bool(os.environ.get("OPENAI_API_KEY"))
+    header = f"{'scenario':>12} {'audio s':>8} {'sent s':>7} {'saved':>6} {'VAD ms/s':>9} {'upload ms saved':>16}"
+    if use_api:
+        header += f" {'API ms full':>12} {'API ms trimmed':>15}"
+    print(f"max pause: {max_pause_ms or 'unlimited'} ms")
+    print(header)
+    for name, signal in scenarios().items():
+        pcm = to_pcm(signal)
+        start = time.perf_counter()
+        for _ in range(RUNS):
+            trimmed = trim(vad, pcm, max_pause_ms)
+        elapsed = (time.perf_counter() - start) / RUNS
+        seconds = len(pcm) / 2 / SAMPLE_RATE
+        saved = len(pcm) - len(trimmed)
+        line = (f"{name:>12} {seconds:>8.1f} {len(trimmed) / 2 / SAMPLE_RATE:>7.1f} {saved / len(pcm):>6.0%}"
+                f" {elapsed * 1000 / seconds:>9.2f} {saved * 8 / UPLINK_BITS_PER_SECOND * 1000:>16.0f}")
+        if use_api:
+            line += f" {transcribe_seconds(pcm) * 1000:>12.0f} {transcribe_seconds(trimmed) * 1000:>15.0f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
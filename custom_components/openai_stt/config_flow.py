@@ -10,24 +10,56 @@ import uuid
 
 from homeassistant import data_entry_flow
 from homeassistant.config_entries import ConfigFlow, OptionsFlow
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.selector import selector
 from homeassistant.exceptions import HomeAssistantError
 
 from .const import (
     CONF_API_KEY,
+    CONF_ADD_ENDPOINT,
+    CONF_ENDPOINTS,
+    CONF_HEDGE_PERCENTILE,
+    CONF_LONG_FORM,
+    CONF_LONG_FORM_PART_SECONDS,
+    CONF_MAX_CONCURRENCY,
+    CONF_PROBE_LATENCY,
+    CONF_REALTIME,
+    CONF_REALTIME_URL,
+    CONF_SPECULATIVE,
     CONF_STT_MODEL,
     CONF_STT_LANGUAGE,
     CONF_STT_RESPONSE_FORMAT,
+    CONF_TIMEOUT,
+    CONF_UPLINK_KBPS,
+    CONF_UPLOAD_FORMAT,
     CONF_URL,
+    CONF_VAD,
+    CONF_VAD_MAX_PAUSE,
+    CONF_VAD_THRESHOLD,
     DOMAIN,
     STT_MODELS,
     STT_RESPONSE_FORMATS,
+    DEFAULT_HEDGE_PERCENTILE,
+    DEFAULT_LONG_FORM,
+    DEFAULT_LONG_FORM_PART_SECONDS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_REALTIME,
+    DEFAULT_SPECULATIVE,
     DEFAULT_STT_MODEL,
     DEFAULT_STT_LANGUAGE,
     DEFAULT_STT_RESPONSE_FORMAT,
+    DEFAULT_TIMEOUT,
+    DEFAULT_UPLINK_KBPS,
+    DEFAULT_UPLOAD_FORMAT,
+    DEFAULT_VAD,
+    DEFAULT_VAD_MAX_PAUSE,
+    DEFAULT_VAD_THRESHOLD,
+    OPENAI_REALTIME_URL,
     OPENAI_STT_URL,
     UNIQUE_ID,
+    UPLOAD_FORMAT_OPTIONS,
 )
+from .openaistt_engine import async_probe_endpoint
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -101,9 +133,17 @@ class OpenAISTTOptionsFlow(OptionsFlow):
     def __init__(self, config_entry):
         """Initialize options flow."""
         self.config_entry = config_entry
+        self._options: dict[str, Any] = {}
     
     async def async_step_init(self, user_input: dict | None = None):
+        endpoints = self.config_entry.options.get(CONF_ENDPOINTS, [])
         if user_input is not None:
+            # Endpoints are listed by index; unticking one removes it.
+            kept = user_input.pop(CONF_ENDPOINTS, [str(index) for index in range(len(endpoints))])
+            user_input[CONF_ENDPOINTS] = [endpoints[int(index)] for index in kept]
+            if user_input.pop(CONF_ADD_ENDPOINT, False):
+                self._options = user_input
+                return await self.async_step_endpoint()
             return self.async_create_entry(title="", data=user_input)
             
         # Build the options schema
@@ -135,7 +175,191 @@ class OpenAISTTOptionsFlow(OptionsFlow):
                     "sort": True,
                     "custom_value": False
                 }
+            }),
+
+            # Transcriptions sent at once; further ones queue, taking turns per client.
+            vol.Optional(
+                CONF_MAX_CONCURRENCY,
+                default=self.config_entry.options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)
+            ): selector({
+                "number": {
+                    "min": 1,
+                    "max": 32,
+                    "step": 1,
+                    "mode": "box"
+                }
+            }),
+
+            # Time budget of a transcription, including time spent in the queue.
+            vol.Optional(
+                CONF_TIMEOUT,
+                default=self.config_entry.options.get(CONF_TIMEOUT, DEFAULT_TIMEOUT)
+            ): selector({
+                "number": {
+                    "min": 5,
+                    "max": 300,
+                    "step": 1,
+                    "mode": "box",
+                    "unit_of_measurement": "s"
+                }
+            }),
+
+            # Latency percentile after which a stalled request is duplicated; 0 disables it.
+            vol.Optional(
+                CONF_HEDGE_PERCENTILE,
+                default=self.config_entry.options.get(CONF_HEDGE_PERCENTILE, DEFAULT_HEDGE_PERCENTILE)
+            ): selector({
+                "number": {
+                    "min": 0,
+                    "max": 99,
+                    "step": 1,
+                    "mode": "box"
+                }
+            }),
+
+            # Trim silence before upload: speech level and the longest pause kept (0 keeps all).
+            vol.Optional(
+                CONF_VAD,
+                default=self.config_entry.options.get(CONF_VAD, DEFAULT_VAD)
+            ): selector({"boolean": {}}),
+            vol.Optional(
+                CONF_VAD_THRESHOLD,
+                default=self.config_entry.options.get(CONF_VAD_THRESHOLD, DEFAULT_VAD_THRESHOLD)
+            ): selector({
+                "number": {
+                    "min": -80,
+                    "max": -10,
+                    "step": 1,
+                    "mode": "box",
+                    "unit_of_measurement": "dBFS"
+                }
+            }),
+            vol.Optional(
+                CONF_VAD_MAX_PAUSE,
+                default=self.config_entry.options.get(CONF_VAD_MAX_PAUSE, DEFAULT_VAD_MAX_PAUSE)
+            ): selector({
+                "number": {
+                    "min": 0,
+                    "max": 5000,
+                    "step": 100,
+                    "mode": "box",
+                    "unit_of_measurement": "ms"
+                }
+            }),
+
+            # Upload format for PCM audio; "auto" trades encoding time against upload time.
+            vol.Optional(
+                CONF_UPLOAD_FORMAT,
+                default=self.config_entry.options.get(CONF_UPLOAD_FORMAT, DEFAULT_UPLOAD_FORMAT)
+            ): selector({
+                "select": {
+                    "options": UPLOAD_FORMAT_OPTIONS,
+                    "mode": "dropdown",
+                    "custom_value": False
+                }
+            }),
+            vol.Optional(
+                CONF_UPLINK_KBPS,
+                default=self.config_entry.options.get(CONF_UPLINK_KBPS, DEFAULT_UPLINK_KBPS)
+            ): selector({
+                "number": {
+                    "min": 16,
+                    "max": 1000000,
+                    "step": 1,
+                    "mode": "box",
+                    "unit_of_measurement": "kbit/s"
+                }
+            }),
+
+            # Transcribe at pauses while the stream is still running, before it ends.
+            vol.Optional(
+                CONF_SPECULATIVE,
+                default=self.config_entry.options.get(CONF_SPECULATIVE, DEFAULT_SPECULATIVE)
+            ): selector({"boolean": {}}),
+
+            # Split long recordings at pauses and transcribe the parts concurrently.
+            vol.Optional(
+                CONF_LONG_FORM,
+                default=self.config_entry.options.get(CONF_LONG_FORM, DEFAULT_LONG_FORM)
+            ): selector({"boolean": {}}),
+            vol.Optional(
+                CONF_LONG_FORM_PART_SECONDS,
+                default=self.config_entry.options.get(CONF_LONG_FORM_PART_SECONDS, DEFAULT_LONG_FORM_PART_SECONDS)
+            ): selector({
+                "number": {
+                    "min": 5,
+                    "max": 600,
+                    "step": 1,
+                    "mode": "box",
+                    "unit_of_measurement": "s"
+                }
+            }),
+
+            # Stream PCM audio to a realtime transcription session instead of uploading it.
+            vol.Optional(
+                CONF_REALTIME,
+                default=self.config_entry.options.get(CONF_REALTIME, DEFAULT_REALTIME)
+            ): selector({"boolean": {}}),
+            vol.Optional(
+                CONF_REALTIME_URL,
+                default=self.config_entry.options.get(CONF_REALTIME_URL, OPENAI_REALTIME_URL)
+            ): str
+        })
+        if endpoints:
+            # Endpoints added besides the original one; untick one to remove it.
+            options_schema = options_schema.extend({
+                vol.Optional(
+                    CONF_ENDPOINTS,
+                    default=[str(index) for index in range(len(endpoints))]
+                ): selector({
+                    "select": {
+                        "options": [
+                            {"value": str(index), "label": f"{endpoint[CONF_URL]} ({endpoint[CONF_STT_MODEL]})"}
+                            for index, endpoint in enumerate(endpoints)
+                        ],
+                        "multiple": True
+                    }
+                })
             })
+        options_schema = options_schema.extend({
+            vol.Optional(CONF_ADD_ENDPOINT, default=False): selector({"boolean": {}})
         })
         
-        return self.async_show_form(step_id="init", data_schema=options_schema)
\ No newline at end of file
+        return self.async_show_form(step_id="init", data_schema=options_schema)
+
+    async def async_step_endpoint(self, user_input: dict | None = None):
+        """Add an endpoint after checking that it transcribes audio, and note how fast it answered."""
+        errors = {}
+        if user_input is not None:
+            try:
+                latency = await async_probe_endpoint(
+                    async_get_clientsession(self.hass),
+                    user_input[CONF_URL],
+                    user_input.get(CONF_API_KEY),
+                    user_input[CONF_STT_MODEL],
+                )
+            except HomeAssistantError as e:
+                _LOGGER.warning("Endpoint probe failed: %s", e)
+                errors["base"] = "cannot_connect"
+            else:
+                _LOGGER.info("Endpoint %s answered in %.2f s", user_input[CONF_URL], latency)
+                endpoint = {**user_input, CONF_PROBE_LATENCY: latency}
+                self._options[CONF_ENDPOINTS] = [*self._options[CONF_ENDPOINTS], endpoint]
+                return self.async_create_entry(title="", data=self._options)
+        endpoint_schema = vol.Schema({
+            vol.Required(CONF_URL): str,
+            vol.Optional(CONF_API_KEY): str,
+            vol.Required(CONF_STT_MODEL, default=self.config_entry.data.get(CONF_STT_MODEL, DEFAULT_STT_MODEL)): selector({
+                "select": {
+                    "options": STT_MODELS,
+                    "mode": "dropdown",
+                    "sort": True,
+                    "custom_value": True
+                }
+            })
+        })
+        return self.async_show_form(
+            step_id="endpoint",
+            data_schema=self.add_suggested_values_to_schema(endpoint_schema, user_input),
+            errors=errors
+        )
\ No newline at end of file
@@ -15,6 +15,55 @@ DEFAULT_STT_MODEL = "gpt-4o-mini-transcribe"
 DEFAULT_STT_LANGUAGE = "en"
 STT_RESPONSE_FORMATS = ["json", "text"]
 DEFAULT_STT_RESPONSE_FORMAT = "text"
+CONF_HEDGE_PERCENTILE = "hedge_percentile"
+DEFAULT_HEDGE_PERCENTILE = 95  # 0 disables hedging
+# Endpoints used besides the one the entry was created with, each a dict of
+# url, api_key, model and the latency measured when it was added.
+CONF_ENDPOINTS = "endpoints"
+CONF_ADD_ENDPOINT = "add_endpoint"
+CONF_PROBE_LATENCY = "probe_latency"
+# Transcriptions running at once, and the time budget of each one in seconds.
+CONF_MAX_CONCURRENCY = "max_concurrency"
+DEFAULT_MAX_CONCURRENCY = 4
+CONF_TIMEOUT = "timeout"
+DEFAULT_TIMEOUT = 30
+# Stream PCM audio over a realtime WebSocket session instead of uploading it.
+CONF_REALTIME = "realtime"
+DEFAULT_REALTIME = False
+CONF_REALTIME_URL = "realtime_url"
+OPENAI_REALTIME_URL = "wss://api.openai.com/v1/realtime?intent=transcription"
+# Trim silence before uploading PCM audio: the level a frame needs to count as
+# speech, and the longest pause kept inside an utterance (0 keeps them all).
+CONF_VAD = "vad"
+DEFAULT_VAD = False
+CONF_VAD_THRESHOLD = "vad_threshold"
+DEFAULT_VAD_THRESHOLD = -45
+CONF_VAD_MAX_PAUSE = "vad_max_pause"
+DEFAULT_VAD_MAX_PAUSE = 0
+# Format PCM audio is uploaded in ("auto" picks one for the uplink speed, in kbit/s).
+CONF_UPLOAD_FORMAT = "upload_format"
+UPLOAD_FORMAT_AUTO = "auto"
+UPLOAD_FORMAT_OPTIONS = [UPLOAD_FORMAT_AUTO, "wav", "flac", "opus"]
+DEFAULT_UPLOAD_FORMAT = "wav"
+CONF_UPLINK_KBPS = "uplink_kbps"
+DEFAULT_UPLINK_KBPS = 1000
+# Split long PCM recordings at pauses into parts of at most this many seconds,
+# transcribed a few at a time, each with the end of the text before it as context.
+CONF_LONG_FORM = "long_form"
+DEFAULT_LONG_FORM = False
+CONF_LONG_FORM_PART_SECONDS = "long_form_part_seconds"
+DEFAULT_LONG_FORM_PART_SECONDS = 30
+LONG_FORM_CONCURRENCY = 4
+LONG_FORM_PROMPT_CHARS = 500
+# Transcribe PCM audio at pauses while the stream is still running, and keep
+# the result if no more speech follows.
+CONF_SPECULATIVE = "speculative"
+DEFAULT_SPECULATIVE = False
+
+# Fired after every transcription with its queueing delay and outcome.
+EVENT_TRANSCRIPTION = f"{DOMAIN}_transcription"
+# Fired with the interim text while a realtime transcription is running.
+EVENT_PARTIAL_TRANSCRIPTION = f"{DOMAIN}_partial_transcription"
 
 # Default endpoint for OpenAI transcriptions
 OPENAI_STT_URL = "https://api.openai.com/v1/audio/transcriptions"
\ No newline at end of file
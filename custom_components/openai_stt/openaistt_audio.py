@@ -0,0 +1,182 @@
+"""
+Audio handling for OpenAI STT.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+
+from homeassistant.exceptions import HomeAssistantError
+
+from .openaistt_codec import FFMPEG_INPUT_ARGS, UploadFormat
+
+_LOGGER = logging.getLogger(__name__)
+
+ENCODER_READ_SIZE = 4096
+
+
+class AudioStreamError(HomeAssistantError):
+    """The audio stream from Home Assistant failed before it ended."""
+
+
+class AudioBuffer:
+    """The audio of one utterance, readable while it is still being recorded.
+
+    Chunks are kept as the objects received, never joined or copied, and
+    every iteration starts from the first chunk and then follows the stream
+    live, so an upload can start with the first chunk and a retry or hedged
+    request can replay the same audio later. `filename` and `content_type`
+    tell the API what format the audio is in.
+
+    Runs on the event loop; not thread-safe.
+    """
+
+    def __init__(self, filename: str = "audio.wav", content_type: str = "audio/wav"):
+        self.filename = filename
+        self.content_type = content_type
+        self._chunks: list[bytes] = []
+        self._size = 0
+        self._finished_at: float | None = None
+        self._error: BaseException | None = None
+        self._changed = asyncio.Event()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def done(self) -> bool:
+        return self._finished_at is not None
+
+    @property
+    def finished_at(self) -> float | None:
+        """When the stream ended (time.monotonic()), or None while it is still running."""
+        return self._finished_at
+
+    @property
+    def error(self) -> BaseException | None:
+        return self._error
+
+    def append(self, chunk: bytes) -> None:
+        if chunk:
+            self._chunks.append(chunk)
+            self._size += len(chunk)
+            self._notify()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        """Mark the end of the stream; with `error`, readers fail instead of ending."""
+        if self._finished_at is None:
+            self._finished_at = time.monotonic()
+            self._error = error
+            self._notify()
+
+    def _notify(self) -> None:
+        # Wake everybody waiting on the current event and give later waiters a fresh one.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_finished(self) -> None:
+        while self._finished_at is None:
+            await self._changed.wait()
+
+    async def wait_size(self, size: int) -> None:
+        """Wait until `size` bytes have arrived or the stream has ended."""
+        while self._size < size and self._finished_at is None:
+            await self._changed.wait()
+
+    def snapshot(self) -> AudioBuffer:
+        """The audio so far as a finished buffer of its own, sharing the chunks."""
+        copy = AudioBuffer(self.filename, self.content_type)
+        copy._chunks = list(self._chunks)
+        copy._size = self._size
+        copy.finish(self._error)
+        return copy
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[bytes]:
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self._chunks):
+                yield self._chunks[index]
+                index += 1
+            if self._error is not None:
+                raise AudioStreamError("The audio stream failed") from self._error
+            if self._finished_at is not None and index == len(self._chunks):
+                return
+            await changed.wait()
+
+
+class UploadEncoder:
+    """Compress WAV audio with ffmpeg while it is still being recorded.
+
+    The audio is piped into ffmpeg as it arrives and the encoded output is
+    collected in a new AudioBuffer, which an upload can stream as usual.
+    """
+
+    def __init__(self, upload_format: UploadFormat):
+        self._format = upload_format
+        self._process: asyncio.subprocess.Process | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def async_start(self, source: AudioBuffer) -> AudioBuffer:
+        """Start encoding `source`; returns the buffer the encoded audio goes to."""
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-threads", "1",
+                *FFMPEG_INPUT_ARGS, *self._format.ffmpeg_args, "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as err:
+            raise HomeAssistantError(f"Could not start ffmpeg: {err}") from err
+        output = AudioBuffer(self._format.filename, self._format.content_type)
+        self._tasks = [
+            asyncio.create_task(self._async_feed(source)),
+            asyncio.create_task(self._async_collect(source, output)),
+        ]
+        return output
+
+    async def _async_feed(self, source: AudioBuffer) -> None:
+        stdin = self._process.stdin
+        try:
+            async for chunk in source:
+                stdin.write(chunk)
+                await stdin.drain()
+        except (AudioStreamError, ConnectionError):
+            # The collecting side reports what went wrong.
+            pass
+        finally:
+            stdin.close()
+
+    async def _async_collect(self, source: AudioBuffer, output: AudioBuffer) -> None:
+        stdout = self._process.stdout
+        try:
+            while chunk := await stdout.read(ENCODER_READ_SIZE):
+                output.append(chunk)
+            returncode = await self._process.wait()
+        except Exception as err:
+            output.finish(err)
+            raise
+        if source.error is not None:
+            output.finish(source.error)
+        elif returncode != 0:
+            stderr = (await self._process.stderr.read()).decode(errors="replace").strip()
+            _LOGGER.error("ffmpeg failed to encode %s: %s", self._format.name, stderr)
+            output.finish(HomeAssistantError(f"ffmpeg exited with code {returncode}"))
+        else:
+            output.finish()
+
+    async def async_close(self) -> None:
+        """Stop encoding if it is still running."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+
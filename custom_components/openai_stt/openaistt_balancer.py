@@ -0,0 +1,149 @@
+"""
+Latency-aware load balancing over several OpenAI-compatible endpoints.
+
+The other integration has a copy of this module, openai_tts/openaitts_balancer.py; keep the
+two identical apart from the import of the sibling retry module.
+"""
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from .openaistt_retry import LatencyTracker
+
+_LOGGER = logging.getLogger(__name__)
+
+# Weight of the newest sample in the moving averages.
+EWMA_ALPHA = 0.2
+# An endpoint is ejected after this many failures in a row, or once its error
+# rate passes ERROR_RATE_EJECT after at least ERROR_RATE_MIN_REQUESTS requests.
+EJECT_CONSECUTIVE_FAILURES = 3
+ERROR_RATE_EJECT = 0.5
+ERROR_RATE_MIN_REQUESTS = 5
+# Ejection time, doubled for every ejection in a row up to the maximum.
+EJECT_BASE_SECONDS = 30.0
+EJECT_MAX_SECONDS = 300.0
+# Seconds between checks for ejected endpoints due for a probe.
+PROBE_INTERVAL = 10.0
+# Floor for (1 - error rate) in the score, so a failing endpoint is heavily
+# penalized but never divides by zero.
+MIN_SUCCESS_RATE = 0.05
+
+
+@dataclass(eq=False)
+class Endpoint:
+    """An OpenAI-compatible endpoint and its passively measured health."""
+    url: str
+    api_key: str | None
+    model: str
+    latency: LatencyTracker
+    # Seconds, averaged over recent successful requests (seeded by the config flow probe).
+    average_latency: float | None = None
+    error_rate: float = 0.0
+    requests: int = 0
+    inflight: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.url} ({self.model})"
+
+    def score(self) -> float:
+        """Expected cost of sending one more request here; lower is better."""
+        # Endpoints without measurements are tried first so they get some.
+        latency = self.average_latency if self.average_latency is not None else 0.0
+        return latency * (self.inflight + 1) / max(MIN_SUCCESS_RATE, 1 - self.error_rate)
+
+
+class EndpointBalancer:
+    """Route each request to the endpoint with the best expected latency.
+
+    Health is checked passively: every request reports its outcome, and an
+    endpoint that keeps failing is ejected for a while. When the ejection
+    expires the endpoint, whichever it is, is due for a probe (see
+    `due_for_probe`) and takes requests again once one succeeds; if the
+    probe fails it is ejected for twice as long. If no endpoint is healthy,
+    the one due back first is used rather than failing outright.
+
+    Thread-safe, so the same balancer can be used from the executor.
+    """
+
+    def __init__(self, endpoints: Iterable[Endpoint]):
+        self._endpoints = list(endpoints)
+        if not self._endpoints:
+            raise ValueError("At least one endpoint is required")
+        self._lock = threading.Lock()
+
+    @property
+    def endpoints(self) -> list[Endpoint]:
+        return list(self._endpoints)
+
+    def select(self, exclude: Iterable[Endpoint] = ()) -> Endpoint:
+        """The endpoint the next request would go to.
+        Endpoints in `exclude` (e.g. the one a hedged request is already
+        waiting on) are only used if there is no other choice.
+        """
+        with self._lock:
+            return self._select(set(exclude))
+
+    def acquire(self, exclude: Iterable[Endpoint] = ()) -> Endpoint:
+        """Pick an endpoint for a request, like `select`, and count it as in flight."""
+        with self._lock:
+            endpoint = self._select(set(exclude))
+            endpoint.inflight += 1
+        return endpoint
+
+    def _select(self, excluded: set[Endpoint]) -> Endpoint:
+        now = time.monotonic()
+        candidates = [e for e in self._endpoints if e not in excluded] or self._endpoints
+        healthy = [e for e in candidates if e.ejected_until <= now and not e.ejections]
+        if healthy:
+            return min(healthy, key=Endpoint.score)
+        return min(candidates, key=lambda e: e.ejected_until)
+
+    def due_for_probe(self) -> list[Endpoint]:
+        """Ejected endpoints whose ejection has expired. They wait for a probe,
+        reported like any request, before taking requests again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [e for e in self._endpoints if e.ejections and e.ejected_until <= now]
+
+    def report(self, endpoint: Endpoint, success: bool, latency: float | None = None) -> None:
+        """Record the outcome of a request to `endpoint`.
+        `latency` is the time until the response started, for successes.
+        """
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.error_rate += EWMA_ALPHA * ((0.0 if success else 1.0) - endpoint.error_rate)
+            if success:
+                endpoint.consecutive_failures = 0
+                if endpoint.ejections:
+                    _LOGGER.info("Endpoint %s is healthy again", endpoint.name)
+                    endpoint.ejections = 0
+                if latency is not None:
+                    if endpoint.average_latency is None:
+                        endpoint.average_latency = latency
+                    else:
+                        endpoint.average_latency += EWMA_ALPHA * (latency - endpoint.average_latency)
+                return
+            endpoint.consecutive_failures += 1
+            now = time.monotonic()
+            if endpoint.ejected_until > now:
+                return
+            if (endpoint.consecutive_failures >= EJECT_CONSECUTIVE_FAILURES
+                    or (endpoint.requests >= ERROR_RATE_MIN_REQUESTS and endpoint.error_rate > ERROR_RATE_EJECT)
+                    or endpoint.ejections):
+                duration = min(EJECT_MAX_SECONDS, EJECT_BASE_SECONDS * 2 ** endpoint.ejections)
+                endpoint.ejections += 1
+                endpoint.ejected_until = now + duration
+                _LOGGER.warning("Ejecting endpoint %s for %.0f s after repeated failures", endpoint.name, duration)
+
+    def release(self, endpoint: Endpoint) -> None:
+        """Count a request started with `acquire` as no longer in flight."""
+        with self._lock:
+            endpoint.inflight -= 1
@@ -0,0 +1,95 @@
+"""
+Formats STT audio can be uploaded in, and the choice between them.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+
+# Audio needed before the format is chosen on an uplink slower than the PCM;
+# shorter utterances are judged by their full length.
+DECISION_SECONDS = 1.0
+# Seconds of upload left when the recording ends that are accepted to keep the
+# audio lossless; beyond that Opus is used if it gets the audio there sooner.
+MAX_LOSSLESS_BACKLOG = 0.5
+
+
+@dataclass(frozen=True)
+class UploadFormat:
+    """An upload format and what encoding into it costs, estimated for speech
+    with benchmarks/compression_benchmark.py."""
+    name: str
+    filename: str
+    content_type: str
+    # ffmpeg output options; empty for PCM, which is sent as it is.
+    ffmpeg_args: tuple[str, ...]
+    lossless: bool = True
+    # Size as a fraction of the PCM, or a fixed bitrate (bits per second) for lossy formats.
+    size_ratio: float = 1.0
+    bitrate: int | None = None
+    # Seconds to start the encoder and to get the last audio out of it. The
+    # encoders run many times faster than real time, so they keep up with
+    # the recording.
+    startup_time: float = 0.0
+
+    def estimated_size(self, pcm_bytes: float, seconds: float) -> float:
+        if self.bitrate is not None:
+            return self.bitrate / 8 * seconds
+        return pcm_bytes * self.size_ratio
+
+
+WAV = UploadFormat("wav", "audio.wav", "audio/wav", ())
+FLAC = UploadFormat(
+    "flac", "audio.flac", "audio/flac",
+    # Without the 8 KiB of padding for later tags, which would outweigh short utterances.
+    ("-c:a", "flac", "-metadata_header_padding", "0", "-f", "flac"),
+    size_ratio=0.63, startup_time=0.02,
+)
+OPUS = UploadFormat(
+    "opus", "audio.ogg", "audio/ogg",
+    # Short Ogg pages, so encoded audio keeps flowing to the upload.
+    ("-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-compression_level", "5",
+     "-page_duration", "100000", "-f", "ogg"),
+    lossless=False, bitrate=27000, startup_time=0.12,
+)
+UPLOAD_FORMATS = {upload_format.name: upload_format for upload_format in (WAV, FLAC, OPUS)}
+
+# Filename and MIME type of compressed audio sent as it is received, by
+# container; Ogg is the only one Home Assistant streams besides WAV.
+PASSTHROUGH_TYPES = {
+    "ogg": ("audio.ogg", "audio/ogg"),
+}
+
+
+def uplink_keeps_up(pcm_bytes_per_second: float, uplink_kbps: float) -> bool:
+    """Whether the uplink sends PCM as fast as it is recorded, so nothing is
+    left to send when the recording ends."""
+    return pcm_bytes_per_second * 8 <= uplink_kbps * 1000
+
+
+def upload_backlog(upload_format: UploadFormat, seconds: float, pcm_bytes_per_second: float,
+                   uplink_kbps: float) -> float:
+    """Seconds from the end of a recording of `seconds` until its upload in
+    `upload_format` is complete. The upload follows the recording, so only
+    what the uplink couldn't send in the meantime is left.
+    """
+    uplink = max(1.0, uplink_kbps) * 1000 / 8
+    size = upload_format.estimated_size(pcm_bytes_per_second * seconds, seconds)
+    return upload_format.startup_time + max(0.0, size / uplink - seconds)
+
+
+def choose_format(seconds: float, pcm_bytes_per_second: float, uplink_kbps: float) -> UploadFormat:
+    """The format for `seconds` of audio over an uplink of `uplink_kbps`.
+    Lossless audio is preferred: PCM as it is when the uplink keeps up with
+    it, FLAC when that leaves less to send at the end. Opus is only used when
+    the uplink falls behind by more than MAX_LOSSLESS_BACKLOG even so.
+    """
+    def backlog(upload_format: UploadFormat) -> float:
+        return upload_backlog(upload_format, seconds, pcm_bytes_per_second, uplink_kbps)
+
+    lossless = min((fmt for fmt in UPLOAD_FORMATS.values() if fmt.lossless), key=backlog)
+    if backlog(lossless) <= MAX_LOSSLESS_BACKLOG:
+        return lossless
+    return min(UPLOAD_FORMATS.values(), key=backlog)
+
+
+# ffmpeg options reading the normalized audio, a WAV stream, from stdin.
+FFMPEG_INPUT_ARGS = ("-f", "wav", "-i", "pipe:0")
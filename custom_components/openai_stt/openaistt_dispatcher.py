@@ -0,0 +1,154 @@
+"""
+Bounded, fair dispatch of OpenAI STT requests.
+"""
+from __future__ import annotations
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+from homeassistant.exceptions import HomeAssistantError
+
+_LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Weight of the newest sample in the moving average of the service time.
+EWMA_ALPHA = 0.2
+# Service time assumed before any request has finished.
+DEFAULT_SERVICE_TIME = 1.0
+
+
+class DeadlineExceeded(HomeAssistantError):
+    """The request can't be transcribed before its deadline, so it wasn't sent."""
+
+
+@dataclass
+class _Waiter:
+    deadline: Callable[[], float]
+    future: asyncio.Future = field(repr=False)
+
+
+@dataclass
+class DispatchStats:
+    """How a transcription was dispatched, in seconds."""
+    queue_delay: float = 0.0
+    service_time: float | None = None
+
+
+class STTDispatcher:
+    """Run transcriptions with a concurrency cap, fair across sources.
+
+    Every source (a satellite, browser or other client) has its own queue and
+    free slots go round-robin over the sources with waiting requests, so one
+    client sending a burst can't push the others back. Before a request is
+    started its deadline is checked against the recent average service time;
+    a request that can no longer finish in time is dropped with
+    DeadlineExceeded instead of occupying a slot and the API.
+
+    Runs on the event loop; not thread-safe.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self._max_concurrency = max(1, int(max_concurrency))
+        self._running = 0
+        self._queues: dict[str, deque[_Waiter]] = {}
+        self._rotation: deque[str] = deque()
+        self._anonymous = itertools.count()
+        self._service_time = DEFAULT_SERVICE_TIME
+
+    @property
+    def service_time(self) -> float:
+        """Average seconds a transcription takes once started."""
+        return self._service_time
+
+    def new_source(self) -> str:
+        """A source of its own, for related requests from an unknown client."""
+        return f"#{next(self._anonymous)}"
+
+    def queued(self) -> int:
+        return sum(1 for queue in self._queues.values() for waiter in queue if not waiter.future.done())
+
+    async def async_run(self, source: str | None, deadline: Callable[[], float], job: Callable[[], Awaitable[T]],
+                        stats: DispatchStats | None = None,
+                        ready_at: Callable[[], float | None] | None = None) -> T:
+        """Run `job` once a slot is free, unless the deadline (time.monotonic())
+        would be missed. `deadline()` is asked when the slot comes up, as it may
+        only be known later (e.g. once the user has stopped talking). A job that
+        starts before its input is complete, like a streamed upload, passes
+        `ready_at()` returning when it was, so the service time only counts the
+        time after that. The queueing delay and service time are written to
+        `stats`. Requests without a source are queued on their own.
+        """
+        start = time.monotonic()
+        await self._acquire(source if source is not None else self.new_source(), deadline)
+        started = time.monotonic()
+        if stats is not None:
+            stats.queue_delay = started - start
+        try:
+            result = await job()
+        finally:
+            self._release()
+        if ready_at is not None:
+            started = max(started, ready_at() or started)
+        service_time = time.monotonic() - started
+        self._service_time += EWMA_ALPHA * (service_time - self._service_time)
+        if stats is not None:
+            stats.service_time = service_time
+        return result
+
+    async def _acquire(self, source: str, deadline: Callable[[], float]) -> None:
+        if not self._rotation and self._running < self._max_concurrency:
+            self._check_deadline(deadline)
+            self._running += 1
+            return
+        waiter = _Waiter(deadline, asyncio.get_running_loop().create_future())
+        if source not in self._queues:
+            self._queues[source] = deque()
+            self._rotation.append(source)
+        self._queues[source].append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was handed over just as we were cancelled.
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._dispatch()
+
+    def _check_deadline(self, deadline: Callable[[], float]) -> None:
+        remaining = deadline() - time.monotonic()
+        if remaining < self._service_time:
+            raise DeadlineExceeded(
+                f"Transcription would take about {self._service_time:.1f} s, only {max(0.0, remaining):.1f} s left"
+            )
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the next source in turn, dropping requests that can't make their deadline."""
+        while self._rotation and self._running < self._max_concurrency:
+            source = self._rotation.popleft()
+            queue = self._queues[source]
+            waiter = queue.popleft()
+            if queue:
+                self._rotation.append(source)
+            else:
+                del self._queues[source]
+            if waiter.future.done():
+                # Cancelled while waiting.
+                continue
+            try:
+                self._check_deadline(waiter.deadline)
+            except DeadlineExceeded as err:
+                _LOGGER.debug("Dropping queued transcription from %s: %s", source, err)
+                waiter.future.set_exception(err)
+                continue
+            self._running += 1
+            waiter.future.set_result(None)
@@ -1,124 +1,327 @@
 """
 STT Engine for OpenAI Speech-to-Text.
 """
+from __future__ import annotations
+import asyncio
 import json
 import logging
+import struct
 import time
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
-from asyncio import CancelledError
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from http import HTTPStatus
+from urllib.parse import urlparse
 
+import aiohttp
+
+from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import ssl as ssl_util
+
+from .const import DOMAIN
+from .openaistt_audio import AudioBuffer, AudioStreamError
+from .openaistt_balancer import Endpoint, EndpointBalancer
+from .openaistt_retry import (
+    MAX_ATTEMPTS,
+    RETRY_AFTER_MAX,
+    async_hedge,
+    backoff_delay,
+    is_retryable_status,
+    parse_retry_after,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Seconds to wait for the response once the audio has been sent. The upload
+# itself runs as long as the user talks, so there is no total limit here; the
+# provider's time budget covers the whole transcription.
+REQUEST_TIMEOUT = 30
+# Idle connections are kept this long for the next request.
+KEEPALIVE_TIMEOUT = 30
+CONNECTION_LIMIT = 10
+DNS_CACHE_TTL = 300
+WARM_TIMEOUT = 10
+# A warmed connection is refreshed before the pool would close it, for this
+# long after the last call to warm(); after that it is left to expire.
+WARM_LIFETIME = 120
+WARM_INTERVAL = KEEPALIVE_TIMEOUT * 2 / 3
+
+DATA_SESSIONS = "sessions"
+
+
+@dataclass
+class _SharedSession:
+    """A pooled client session and the number of engines using it."""
+    session: aiohttp.ClientSession
+    users: int = 0
+
+
+def _base_url(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+def async_acquire_session(hass: HomeAssistant, url: str) -> aiohttp.ClientSession:
+    """Return the keep-alive session shared by all entries pointing at the base URL of `url`."""
+    sessions: dict[str, _SharedSession] = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_SESSIONS, {})
+    key = _base_url(url)
+    shared = sessions.get(key)
+    if shared is None or shared.session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=CONNECTION_LIMIT,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            ssl=ssl_util.get_default_context(),
+        )
+        shared = _SharedSession(aiohttp.ClientSession(connector=connector))
+        sessions[key] = shared
+        _LOGGER.debug("Created pooled HTTP session for %s", key)
+    shared.users += 1
+    return shared.session
+
+
+async def async_release_session(hass: HomeAssistant, url: str) -> None:
+    """Drop one reference to the session for `url` and close it once unused."""
+    sessions: dict[str, _SharedSession] = hass.data.get(DOMAIN, {}).get(DATA_SESSIONS, {})
+    key = _base_url(url)
+    shared = sessions.get(key)
+    if shared is None:
+        return
+    shared.users -= 1
+    if shared.users <= 0:
+        del sessions[key]
+        await shared.session.close()
+        _LOGGER.debug("Closed pooled HTTP session for %s", key)
+
+
+async def _multipart_stream(boundary: str, fields: dict, filename: str, content_type: str,
+                            audio: AudioBuffer) -> AsyncIterator[bytes]:
+    """Encode text form fields followed by the audio file as multipart/form-data.
+    The audio chunks are passed through as they arrive, so the request is sent
+    with chunked transfer encoding while the audio is still being recorded.
+    """
+    head = bytearray()
+    for key, value in fields.items():
+        head.extend(f'--{boundary}\r\n'.encode('utf-8'))
+        head.extend(f'Content-Disposition: form-data; name="{key}"\r\n\r\n'.encode('utf-8'))
+        head.extend(f'{value}\r\n'.encode('utf-8'))
+    head.extend(f'--{boundary}\r\n'.encode('utf-8'))
+    head.extend(f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode('utf-8'))
+    head.extend(f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8'))
+    yield bytes(head)
+    async for chunk in audio:
+        yield chunk
+    yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+
 class OpenAISTTEngine:
     """Engine for OpenAI STT capabilities."""
-    
-    def __init__(self, api_key: str, model: str, language: str, url: str, response_format: str = "text"):
-        """Initialize the OpenAI STT engine."""
-        self._api_key = api_key
-        self._model = model
+
+    def __init__(self, balancer: EndpointBalancer, sessions: dict[str, aiohttp.ClientSession], language: str,
+                 response_format: str = "text"):
+        """Initialize the OpenAI STT engine.
+        `sessions` maps the URL of every endpoint to the pooled session used for it.
+        """
+        self._balancer = balancer
+        self._sessions = sessions
+        self._warming: dict[str, asyncio.Task] = {}
+        self._warm_until: dict[str, float] = {}
+        self._probing: set[Endpoint] = set()
+        # Model of the endpoint the entry was created with, used for naming.
+        self._model = balancer.endpoints[0].model
         self._language = language
-        self._url = url
         self._response_format = response_format
 
-    def process_audio(self, audio_data: bytes, language: str = None) -> str:
+    def _build_fields(self, endpoint: Endpoint, language: str | None, prompt: str | None) -> tuple[dict, dict]:
+        headers = {}
+        if endpoint.api_key:
+            headers["Authorization"] = f"Bearer {endpoint.api_key}"
+
+        fields = {
+            'model': endpoint.model,
+            'response_format': self._response_format,
+        }
+
+        if language:
+            fields['language'] = language
+        if prompt:
+            fields['prompt'] = prompt
+        return headers, fields
+
+    async def _async_attempt(self, endpoint: Endpoint, audio: AudioBuffer, language: str | None,
+                             prompt: str | None) -> bytes:
+        """Upload the audio to `endpoint`, which must have been acquired from the
+        balancer, as it arrives and return the response body. The endpoint is
+        released afterwards and the outcome reported, unless it was cancelled.
+        """
+        headers, fields = self._build_fields(endpoint, language, prompt)
+        boundary = f'----OpenAISTTBoundary{uuid.uuid4().hex}'
+        headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        start = time.monotonic()
+        try:
+            async with self._sessions[endpoint.url].post(
+                endpoint.url,
+                data=_multipart_stream(boundary, fields, audio.filename, audio.content_type, audio),
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=REQUEST_TIMEOUT),
+            ) as response:
+                response.raise_for_status()
+                content = await response.read()
+        except asyncio.CancelledError:
+            raise
+        except aiohttp.ClientResponseError as err:
+            # A client error means the endpoint is up; only count what it can be blamed for.
+            self._balancer.report(endpoint, not is_retryable_status(err.status))
+            raise
+        except BaseException:
+            if audio.error is not None:
+                # The upload broke off because the audio did, not the endpoint.
+                raise AudioStreamError("The audio stream failed") from audio.error
+            self._balancer.report(endpoint, False)
+            raise
+        finally:
+            self._balancer.release(endpoint)
+        # The server can't answer before it has the whole utterance, so the
+        # latency is counted from the end of the upload.
+        latency = time.monotonic() - max(start, audio.finished_at or start)
+        endpoint.latency.record(latency)
+        self._balancer.report(endpoint, True, latency)
+        return content
+
+    async def async_transcribe(self, audio: AudioBuffer, language: str = None, prompt: str | None = None) -> str:
         """
-        Synchronous STT request using urllib.request.
-        If the API call fails, waits for 1 second and retries once.
+        Asynchronous STT request, sent to the fastest healthy endpoint.
+        The upload starts right away and follows `audio` as it is recorded.
+        A request that hasn't been answered by the hedge deadline (a percentile
+        of recent latencies, counted from the end of the audio) gets a
+        duplicate, on another endpoint if there is one, and the first answer is
+        used. Network errors, rate limits and server errors are retried with
+        jittered exponential backoff, honoring the server's Retry-After.
+        `prompt` is text the audio follows on from, passed to the model as context.
         Returns transcribed text.
         """
         if language is None:
             language = self._language
 
-        headers = {
-            "Authorization": f"Bearer {self._api_key}" if self._api_key else None,
-        }
-        # Remove None headers
-        headers = {k: v for k, v in headers.items() if v is not None}
-        
-        files = {
-            'file': ('audio.wav', audio_data, 'audio/wav'),
-            'model': (None, self._model),
-            'response_format': (None, self._response_format),
-        }
-        
-        if language:
-            files['language'] = (None, language)
+        tried: list[Endpoint] = []
 
-        max_retries = 1
-        attempt = 0
-        
-        # Prepare multipart form data
-        boundary = '----WebKitFormBoundary' + str(int(time.time()))
-        headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
-        
-        body = bytearray()
-        for key, value in files.items():
-            body.extend(f'--{boundary}\r\n'.encode('utf-8'))
-            if isinstance(value, tuple):
-                filename, content, content_type = value if len(value) == 3 else (value[0], value[1], None)
-                if filename:
-                    body.extend(f'Content-Disposition: form-data; name="{key}"; filename="{filename}"\r\n'.encode('utf-8'))
-                else:
-                    body.extend(f'Content-Disposition: form-data; name="{key}"\r\n'.encode('utf-8'))
-                if content_type:
-                    body.extend(f'Content-Type: {content_type}\r\n'.encode('utf-8'))
-                body.extend(b'\r\n')
-                if isinstance(content, str):
-                    body.extend(content.encode('utf-8'))
-                else:
-                    body.extend(content)
-            else:
-                body.extend(f'Content-Disposition: form-data; name="{key}"\r\n\r\n'.encode('utf-8'))
-                body.extend(str(value).encode('utf-8'))
-            body.extend(b'\r\n')
-        body.extend(f'--{boundary}--\r\n'.encode('utf-8'))
-        
-        while True:
+        async def attempt() -> bytes:
+            endpoint = self._balancer.acquire(exclude=tried)
+            tried.append(endpoint)
+            return await self._async_attempt(endpoint, audio, language, prompt)
+
+        for attempt_number in range(MAX_ATTEMPTS):
             try:
-                req = Request(
-                    self._url,
-                    data=body,
-                    headers=headers,
-                    method="POST"
-                )
-                # Set a timeout of 30 seconds for the entire request.
-                with urlopen(req, timeout=30) as response:
-                    content = response.read()
-                    if self._response_format == "json":
-                        result = json.loads(content.decode('utf-8'))
-                        if isinstance(result, dict) and 'text' in result:
-                            return result['text']
-                        return result
-                    # For text format or any other
-                    return content.decode('utf-8')
-            except CancelledError as ce:
-                _LOGGER.exception("STT request cancelled")
+                delay = self._balancer.select(exclude=tried).latency.hedge_delay()
+                content = await async_hedge(attempt(), attempt, delay, audio.wait_finished)
+                if self._response_format == "json":
+                    result = json.loads(content.decode('utf-8'))
+                    if isinstance(result, dict) and 'text' in result:
+                        return result['text']
+                    return result
+                # For text format or any other
+                return content.decode('utf-8')
+            except asyncio.CancelledError:
+                _LOGGER.debug("STT request cancelled")
                 raise  # Propagate cancellation.
-            except (HTTPError, URLError) as net_err:
-                _LOGGER.exception("Network error in synchronous process_audio on attempt %d", attempt + 1)
-                if attempt < max_retries:
-                    attempt += 1
-                    time.sleep(1)  # Wait for 1 second before retrying.
-                    _LOGGER.debug("Retrying HTTP call (attempt %d)", attempt + 1)
-                    continue
-                else:
+            except AudioStreamError:
+                # Nothing to retry; the audio itself is incomplete.
+                raise
+            except aiohttp.ClientResponseError as err:
+                _LOGGER.warning("STT request failed with HTTP %d on attempt %d", err.status, attempt_number + 1)
+                if not is_retryable_status(err.status) or attempt_number + 1 == MAX_ATTEMPTS:
+                    raise HomeAssistantError(f"STT request failed with HTTP {err.status}") from err
+                delay = parse_retry_after(err.headers.get("Retry-After") if err.headers else None)
+                if delay is not None and delay > RETRY_AFTER_MAX:
+                    raise HomeAssistantError(f"STT API asked to retry after {delay:.0f} s") from err
+            except (aiohttp.ClientError, asyncio.TimeoutError) as net_err:
+                _LOGGER.warning("Network error in async_transcribe on attempt %d: %r", attempt_number + 1, net_err)
+                if attempt_number + 1 == MAX_ATTEMPTS:
                     raise HomeAssistantError("Network error occurred while processing audio") from net_err
+                delay = None
             except Exception as exc:
-                _LOGGER.exception("Unknown error in synchronous process_audio on attempt %d", attempt + 1)
-                if attempt < max_retries:
-                    attempt += 1
-                    time.sleep(1)
-                    _LOGGER.debug("Retrying HTTP call (attempt %d)", attempt + 1)
-                    continue
-                else:
-                    raise HomeAssistantError("An unknown error occurred while processing audio") from exc
-
-    def close(self):
-        """Nothing to close in the synchronous version."""
-        pass
+                _LOGGER.exception("Unknown error in async_transcribe on attempt %d", attempt_number + 1)
+                raise HomeAssistantError("An unknown error occurred while processing audio") from exc
+            if len(self._balancer.endpoints) > len(set(tried)):
+                # Another endpoint is available; a Retry-After only applies to the one that sent it.
+                delay = 0.0
+            elif delay is None:
+                delay = backoff_delay(attempt_number)
+            _LOGGER.debug("Retrying HTTP call in %.2f s (attempt %d)", delay, attempt_number + 2)
+            await asyncio.sleep(delay)
+        raise HomeAssistantError("STT request failed")
+
+    def warm(self) -> None:
+        """Keep a connection open to the endpoint the next request will most
+        likely go to, in the background, so a request doesn't wait for DNS,
+        TCP and TLS. The connection is kept for WARM_LIFETIME after the last
+        call; requests never wait for it, and take whatever connection the
+        pool has ready when they start.
+        """
+        endpoint = self._balancer.select()
+        self._warm_until[endpoint.url] = time.monotonic() + WARM_LIFETIME
+        if endpoint.url in self._warming:
+            return
+        task = asyncio.create_task(self._async_keep_warm(endpoint))
+        self._warming[endpoint.url] = task
+        task.add_done_callback(lambda _: self._warming.pop(endpoint.url, None))
+
+    async def _async_keep_warm(self, endpoint: Endpoint) -> None:
+        while True:
+            await self._async_warm(endpoint)
+            # The pool keeps the connection for KEEPALIVE_TIMEOUT after this.
+            if self._warm_until[endpoint.url] - time.monotonic() < WARM_INTERVAL:
+                return
+            await asyncio.sleep(WARM_INTERVAL)
+
+    async def _async_warm(self, endpoint: Endpoint) -> None:
+        # Any response leaves the connection in the pool; a HEAD request
+        # carries no body. An idle connection is reused and so kept alive.
+        try:
+            async with self._sessions[endpoint.url].head(
+                endpoint.url, allow_redirects=False, timeout=aiohttp.ClientTimeout(total=WARM_TIMEOUT)
+            ) as response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            _LOGGER.debug("Could not open a connection to %s: %s", endpoint.url, err)
+            return
+        if response.status in (HTTPStatus.NOT_FOUND, HTTPStatus.METHOD_NOT_ALLOWED):
+            # Many servers only route POST here; the connection is open all the same.
+            _LOGGER.debug("%s answered the warm-up request with %d", endpoint.url, response.status)
+
+    async def async_probe_ejected(self) -> None:
+        """Probe the endpoints whose ejection has expired, the entry's own one
+        like those added later, and take back those that answer.
+        """
+        async def probe(endpoint: Endpoint) -> None:
+            try:
+                latency = await async_probe_endpoint(
+                    self._sessions[endpoint.url], endpoint.url, endpoint.api_key, endpoint.model
+                )
+            except HomeAssistantError as err:
+                _LOGGER.debug("Probe of endpoint %s failed: %s", endpoint.name, err)
+                self._balancer.report(endpoint, False)
+            else:
+                self._balancer.report(endpoint, True, latency)
+
+        due = [endpoint for endpoint in self._balancer.due_for_probe() if endpoint not in self._probing]
+        self._probing.update(due)
+        try:
+            await asyncio.gather(*(probe(endpoint) for endpoint in due))
+        finally:
+            self._probing.difference_update(due)
+
+    async def async_close(self, hass: HomeAssistant) -> None:
+        """Stop warming connections and release the shared sessions; each is
+        closed when the last engine using it goes away.
+        """
+        warming = list(self._warming.values())
+        for task in warming:
+            task.cancel()
+        await asyncio.gather(*warming, return_exceptions=True)
+        for url in self._sessions:
+            await async_release_session(hass, url)
 
     @staticmethod
     def get_supported_langs() -> list:
@@ -128,4 +331,31 @@ class OpenAISTTEngine:
             "et", "fi", "fr", "gl", "de", "el", "he", "hi", "hu", "is", "id", "it", "ja", "kn",
             "kk", "ko", "lv", "lt", "mk", "ms", "mr", "mi", "ne", "no", "fa", "pl", "pt", "ro",
             "ru", "sr", "sk", "sl", "es", "sw", "sv", "tl", "ta", "th", "tr", "uk", "ur", "vi", "cy"
-        ]
\ No newline at end of file
+        ]
+
+
+async def async_probe_endpoint(session: aiohttp.ClientSession, url: str, api_key: str | None,
+                               model: str) -> float:
+    """Transcribe a quarter second of silence on an endpoint and return the
+    seconds until the response. Raises HomeAssistantError if it doesn't work.
+    """
+    sample_rate = 16000
+    pcm = bytes(sample_rate // 2)
+    audio = AudioBuffer()
+    audio.append(b"RIFF" + struct.pack("<I", 36 + len(pcm)) + b"WAVEfmt "
+                 + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+                 + b"data" + struct.pack("<I", len(pcm)))
+    audio.append(pcm)
+    audio.finish()
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    boundary = f'----OpenAISTTBoundary{uuid.uuid4().hex}'
+    headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+    start = time.monotonic()
+    try:
+        async with session.post(url, data=_multipart_stream(boundary, {'model': model}, 'audio.wav', 'audio/wav', audio),
+                                headers=headers, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+            response.raise_for_status()
+            await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+        raise HomeAssistantError(f"Could not reach {url}: {err}") from err
+    return time.monotonic() - start
@@ -0,0 +1,233 @@
+"""
+PCM front end for OpenAI STT: bring raw audio into the format the models work with.
+"""
+from __future__ import annotations
+import math
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+# The transcription models work at 16 kHz mono; more only adds bytes to send
+# and for the server to decode.
+TARGET_SAMPLE_RATE = 16000
+# Zero crossings of the resampling filter on each side, its Kaiser window and
+# the cutoff as a fraction of the lower Nyquist frequency.
+FILTER_ZEROS = 8
+KAISER_BETA = 8.6
+ROLLOFF = 0.95
+# Size in a WAV header written before the length is known; decoders read such
+# a stream to its end.
+STREAMING_SIZE = 0xFFFFFFFF
+# Bytes of the start of a stream to search for the end of a WAV header.
+MAX_HEADER_SIZE = 4096
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_IEEE_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+@dataclass(frozen=True)
+class PCMFormat:
+    sample_rate: int
+    bits_per_sample: int = 16
+    channels: int = 1
+    is_float: bool = False
+
+
+def wav_header(pcm_format: PCMFormat, data_size: int | None = None) -> bytes:
+    """A WAV header for `data_size` bytes of audio, or for a stream of unknown length."""
+    block_align = pcm_format.channels * pcm_format.bits_per_sample // 8
+    tag = _WAVE_FORMAT_IEEE_FLOAT if pcm_format.is_float else _WAVE_FORMAT_PCM
+    return (b"RIFF" + struct.pack("<I", STREAMING_SIZE if data_size is None else 36 + data_size) + b"WAVEfmt "
+            + struct.pack("<IHHIIHH", 16, tag, pcm_format.channels, pcm_format.sample_rate,
+                          pcm_format.sample_rate * block_align, block_align, pcm_format.bits_per_sample)
+            + b"data" + struct.pack("<I", STREAMING_SIZE if data_size is None else data_size))
+
+
+def parse_wav_header(data: bytes) -> tuple[PCMFormat | None, int] | None:
+    """The format stated in a WAV header at the start of `data` and where the
+    audio starts, or None while `data` doesn't hold the whole header yet.
+    """
+    pcm_format = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size = struct.unpack_from("<I", data, offset + 4)[0]
+        if chunk_id == b"data":
+            return pcm_format, offset + 8
+        if chunk_id == b"fmt ":
+            if offset + 24 > len(data):
+                return None
+            tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, offset + 8)
+            if tag == _WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                if offset + 34 > len(data):
+                    return None
+                tag = struct.unpack_from("<H", data, offset + 32)[0]
+            pcm_format = PCMFormat(sample_rate, bits, channels, tag == _WAVE_FORMAT_IEEE_FLOAT)
+        offset += 8 + size + (size & 1)
+    return None
+
+
+def decode_pcm(data: bytes, pcm_format: PCMFormat) -> np.ndarray:
+    """Little-endian PCM as float32 in [-1, 1], one column per channel."""
+    bits = pcm_format.bits_per_sample
+    if pcm_format.is_float:
+        samples = np.frombuffer(data, "<f4" if bits == 32 else "<f8").astype(np.float32)
+    elif bits == 8:
+        samples = (np.frombuffer(data, np.uint8).astype(np.float32) - 128) / 128
+    elif bits == 16:
+        samples = np.frombuffer(data, "<i2").astype(np.float32) / 32768
+    elif bits == 24:
+        raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8).astype(np.float32) / 8388608
+    else:
+        samples = np.frombuffer(data, "<i4").astype(np.float32) / 2147483648
+    return samples.reshape(-1, pcm_format.channels)
+
+
+def encode_pcm16(samples: np.ndarray) -> bytes:
+    return np.clip(np.rint(samples * 32768), -32768, 32767).astype("<i2").tobytes()
+
+
+class PolyphaseResampler:
+    """Resample a stream of float samples by a rational factor.
+
+    Each output sample is a windowed-sinc interpolation of the input around
+    its position; with the rates reduced to up/down, the filter takes only
+    `up` distinct phases, which are computed once. Output is produced as soon
+    as the input ahead of it has arrived and continues seamlessly across
+    chunks.
+    """
+
+    def __init__(self, source_rate: int, target_rate: int):
+        divisor = math.gcd(source_rate, target_rate)
+        self._up = target_rate // divisor
+        self._down = source_rate // divisor
+        # The cutoff relative to the input's Nyquist frequency, below the
+        # output's when downsampling so nothing folds back.
+        cutoff = min(1.0, self._up / self._down) * ROLLOFF
+        width = FILTER_ZEROS / cutoff
+        self._half = math.ceil(width)
+        taps = np.arange(2 * self._half)
+        # Distance from each output position, by phase, to the input samples around it.
+        distance = np.arange(self._up)[:, None] / self._up + (self._half - 1) - taps[None, :]
+        window = np.i0(KAISER_BETA * np.sqrt(np.clip(1 - (distance / width) ** 2, 0, None))) / np.i0(KAISER_BETA)
+        kernel = np.sinc(cutoff * distance) * np.where(np.abs(distance) < width, window, 0)
+        self._kernel = (kernel / kernel.sum(axis=1, keepdims=True)).astype(np.float32)
+        self._taps = taps - (self._half - 1)
+        # Input still needed; `_offset` is the position of its first sample in
+        # the stream, negative for the silence before it.
+        self._history = np.zeros(self._half - 1, np.float32)
+        self._offset = 1 - self._half
+        self._received = 0
+        self._next = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        self._history = np.concatenate([self._history, samples.astype(np.float32, copy=False)])
+        self._received += len(samples)
+        return self._run(self._received)
+
+    def flush(self) -> np.ndarray:
+        """End of the stream: returns the output held back for lack of input after it."""
+        self._history = np.concatenate([self._history, np.zeros(self._half, np.float32)])
+        return self._run(self._received + self._half, -(-self._received * self._up // self._down))
+
+    def _run(self, available: int, limit: int | None = None) -> np.ndarray:
+        # The last output whose window of input has arrived.
+        stop = ((available - self._half) * self._up - 1) // self._down + 1
+        if limit is not None:
+            stop = min(stop, limit)
+        if stop <= self._next:
+            return np.zeros(0, np.float32)
+        positions = np.arange(self._next, stop, dtype=np.int64) * self._down
+        indices = (positions // self._up - self._offset)[:, None] + self._taps[None, :]
+        output = np.einsum("ij,ij->i", self._history[indices], self._kernel[positions % self._up])
+        self._next = stop
+        start = self._next * self._down // self._up - self._half + 1
+        self._history = self._history[start - self._offset:]
+        self._offset = start
+        return output
+
+
+class PCMNormalizer:
+    """Convert a stream of PCM chunks to 16-bit mono at `target_rate`.
+
+    Channels are averaged and the sample rate converted with a polyphase
+    filter, on whole chunks at once. A WAV header at the start of the stream
+    is dropped, and the format it states replaces the one given. Audio that
+    is in the target format already is passed through as it is.
+    """
+
+    def __init__(self, pcm_format: PCMFormat, target_rate: int = TARGET_SAMPLE_RATE):
+        self.output_format = PCMFormat(target_rate)
+        self._configure(pcm_format)
+        self._head = b""
+        self._header_checked = False
+        self._remainder = b""
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _configure(self, pcm_format: PCMFormat) -> None:
+        self._format = pcm_format
+        self._frame_bytes = pcm_format.channels * pcm_format.bits_per_sample // 8
+        self._passthrough = pcm_format == self.output_format
+        self._resampler = None
+        if pcm_format.sample_rate != self.output_format.sample_rate:
+            self._resampler = PolyphaseResampler(pcm_format.sample_rate, self.output_format.sample_rate)
+
+    def header(self) -> bytes:
+        """The WAV header for the output, to put before it."""
+        return wav_header(self.output_format)
+
+    def process(self, chunk: bytes) -> bytes:
+        """Feed a chunk; returns the converted audio so far."""
+        self.bytes_in += len(chunk)
+        if not self._header_checked:
+            data = self._head + chunk
+            if len(data) < 4 and b"RIFF".startswith(data):
+                self._head = data
+                return b""
+            if data[:4] == b"RIFF":
+                parsed = parse_wav_header(data)
+                if parsed is None and len(data) < MAX_HEADER_SIZE:
+                    self._head = data
+                    return b""
+                if parsed is not None:
+                    pcm_format, start = parsed
+                    if pcm_format is not None:
+                        self._configure(pcm_format)
+                    data = data[start:]
+            self._head = b""
+            self._header_checked = True
+            chunk = data
+        return self._convert(chunk)
+
+    def _convert(self, chunk: bytes) -> bytes:
+        if self._passthrough:
+            self.bytes_out += len(chunk)
+            return chunk
+        data = self._remainder + chunk if self._remainder else chunk
+        size = len(data) - len(data) % self._frame_bytes
+        self._remainder = bytes(data[size:])
+        if not size:
+            return b""
+        samples = decode_pcm(data[:size], self._format).mean(axis=1)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        output = encode_pcm16(samples)
+        self.bytes_out += len(output)
+        return output
+
+    def flush(self) -> bytes:
+        """End of the stream: returns the rest of the converted audio."""
+        output = b""
+        if not self._header_checked:
+            # Too short to hold a header, so it is all audio.
+            self._header_checked = True
+            output, self._head = self._convert(self._head), b""
+        if self._resampler is not None and not self._passthrough:
+            tail = encode_pcm16(self._resampler.flush())
+            self.bytes_out += len(tail)
+            output += tail
+        return output
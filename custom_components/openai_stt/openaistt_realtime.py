@@ -0,0 +1,177 @@
+"""
+Realtime (WebSocket) transcription for OpenAI STT.
+"""
+from __future__ import annotations
+import asyncio
+import base64
+import json
+import logging
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import aiohttp
+
+from homeassistant.exceptions import HomeAssistantError
+
+from .openaistt_audio import AudioBuffer, AudioStreamError
+from .openaistt_pcm import PCMFormat, PCMNormalizer
+
+_LOGGER = logging.getLogger(__name__)
+
+# The realtime API takes 16-bit mono PCM at 24 kHz.
+REALTIME_SAMPLE_RATE = 24000
+# Open sessions kept for the next utterances. The server ends a session after
+# 30 minutes, so older ones aren't reused.
+MAX_IDLE_SESSIONS = 2
+SESSION_MAX_AGE = 25 * 60
+CONNECT_TIMEOUT = 10
+
+
+@dataclass(eq=False)
+class _Session:
+    websocket: aiohttp.ClientWebSocketResponse
+    opened: float
+    configured: bool = False
+    language: str | None = None
+
+
+class RealtimeTranscriber:
+    """Transcribe over persistent WebSocket sessions with an
+    OpenAI-realtime-compatible transcription endpoint.
+
+    The audio is appended to the server's input buffer as it is recorded and
+    committed when the stream ends, so the transcript usually follows within
+    a fraction of a second. Sessions are kept open for the next utterances;
+    one session serves one utterance at a time. Interim transcripts are
+    passed to `on_partial` as they arrive.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, api_key: str | None, model: str):
+        self._session = session
+        self._url = url
+        self._api_key = api_key
+        self._model = model
+        self._idle: list[_Session] = []
+
+    async def _async_connect(self) -> _Session:
+        headers = {"OpenAI-Beta": "realtime=v1"}
+        if self._api_key:
+            headers["Authorization"] = f"Bearer {self._api_key}"
+        try:
+            async with asyncio.timeout(CONNECT_TIMEOUT):
+                websocket = await self._session.ws_connect(self._url, headers=headers, heartbeat=30)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            raise HomeAssistantError(f"Could not open a realtime session at {self._url}: {err}") from err
+        _LOGGER.debug("Opened realtime transcription session at %s", self._url)
+        return _Session(websocket, time.monotonic())
+
+    async def _async_acquire(self) -> _Session:
+        while self._idle:
+            session = self._idle.pop()
+            if not session.websocket.closed and time.monotonic() - session.opened < SESSION_MAX_AGE:
+                return session
+            await session.websocket.close()
+        return await self._async_connect()
+
+    async def async_transcribe(self, audio: AudioBuffer, sample_rate: int, language: str | None = None,
+                               on_partial: Callable[[str], None] | None = None) -> str:
+        """Stream `audio`, 16-bit mono PCM at `sample_rate`, and return the
+        transcript once the server has it. Raises HomeAssistantError if the
+        session fails; the audio can then still be replayed elsewhere.
+        """
+        session = await self._async_acquire()
+        reusable = False
+        try:
+            if not session.configured or session.language != language:
+                transcription = {"model": self._model}
+                if language:
+                    transcription["language"] = language
+                await session.websocket.send_json({
+                    "type": "transcription_session.update",
+                    "session": {
+                        "input_audio_format": "pcm16",
+                        "input_audio_transcription": transcription,
+                        # We commit ourselves when the stream ends.
+                        "turn_detection": None,
+                    },
+                })
+                session.configured = True
+                session.language = language
+            text = await self._async_exchange(session.websocket, audio, sample_rate, on_partial)
+            reusable = True
+            return text
+        except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as err:
+            raise HomeAssistantError(f"Realtime transcription failed: {err}") from err
+        finally:
+            if reusable and len(self._idle) < MAX_IDLE_SESSIONS:
+                self._idle.append(session)
+            else:
+                await session.websocket.close()
+
+    async def _async_send(self, websocket: aiohttp.ClientWebSocketResponse, audio: AudioBuffer,
+                          sample_rate: int) -> None:
+        resampler = PCMNormalizer(PCMFormat(sample_rate), REALTIME_SAMPLE_RATE)
+        try:
+            # Drop anything a previous, aborted utterance left in the buffer.
+            await websocket.send_json({"type": "input_audio_buffer.clear"})
+            async for chunk in audio:
+                await self._async_append(websocket, resampler.process(chunk))
+            await self._async_append(websocket, resampler.flush())
+            await websocket.send_json({"type": "input_audio_buffer.commit"})
+        except AudioStreamError:
+            # Stop the receiving side too; nothing will be committed.
+            await websocket.close()
+            raise
+
+    @staticmethod
+    async def _async_append(websocket: aiohttp.ClientWebSocketResponse, pcm: bytes) -> None:
+        if pcm:
+            await websocket.send_json({
+                "type": "input_audio_buffer.append",
+                "audio": base64.b64encode(pcm).decode("ascii"),
+            })
+
+    async def _async_exchange(self, websocket: aiohttp.ClientWebSocketResponse, audio: AudioBuffer,
+                              sample_rate: int, on_partial: Callable[[str], None] | None) -> str:
+        sender = asyncio.create_task(self._async_send(websocket, audio, sample_rate))
+        item_id = None
+        partial = ""
+        try:
+            async for message in websocket:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                event = json.loads(message.data)
+                kind = event.get("type")
+                if kind == "error":
+                    raise HomeAssistantError(f"Realtime transcription failed: {event.get('error', {}).get('message')}")
+                # Only the item this exchange committed counts; events about
+                # anything else (e.g. left over from an earlier utterance) don't.
+                ours = item_id is not None and event.get("item_id") == item_id
+                if kind == "input_audio_buffer.committed":
+                    item_id = event.get("item_id")
+                elif kind == "conversation.item.input_audio_transcription.delta" and ours:
+                    partial += event.get("delta", "")
+                    if on_partial is not None:
+                        on_partial(partial)
+                elif kind == "conversation.item.input_audio_transcription.completed" and ours:
+                    return event.get("transcript", "")
+                elif kind == "conversation.item.input_audio_transcription.failed":
+                    raise HomeAssistantError(
+                        f"Realtime transcription failed: {event.get('error', {}).get('message')}"
+                    )
+            if sender.done() and sender.exception() is not None:
+                raise sender.exception()
+            if audio.error is not None:
+                # The sender closed the session and may not have finished yet.
+                raise AudioStreamError("The audio stream failed") from audio.error
+            raise HomeAssistantError("Realtime session closed before the transcript arrived")
+        finally:
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    async def async_close(self) -> None:
+        """Close the idle sessions."""
+        idle, self._idle = self._idle, []
+        for session in idle:
+            await session.websocket.close()
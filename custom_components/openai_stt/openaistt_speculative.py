@@ -0,0 +1,89 @@
+"""
+Speculative transcription for OpenAI STT: transcribe at pauses, before the stream ends.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from homeassistant.exceptions import HomeAssistantError
+
+from .openaistt_audio import AudioBuffer, AudioStreamError
+from .openaistt_vad import PauseDetector
+
+_LOGGER = logging.getLogger(__name__)
+
+# Silence after speech at which the audio so far is sent.
+SPECULATIVE_PAUSE_MS = 300
+# Speech after that which makes the early transcript stale; a shorter blip (a
+# click, a breath) doesn't.
+MIN_NEW_SPEECH_MS = 100
+
+
+class SpeculativeTranscriber:
+    """Transcribe an utterance while the stream is still waiting to end.
+
+    Home Assistant ends a voice stream only after the speaker has been silent
+    for a while. When a pause starts, the audio recorded so far is sent as a
+    request of its own. If the stream then ends without further speech, that
+    transcript, in flight or already back, is the result, and the round trip
+    was hidden behind the wait for the end of speech. If the speaker goes on,
+    the early request is cancelled and, at the next pause, replaced; the full
+    audio is sent once the stream ends.
+
+    The stream is fed to `process`, before any silence is trimmed, so pauses
+    are seen as they happen. Requests are only sent while
+    `async_transcribe` runs.
+    """
+
+    def __init__(self, sample_rate: int, threshold_dbfs: float,
+                 transcribe: Callable[[AudioBuffer], Awaitable[str]]):
+        self._detector = PauseDetector(sample_rate, threshold_dbfs=threshold_dbfs)
+        self._transcribe = transcribe
+        self._audio: AudioBuffer | None = None
+        self._task: asyncio.Task | None = None
+        self._speech_ms = 0
+        self.sent = 0
+
+    def process(self, chunk: bytes) -> None:
+        """Feed PCM from the stream; the audio buffer must hold what came before it."""
+        self._detector.process(chunk)
+        self._update()
+
+    def _update(self) -> None:
+        if self._audio is None:
+            return
+        detector = self._detector
+        if self._task is not None and detector.speech_ms - self._speech_ms >= MIN_NEW_SPEECH_MS:
+            _LOGGER.debug("Speech went on, cancelling the speculative transcription")
+            self._task.cancel()
+            self._task = None
+        if self._task is None and detector.pause_ms >= SPECULATIVE_PAUSE_MS:
+            self._speech_ms = detector.speech_ms
+            self._task = asyncio.create_task(self._transcribe(self._audio.snapshot()))
+            self.sent += 1
+
+    async def async_transcribe(self, audio: AudioBuffer, transcribe_all: Callable[[], Awaitable[str]]) -> str:
+        """The transcript of `audio`: the speculative one if it still holds,
+        otherwise that of `transcribe_all` once the stream has ended.
+        """
+        self._audio = audio
+        try:
+            self._update()
+            await audio.wait_finished()
+            if self._task is not None and audio.error is None:
+                try:
+                    text = await self._task
+                    _LOGGER.debug("Using the speculative transcription (%d sent)", self.sent)
+                    return text
+                except AudioStreamError:
+                    raise
+                except HomeAssistantError as err:
+                    _LOGGER.warning("Speculative transcription failed: %s; sending the full audio", err)
+            return await transcribe_all()
+        finally:
+            self._audio = None
+            if self._task is not None:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+                self._task = None
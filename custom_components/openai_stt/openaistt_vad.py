@@ -0,0 +1,259 @@
+"""
+Voice activity detection for OpenAI STT: trim silence before it is uploaded,
+and find pauses to split long recordings at or to transcribe early.
+"""
+from __future__ import annotations
+import math
+from collections import deque
+
+import numpy as np
+
+FRAME_MS = 20
+# Speech kept around every stretch of speech, so word edges and quiet
+# consonants aren't cut off.
+PADDING_MS = 200
+DEFAULT_THRESHOLD_DBFS = -45.0
+# Spectral flatness above which a loud frame is taken for steady noise (a
+# fan, hum or hiss) rather than speech; voiced speech is well below this.
+MAX_FLATNESS = 0.5
+_EPSILON = 1e-10
+
+# Pauses a long recording is split at: the pause needed halfway to the target
+# length of a part, shrinking to a single frame at the target itself.
+SPLIT_PAUSE_MS = 600
+# A frame or run of frames: a buffer and the byte range in it.
+_Slice = tuple[memoryview, int, int]
+
+
+class _FrameClassifier:
+    """Cut a stream of PCM chunks into 20 ms frames and tell speech from
+    silence: a frame counts as speech when its level exceeds
+    `threshold_dbfs` and its spectrum isn't flat like noise. Both are
+    computed for all frames of a chunk at once.
+    """
+
+    def __init__(self, sample_rate: int, bits_per_sample: int, channels: int, threshold_dbfs: float):
+        if bits_per_sample not in (8, 16, 24, 32):
+            raise ValueError(f"Unsupported sample size: {bits_per_sample} bits")
+        self._bits = bits_per_sample
+        self._channels = channels
+        self._frame_samples = sample_rate * FRAME_MS // 1000
+        self._frame_bytes = self._frame_samples * channels * bits_per_sample // 8
+        self._threshold = threshold_dbfs
+        self._window = np.hanning(self._frame_samples).astype(np.float32)
+        self._remainder = b""
+
+    def _samples(self, data: memoryview, frames: int) -> np.ndarray:
+        """The frames in `data` as float32 in [-1, 1], mixed down to mono, one row per frame."""
+        size = frames * self._frame_bytes
+        if self._bits == 8:
+            samples = (np.frombuffer(data, np.uint8, size).astype(np.float32) - 128) / 128
+        elif self._bits == 16:
+            samples = np.frombuffer(data, "<i2", size // 2).astype(np.float32) / 32768
+        elif self._bits == 24:
+            raw = np.frombuffer(data, np.uint8, size).reshape(-1, 3).astype(np.int32)
+            samples = ((raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8).astype(np.float32) / 8388608
+        else:
+            samples = np.frombuffer(data, "<i4", size // 4).astype(np.float32) / 2147483648
+        return samples.reshape(frames, self._frame_samples, self._channels).mean(axis=2)
+
+    def _classify(self, data: memoryview, frames: int) -> np.ndarray:
+        samples = self._samples(data, frames)
+        level = 10 * np.log10(np.mean(samples * samples, axis=1) + _EPSILON)
+        power = np.abs(np.fft.rfft(samples * self._window, axis=1)) ** 2 + _EPSILON
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        return (level > self._threshold) & (flatness < MAX_FLATNESS)
+
+    def _frames(self, data: memoryview) -> tuple[memoryview, list[bool]]:
+        """`data` after the partial frame left from the previous chunk, and
+        whether each whole frame in it is speech. A partial frame at the end
+        is kept for the next chunk.
+        """
+        if self._remainder:
+            data = memoryview(self._remainder + data)
+        frames = len(data) // self._frame_bytes
+        self._remainder = bytes(data[frames * self._frame_bytes:])
+        if not frames:
+            return data, []
+        return data, self._classify(data, frames).tolist()
+
+
+class SilenceTrimmer(_FrameClassifier):
+    """Drop leading and trailing silence from a stream of PCM chunks and
+    optionally shorten long pauses.
+
+    Silence is held back until it is known whether speech follows, so the
+    output keeps flowing while the user talks and only the padding around
+    speech is delayed. With `max_pause_ms`, pauses longer than that are
+    shortened to it. The output is the input's own bytes, unconverted; a WAV
+    header at the start is passed through.
+    """
+
+    def __init__(self, sample_rate: int, bits_per_sample: int = 16, channels: int = 1,
+                 threshold_dbfs: float = DEFAULT_THRESHOLD_DBFS, max_pause_ms: int = 0):
+        super().__init__(sample_rate, bits_per_sample, channels, threshold_dbfs)
+        self._padding = PADDING_MS // FRAME_MS
+        self._max_pause = max(max_pause_ms // FRAME_MS, 2 * self._padding) if max_pause_ms else 0
+        self._started = False
+        # Silent frames before the first speech, and since the latest speech.
+        self._lead: deque[_Slice] = deque(maxlen=self._padding)
+        self._pause: list[_Slice] = []
+        self._header_checked = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def process(self, chunk: bytes) -> list[memoryview]:
+        """Feed a chunk; returns the audio that can be sent on so far."""
+        self.bytes_in += len(chunk)
+        output: list[_Slice] = []
+        data = memoryview(chunk)
+        if not self._header_checked:
+            self._header_checked = True
+            if data[:4] == b"RIFF" and (start := bytes(data[:128]).find(b"data", 12)) != -1:
+                output.append((data, 0, start + 8))
+                data = data[start + 8:]
+        data, speech = self._frames(data)
+        for index, is_speech in enumerate(speech):
+            frame = (data, index * self._frame_bytes, (index + 1) * self._frame_bytes)
+            if is_speech:
+                if not self._started:
+                    self._started = True
+                    output.extend(self._lead)
+                    self._lead.clear()
+                elif self._pause:
+                    output.extend(self._shorten(self._pause))
+                    self._pause = []
+                output.append(frame)
+            elif self._started:
+                self._pause.append(frame)
+            else:
+                self._lead.append(frame)
+        return self._emit(output)
+
+    def _shorten(self, pause: list[_Slice]) -> list[_Slice]:
+        if not self._max_pause or len(pause) <= self._max_pause:
+            return pause
+        half = self._max_pause // 2
+        return pause[:half] + pause[-half:]
+
+    def flush(self) -> list[memoryview]:
+        """End of the stream: returns the padding after the last speech."""
+        output = self._pause[:self._padding]
+        self._pause = []
+        self._lead.clear()
+        return self._emit(output)
+
+    def _emit(self, pieces: list[_Slice]) -> list[memoryview]:
+        """Slices as views, merging those adjacent in the same buffer so fewer, larger chunks are sent."""
+        merged: list[_Slice] = []
+        for piece in pieces:
+            if merged and merged[-1][0] is piece[0] and merged[-1][2] == piece[1]:
+                merged[-1] = (piece[0], merged[-1][1], piece[2])
+            else:
+                merged.append(piece)
+        views = [buffer[start:end] for buffer, start, end in merged]
+        self.bytes_out += sum(len(view) for view in views)
+        return views
+
+    @property
+    def speech_found(self) -> bool:
+        return self._started
+
+
+class PauseSplitter(_FrameClassifier):
+    """Split a stream of PCM chunks into parts of at most `part_seconds`,
+    cutting at pauses.
+
+    Past half the target length a part ends at the next pause of
+    SPLIT_PAUSE_MS; the closer it gets to the target, the shorter the pause
+    that will do, down to any silent frame, and at the target it is cut
+    regardless. Cuts are decided as the audio arrives, so each part can be
+    sent on while the next is still being recorded. The next part starts
+    with speech and the padding before it; silence after the last speech
+    isn't started as a part of its own. A WAV header at the start is dropped.
+    """
+
+    def __init__(self, sample_rate: int, part_seconds: float, bits_per_sample: int = 16, channels: int = 1,
+                 threshold_dbfs: float = DEFAULT_THRESHOLD_DBFS):
+        super().__init__(sample_rate, bits_per_sample, channels, threshold_dbfs)
+        self._max_frames = max(2, int(part_seconds * 1000) // FRAME_MS)
+        self._min_frames = self._max_frames // 2
+        self._pause_frames = SPLIT_PAUSE_MS // FRAME_MS
+        self._frames_in_part = 0
+        self._silent_frames = 0
+        # Silence since a cut, until speech starts the next part.
+        self._lead: deque[_Slice] | None = None
+        self._header_checked = False
+
+    def _pause_needed(self) -> int:
+        remaining = (self._max_frames - self._frames_in_part) / (self._max_frames - self._min_frames)
+        return 0 if remaining <= 0 else max(1, math.ceil(self._pause_frames * remaining))
+
+    def split(self, chunk: bytes) -> list[memoryview | None]:
+        """Feed a chunk; returns its audio in order, with None where a part ends."""
+        data = memoryview(chunk)
+        if not self._header_checked:
+            self._header_checked = True
+            if data[:4] == b"RIFF" and (start := bytes(data[:128]).find(b"data", 12)) != -1:
+                data = data[start + 8:]
+        data, speech = self._frames(data)
+        output: list[memoryview | None] = []
+        start = 0
+        for index, is_speech in enumerate(speech):
+            end = (index + 1) * self._frame_bytes
+            if self._lead is not None:
+                if not is_speech:
+                    self._lead.append((data, index * self._frame_bytes, end))
+                    start = end
+                    continue
+                output.extend(buffer[lead_start:lead_end] for buffer, lead_start, lead_end in self._lead)
+                self._frames_in_part = len(self._lead)
+                self._lead = None
+            self._frames_in_part += 1
+            self._silent_frames = 0 if is_speech else self._silent_frames + 1
+            if self._frames_in_part >= self._min_frames and self._silent_frames >= self._pause_needed():
+                output.append(data[start:end])
+                output.append(None)
+                start = end
+                self._frames_in_part = 0
+                self._silent_frames = 0
+                self._lead = deque(maxlen=PADDING_MS // FRAME_MS)
+        if start < len(speech) * self._frame_bytes:
+            output.append(data[start:len(speech) * self._frame_bytes])
+        return output
+
+    def flush(self) -> memoryview:
+        """End of the stream: returns the partial frame left at the end of the last part."""
+        remainder, self._remainder = self._remainder, b""
+        return memoryview(b"" if self._lead is not None else remainder)
+
+
+class PauseDetector(_FrameClassifier):
+    """Follow a stream of PCM chunks and tell how much speech there has been
+    and how long the speaker has been silent since.
+    """
+
+    def __init__(self, sample_rate: int, bits_per_sample: int = 16, channels: int = 1,
+                 threshold_dbfs: float = DEFAULT_THRESHOLD_DBFS):
+        super().__init__(sample_rate, bits_per_sample, channels, threshold_dbfs)
+        self._speech_frames = 0
+        self._silent_frames = 0
+
+    def process(self, chunk: bytes) -> None:
+        _, speech = self._frames(memoryview(chunk))
+        if not speech:
+            return
+        if True in speech:
+            self._speech_frames += speech.count(True)
+            self._silent_frames = speech[::-1].index(True)
+        else:
+            self._silent_frames += len(speech)
+
+    @property
+    def speech_ms(self) -> int:
+        return self._speech_frames * FRAME_MS
+
+    @property
+    def pause_ms(self) -> int:
+        """Silence since the latest speech; 0 before any speech."""
+        return self._silent_frames * FRAME_MS if self._speech_frames else 0
@@ -1,8 +1,13 @@
 """
 Support for OpenAI STT as a separate component.
 """
+import asyncio
+import functools
 import logging
-import async_timeout
+import math
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
 from homeassistant.components.stt import (
     AudioBitRates,
     AudioChannels,
@@ -15,54 +20,168 @@ from homeassistant.components.stt import (
     SpeechResultState,
 )
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import chat_session, http
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_time_interval
 
 from .const import (
     CONF_API_KEY,
+    CONF_ENDPOINTS,
+    CONF_HEDGE_PERCENTILE,
+    CONF_LONG_FORM,
+    CONF_LONG_FORM_PART_SECONDS,
+    CONF_MAX_CONCURRENCY,
+    CONF_PROBE_LATENCY,
+    CONF_REALTIME,
+    CONF_REALTIME_URL,
+    CONF_SPECULATIVE,
     CONF_STT_MODEL,
     CONF_STT_LANGUAGE,
     CONF_STT_RESPONSE_FORMAT,
+    CONF_TIMEOUT,
+    CONF_UPLINK_KBPS,
+    CONF_UPLOAD_FORMAT,
     CONF_URL,
+    CONF_VAD,
+    CONF_VAD_MAX_PAUSE,
+    CONF_VAD_THRESHOLD,
+    DEFAULT_HEDGE_PERCENTILE,
+    DEFAULT_LONG_FORM,
+    DEFAULT_LONG_FORM_PART_SECONDS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_REALTIME,
+    DEFAULT_SPECULATIVE,
     DEFAULT_STT_MODEL,
     DEFAULT_STT_LANGUAGE,
     DEFAULT_STT_RESPONSE_FORMAT,
+    DEFAULT_TIMEOUT,
+    DEFAULT_UPLINK_KBPS,
+    DEFAULT_UPLOAD_FORMAT,
+    DEFAULT_VAD,
+    DEFAULT_VAD_MAX_PAUSE,
+    DEFAULT_VAD_THRESHOLD,
+    EVENT_PARTIAL_TRANSCRIPTION,
+    EVENT_TRANSCRIPTION,
+    LONG_FORM_CONCURRENCY,
+    LONG_FORM_PROMPT_CHARS,
+    OPENAI_REALTIME_URL,
     OPENAI_STT_URL,
+    UPLOAD_FORMAT_AUTO,
 )
-from .openaistt_engine import OpenAISTTEngine
+from .openaistt_audio import AudioBuffer, AudioStreamError, UploadEncoder
+from .openaistt_balancer import PROBE_INTERVAL, Endpoint, EndpointBalancer
+from .openaistt_codec import (
+    DECISION_SECONDS,
+    PASSTHROUGH_TYPES,
+    UPLOAD_FORMATS,
+    WAV,
+    UploadFormat,
+    choose_format,
+    uplink_keeps_up,
+)
+from .openaistt_dispatcher import DeadlineExceeded, DispatchStats, STTDispatcher
+from .openaistt_engine import OpenAISTTEngine, async_acquire_session
+from .openaistt_pcm import TARGET_SAMPLE_RATE, PCMFormat, PCMNormalizer, wav_header
+from .openaistt_realtime import RealtimeTranscriber
+from .openaistt_speculative import SpeculativeTranscriber
+from .openaistt_vad import PauseSplitter, SilenceTrimmer
+from .openaistt_retry import LatencyTracker
 
 _LOGGER = logging.getLogger(__name__)
 
+
+def _upload_sample_rate(metadata: SpeechMetadata) -> int:
+    """The rate raw PCM is sent at: 16 kHz, or lower if it was recorded at less."""
+    return min(int(metadata.sample_rate), TARGET_SAMPLE_RATE)
+
+
+def _request_source() -> str | None:
+    """Best available identity of the client a transcription is for.
+    The provider isn't told which device is speaking, so HTTP clients (the
+    STT API, a browser) are told apart by address and voice satellites by
+    their conversation.
+    """
+    if (request := http.current_request.get()) is not None and request.remote:
+        return request.remote
+    if (session := chat_session.current_session.get()) is not None:
+        return session.conversation_id
+    return None
+
+
 async def async_setup_entry(
     hass: HomeAssistant, 
     config_entry: ConfigEntry, 
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     """Set up OpenAI STT platform from a config entry."""
-    api_key = config_entry.data.get(CONF_API_KEY)
-    model = config_entry.data.get(CONF_STT_MODEL, DEFAULT_STT_MODEL)
     language = config_entry.data.get(CONF_STT_LANGUAGE, DEFAULT_STT_LANGUAGE)
     response_format = config_entry.data.get(CONF_STT_RESPONSE_FORMAT, DEFAULT_STT_RESPONSE_FORMAT)
-    url = config_entry.data.get(CONF_URL, OPENAI_STT_URL)
-    
+    hedge_percentile = config_entry.options.get(CONF_HEDGE_PERCENTILE, DEFAULT_HEDGE_PERCENTILE)
+
+    # The endpoint the entry was created with, followed by those added in the options.
+    configured = [config_entry.data, *config_entry.options.get(CONF_ENDPOINTS, [])]
+    endpoints = [
+        Endpoint(
+            url=config.get(CONF_URL, OPENAI_STT_URL),
+            api_key=config.get(CONF_API_KEY),
+            model=config.get(CONF_STT_MODEL, DEFAULT_STT_MODEL),
+            latency=LatencyTracker(hedge_percentile),
+            average_latency=config.get(CONF_PROBE_LATENCY),
+        )
+        for config in configured
+    ]
+
     engine = OpenAISTTEngine(
-        api_key=api_key,
-        model=model,
+        EndpointBalancer(endpoints),
+        {url: async_acquire_session(hass, url) for url in {endpoint.url for endpoint in endpoints}},
         language=language,
-        url=url,
-        response_format=response_format
+        response_format=response_format,
     )
+    config_entry.async_on_unload(functools.partial(engine.async_close, hass))
+
+    async def probe_ejected(now: datetime) -> None:
+        await engine.async_probe_ejected()
+
+    config_entry.async_on_unload(
+        async_track_time_interval(hass, probe_ejected, timedelta(seconds=PROBE_INTERVAL))
+    )
+
+    realtime = None
+    if config_entry.options.get(CONF_REALTIME, DEFAULT_REALTIME):
+        # Realtime sessions use the endpoint the entry was created with.
+        realtime = RealtimeTranscriber(
+            async_get_clientsession(hass),
+            config_entry.options.get(CONF_REALTIME_URL) or OPENAI_REALTIME_URL,
+            config_entry.data.get(CONF_API_KEY),
+            config_entry.data.get(CONF_STT_MODEL, DEFAULT_STT_MODEL),
+        )
+        config_entry.async_on_unload(realtime.async_close)
     
-    async_add_entities([OpenAISTTProvider(hass, config_entry, engine)])
+    dispatcher = STTDispatcher(config_entry.options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY))
+    async_add_entities([OpenAISTTProvider(hass, config_entry, engine, dispatcher, realtime)])
 
 class OpenAISTTProvider(Provider):
     """The OpenAI STT API provider."""
 
-    def __init__(self, hass, config_entry, engine):
+    def __init__(self, hass, config_entry, engine, dispatcher=None, realtime=None):
         """Initialize OpenAI STT provider."""
         self.hass = hass
         self._config_entry = config_entry
         self._engine = engine
+        self._dispatcher = dispatcher or STTDispatcher(DEFAULT_MAX_CONCURRENCY)
+        self._realtime = realtime
+        self._vad = config_entry.options.get(CONF_VAD, DEFAULT_VAD)
+        self._vad_threshold = config_entry.options.get(CONF_VAD_THRESHOLD, DEFAULT_VAD_THRESHOLD)
+        self._vad_max_pause = int(config_entry.options.get(CONF_VAD_MAX_PAUSE, DEFAULT_VAD_MAX_PAUSE))
+        self._upload_format = config_entry.options.get(CONF_UPLOAD_FORMAT, DEFAULT_UPLOAD_FORMAT)
+        self._uplink_kbps = config_entry.options.get(CONF_UPLINK_KBPS, DEFAULT_UPLINK_KBPS)
+        self._long_form = config_entry.options.get(CONF_LONG_FORM, DEFAULT_LONG_FORM)
+        self._part_seconds = config_entry.options.get(CONF_LONG_FORM_PART_SECONDS, DEFAULT_LONG_FORM_PART_SECONDS)
+        self._speculative = config_entry.options.get(CONF_SPECULATIVE, DEFAULT_SPECULATIVE)
+        self._timeout = config_entry.options.get(CONF_TIMEOUT, DEFAULT_TIMEOUT)
         self._attr_unique_id = f"{config_entry.entry_id}_stt"
         model_name = self._engine._model.split("-")[-1]
         self._attr_name = f"OpenAI {model_name}"
@@ -82,8 +201,6 @@ class OpenAISTTProvider(Provider):
         """Return a list of supported formats."""
         return [
             AudioFormats.WAV,
-            AudioFormats.MP3,
-            AudioFormats.MP4,
             AudioFormats.OGG,
         ]
 
@@ -92,7 +209,6 @@ class OpenAISTTProvider(Provider):
         """Return a list of supported codecs."""
         return [
             AudioCodecs.PCM,
-            AudioCodecs.MP3,
             AudioCodecs.OPUS,
         ]
 
@@ -103,18 +219,14 @@ class OpenAISTTProvider(Provider):
             AudioBitRates.BITRATE_8,
             AudioBitRates.BITRATE_16,
             AudioBitRates.BITRATE_24,
+            AudioBitRates.BITRATE_32,
         ]
 
     @property
     def supported_sample_rates(self) -> list[AudioSampleRates]:
         """Return a list of supported samplerates."""
-        return [
-            AudioSampleRates.SAMPLERATE_8000,
-            AudioSampleRates.SAMPLERATE_16000,
-            AudioSampleRates.SAMPLERATE_24000,
-            AudioSampleRates.SAMPLERATE_44100,
-            AudioSampleRates.SAMPLERATE_48000,
-        ]
+        # Raw PCM is resampled to at most 16 kHz, from any rate.
+        return list(AudioSampleRates)
 
     @property
     def supported_channels(self) -> list[AudioChannels]:
@@ -134,29 +246,286 @@ class OpenAISTTProvider(Provider):
             self._engine._model,
         )
         
-        # Collect audio data from the stream
-        audio_data = b""
-        async for chunk in stream:
-            audio_data += chunk
-        
+        source = _request_source()
+        # Have a connection ready by the time the upload starts (and for the
+        # upload should the realtime session fail).
+        self._engine.warm()
+
         # If a language is specified in metadata, use it
         language = metadata.language if metadata.language else self._engine._language
+
+        # The upload starts with the first chunk and follows the stream, so the
+        # API receives the audio while the user is still talking. The time
+        # budget starts once they have stopped; time spent waiting for a free
+        # slot counts against it.
+        deadline = math.inf
+
+        # Raw PCM is sent as 16-bit mono WAV at no more than 16 kHz, what the
+        # models work with; compressed audio is sent as it is, under its own type.
+        normalizer = trimmer = None
+        if metadata.codec == AudioCodecs.PCM:
+            normalizer = PCMNormalizer(
+                PCMFormat(int(metadata.sample_rate), int(metadata.bit_rate), int(metadata.channel)),
+                _upload_sample_rate(metadata),
+            )
+            audio = AudioBuffer()
+            audio.append(normalizer.header())
+            if self._vad:
+                trimmer = SilenceTrimmer(_upload_sample_rate(metadata), threshold_dbfs=self._vad_threshold,
+                                         max_pause_ms=self._vad_max_pause)
+        elif metadata.format.value in PASSTHROUGH_TYPES:
+            audio = AudioBuffer(*PASSTHROUGH_TYPES[metadata.format.value])
+        else:
+            audio = AudioBuffer()
+
+        speculation = None
+        if self._speculative and normalizer is not None and not self._long_form and self._realtime is None:
+            speculation = SpeculativeTranscriber(
+                _upload_sample_rate(metadata), self._vad_threshold,
+                lambda snapshot: self._async_upload(snapshot, metadata, language),
+            )
         
+        stats = DispatchStats()
+        state = "error"
         try:
-            async with async_timeout.timeout(30):
-                # Process the audio with the OpenAI STT engine
-                def process_job():
-                    return self._engine.process_audio(audio_data, language)
-                
-                text = await self.hass.async_add_executor_job(process_job)
+            async with asyncio.timeout(None) as budget:
+                def add(chunk):
+                    if trimmer is None:
+                        audio.append(chunk)
+                    else:
+                        for piece in trimmer.process(chunk):
+                            audio.append(piece)
+                    if speculation is not None:
+                        speculation.process(chunk)
+
+                async def collect():
+                    nonlocal deadline, state
+                    loop = asyncio.get_running_loop()
+                    try:
+                        async for chunk in stream:
+                            add(chunk if normalizer is None else normalizer.process(chunk))
+                    except Exception as err:
+                        # The upload fails with the stream; don't wait for a slot either.
+                        _LOGGER.error("Audio stream failed: %s", err)
+                        audio.finish(err)
+                        budget.reschedule(loop.time())
+                        return
+                    if normalizer is not None:
+                        add(normalizer.flush())
+                        _LOGGER.debug("Normalized %d bytes of audio to %d", normalizer.bytes_in, normalizer.bytes_out)
+                    if trimmer is not None:
+                        for piece in trimmer.flush():
+                            audio.append(piece)
+                        _LOGGER.debug("Trimmed %d of %d bytes of silence", trimmer.bytes_in - trimmer.bytes_out,
+                                      trimmer.bytes_in)
+                        if not trimmer.speech_found:
+                            # Don't pay for transcribing silence.
+                            state = "no_speech"
+                            _LOGGER.debug("No speech detected, not transcribing")
+                            audio.finish(HomeAssistantError("No speech detected"))
+                            budget.reschedule(loop.time())
+                            return
+                    audio.finish()
+                    deadline = time.monotonic() + self._timeout
+                    budget.reschedule(loop.time() + self._timeout)
+
+                if self._long_form and normalizer is not None:
+                    job = None
+                elif self._realtime is not None and normalizer is not None:
+                    def job():
+                        return self._async_transcribe_realtime(audio, metadata, language, source)
+                elif speculation is not None:
+                    def job():
+                        return speculation.async_transcribe(
+                            audio, lambda: self._async_upload(audio, metadata, language)
+                        )
+                else:
+                    def job():
+                        # Process the audio with the OpenAI STT engine
+                        return self._async_upload(audio, metadata, language)
+
+                collector = asyncio.create_task(collect())
+                try:
+                    if job is None:
+                        # Every part takes a slot of its own.
+                        text = await self._async_transcribe_long(
+                            audio, metadata, language, source, lambda: deadline, stats
+                        )
+                    else:
+                        text = await self._dispatcher.async_run(
+                            source, lambda: deadline, job, stats, lambda: audio.finished_at
+                        )
+                finally:
+                    collector.cancel()
                 
                 if text:
+                    state = "success"
                     return SpeechResult(
                         text,
                         SpeechResultState.SUCCESS,
                     )
                 return SpeechResult("", SpeechResultState.ERROR)
                 
+        except DeadlineExceeded as err:
+            state = "dropped"
+            _LOGGER.warning("Dropped transcription: %s", err)
+            return SpeechResult("", SpeechResultState.ERROR)
+        except AudioStreamError:
+            # Already logged when the stream ended.
+            return SpeechResult("", SpeechResultState.ERROR)
+        except TimeoutError:
+            if audio.error is None:
+                _LOGGER.error("Transcription timed out after %d s", self._timeout)
+            return SpeechResult("", SpeechResultState.ERROR)
         except Exception as err:
             _LOGGER.error("Error processing audio: %s", err)
-            return SpeechResult("", SpeechResultState.ERROR)
\ No newline at end of file
+            return SpeechResult("", SpeechResultState.ERROR)
+        finally:
+            _LOGGER.debug(
+                "Transcription %s after %.2f s in the queue (%d more waiting, %d bytes of audio)",
+                state, stats.queue_delay, self._dispatcher.queued(), audio.size,
+            )
+            self.hass.bus.async_fire(EVENT_TRANSCRIPTION, {
+                "provider": self._attr_unique_id,
+                "source": source,
+                "state": state,
+                "queue_delay": round(stats.queue_delay, 3),
+                "service_time": round(stats.service_time, 3) if stats.service_time is not None else None,
+            })
+
+    async def _async_upload_format(self, audio: AudioBuffer, metadata: SpeechMetadata) -> UploadFormat:
+        """The format to upload the audio in. Choosing one automatically
+        sends PCM right away if the uplink keeps up with it; otherwise it waits
+        for the first second of audio, to leave out utterances too short for
+        compression to pay off.
+        """
+        if metadata.codec != AudioCodecs.PCM:
+            return WAV
+        if self._upload_format != UPLOAD_FORMAT_AUTO:
+            return UPLOAD_FORMATS[self._upload_format]
+        bytes_per_second = _upload_sample_rate(metadata) * 2
+        if uplink_keeps_up(bytes_per_second, self._uplink_kbps):
+            return WAV
+        await audio.wait_size(int(DECISION_SECONDS * bytes_per_second))
+        upload_format = choose_format(audio.size / bytes_per_second, bytes_per_second, self._uplink_kbps)
+        _LOGGER.debug("Uploading as %s at %d kbit/s", upload_format.name, self._uplink_kbps)
+        return upload_format
+
+    async def _async_upload(self, audio: AudioBuffer, metadata: SpeechMetadata, language: str | None,
+                            prompt: str | None = None) -> str:
+        """Transcribe by uploading the audio, compressed on the way if configured."""
+        upload_format = await self._async_upload_format(audio, metadata)
+        if upload_format is WAV:
+            return await self._engine.async_transcribe(audio, language, prompt)
+        encoder = UploadEncoder(upload_format)
+        try:
+            try:
+                upload = await encoder.async_start(audio)
+            except HomeAssistantError as err:
+                _LOGGER.warning("%s; uploading uncompressed audio", err)
+                upload = audio
+            text = await self._engine.async_transcribe(upload, language, prompt)
+            _LOGGER.debug("Uploaded %d bytes of %s for %d bytes of audio", upload.size, upload.content_type, audio.size)
+            return text
+        finally:
+            await encoder.async_close()
+
+    async def _async_transcribe_long(self, audio: AudioBuffer, metadata: SpeechMetadata, language: str | None,
+                                     source: str | None, deadline: Callable[[], float],
+                                     stats: DispatchStats) -> str:
+        """Split the audio at pauses into parts and transcribe them concurrently.
+
+        A part is uploaded as it is recorded, like any other audio, and at most
+        LONG_FORM_CONCURRENCY are sent at once. Each part is a request of its
+        own to the dispatcher, so it counts against the concurrency cap and
+        takes turns with other sources. Each one is given the end of the text
+        before it as a prompt if that arrives before the part is complete, so
+        a live recording keeps its context while a file that arrives at once
+        is transcribed in parallel. The texts are joined in order; `stats`
+        gets the parts' total time in the queue and the time from the end of
+        the recording to the result.
+        """
+        sample_rate = _upload_sample_rate(metadata)
+        splitter = PauseSplitter(sample_rate, self._part_seconds, threshold_dbfs=self._vad_threshold)
+        semaphore = asyncio.Semaphore(LONG_FORM_CONCURRENCY)
+        parts: list[asyncio.Task] = []
+        if source is None:
+            # The parts still queue as one client.
+            source = self._dispatcher.new_source()
+
+        async def transcribe(part: AudioBuffer, previous: asyncio.Task | None) -> str:
+            prompt = None
+            if previous is not None:
+                finished = asyncio.ensure_future(part.wait_finished())
+                try:
+                    await asyncio.wait((previous, finished), return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    finished.cancel()
+                if previous.done() and not previous.cancelled() and previous.exception() is None:
+                    prompt = previous.result()[-LONG_FORM_PROMPT_CHARS:] or None
+            part_stats = DispatchStats()
+            try:
+                async with semaphore:
+                    return await self._dispatcher.async_run(
+                        source, deadline, lambda: self._async_upload(part, metadata, language, prompt),
+                        part_stats, lambda: part.finished_at,
+                    )
+            finally:
+                stats.queue_delay += part_stats.queue_delay
+
+        def start_part() -> AudioBuffer:
+            part = AudioBuffer()
+            part.append(wav_header(PCMFormat(sample_rate)))
+            parts.append(asyncio.create_task(transcribe(part, parts[-1] if parts else None)))
+            return part
+
+        part = None
+        try:
+            try:
+                async for chunk in audio:
+                    for piece in splitter.split(chunk):
+                        if piece is None:
+                            part.finish()
+                            part = None
+                            # The next part starts with the next speech, while
+                            # this one's upload still holds its connection.
+                            self._engine.warm()
+                        elif piece:
+                            if part is None:
+                                part = start_part()
+                            part.append(piece)
+            except AudioStreamError as err:
+                if part is not None:
+                    part.finish(err.__cause__ or err)
+                raise
+            if part is not None:
+                part.append(splitter.flush())
+                part.finish()
+            texts = await asyncio.gather(*parts)
+            stats.service_time = time.monotonic() - (audio.finished_at or time.monotonic())
+        finally:
+            for task in parts:
+                task.cancel()
+            await asyncio.gather(*parts, return_exceptions=True)
+        _LOGGER.debug("Transcribed %d bytes of audio in %d parts", audio.size, len(parts))
+        return " ".join(text.strip() for text in texts if text.strip())
+
+    async def _async_transcribe_realtime(self, audio: AudioBuffer, metadata: SpeechMetadata, language: str | None,
+                                         source: str | None) -> str:
+        """Transcribe over the realtime session, falling back to an upload if it fails."""
+        def on_partial(text: str) -> None:
+            _LOGGER.debug("Partial transcript from %s: %s", source, text)
+            self.hass.bus.async_fire(EVENT_PARTIAL_TRANSCRIPTION, {
+                "provider": self._attr_unique_id,
+                "source": source,
+                "text": text,
+            })
+
+        try:
+            return await self._realtime.async_transcribe(audio, _upload_sample_rate(metadata), language, on_partial)
+        except AudioStreamError:
+            raise
+        except HomeAssistantError as err:
+            # The audio is still buffered, so it can be sent the usual way.
+            _LOGGER.warning("%s; uploading the audio instead", err)
+            return await self._async_upload(audio, metadata, language)
\ No newline at end of file
@@ -1,18 +1,125 @@
 """Custom integration for OpenAI TTS."""
 from __future__ import annotations
 
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
 from homeassistant.const import Platform
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import (
+    CONF_API_KEY,
+    CONF_CACHE_SIZE,
+    CONF_ENDPOINTS,
+    CONF_HEDGE_PERCENTILE,
+    CONF_MAX_REQUESTS,
+    CONF_MODEL,
+    CONF_PROBE_LATENCY,
+    CONF_RATE_LIMIT,
+    CONF_SPEED,
+    CONF_URL,
+    CONF_VOICE,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_HEDGE_PERCENTILE,
+    DEFAULT_MAX_REQUESTS,
+    DEFAULT_RATE_LIMIT,
+    DOMAIN,
+)
+from .openaitts_balancer import PROBE_INTERVAL, Endpoint, EndpointBalancer
+from .openaitts_cache import INDEX_SAVE_INTERVAL, OpenAITTSCache
+from .openaitts_engine import OpenAITTSEngine, async_acquire_session
+from .openaitts_ffmpeg import FFmpegPool
+from .openaitts_retry import LatencyTracker
+from .openaitts_scheduler import RequestScheduler
 
 # Define the platforms to be loaded
 PLATFORMS: list[str] = [Platform.TTS]
 
+
+@dataclass
+class OpenAITTSData:
+    """Objects shared by the platforms of a config entry."""
+    engine: OpenAITTSEngine
+    cache: OpenAITTSCache | None
+    ffmpeg: FFmpegPool
+    scheduler: RequestScheduler
+
+
+def _cache_dir(hass: HomeAssistant, entry: ConfigEntry) -> str:
+    return hass.config.path(f"{DOMAIN}_cache", entry.entry_id)
+
+
+def _endpoints(entry: ConfigEntry) -> list[Endpoint]:
+    """The endpoint the entry was created with, followed by those added in the options."""
+    hedge_percentile = entry.options.get(CONF_HEDGE_PERCENTILE, DEFAULT_HEDGE_PERCENTILE)
+    configured = [entry.data, *entry.options.get(CONF_ENDPOINTS, [])]
+    return [
+        Endpoint(
+            url=config[CONF_URL],
+            api_key=config.get(CONF_API_KEY),
+            model=config.get(CONF_MODEL, entry.data[CONF_MODEL]),
+            latency=LatencyTracker(hedge_percentile),
+            average_latency=config.get(CONF_PROBE_LATENCY),
+        )
+        for config in configured
+    ]
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up entities."""
+    endpoints = _endpoints(entry)
+    scheduler = RequestScheduler(
+        entry.options.get(CONF_MAX_REQUESTS, DEFAULT_MAX_REQUESTS),
+        entry.options.get(CONF_RATE_LIMIT, DEFAULT_RATE_LIMIT),
+    )
+    engine = OpenAITTSEngine(
+        entry.data[CONF_VOICE],
+        entry.data.get(CONF_SPEED, 1.0),
+        EndpointBalancer(endpoints),
+        {url: async_acquire_session(hass, url) for url in {endpoint.url for endpoint in endpoints}},
+        scheduler,
+    )
+
+    async def probe_ejected(now: datetime) -> None:
+        await engine.async_probe_ejected(hass)
+
+    entry.async_on_unload(async_track_time_interval(hass, probe_ejected, timedelta(seconds=PROBE_INTERVAL)))
+    cache = None
+    cache_size = entry.options.get(CONF_CACHE_SIZE, entry.data.get(CONF_CACHE_SIZE, DEFAULT_CACHE_SIZE))
+    if cache_size:
+        cache = OpenAITTSCache(_cache_dir(hass, entry), int(cache_size * 1024 * 1024))
+        await hass.async_add_executor_job(cache.load)
+
+        async def flush_cache(now: datetime) -> None:
+            await hass.async_add_executor_job(cache.flush)
+
+        # Index changes are batched; write what is pending now and then.
+        entry.async_on_unload(
+            async_track_time_interval(hass, flush_cache, timedelta(seconds=INDEX_SAVE_INTERVAL))
+        )
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = OpenAITTSData(engine, cache, FFmpegPool(hass), scheduler)
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     return True
 
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the entry so changed options (e.g. the cache size) take effect."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
-    return await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
\ No newline at end of file
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        data: OpenAITTSData = hass.data[DOMAIN].pop(entry.entry_id)
+        if data.cache is not None:
+            await hass.async_add_executor_job(data.cache.flush)
+        await data.engine.async_close(hass)
+        await hass.async_add_executor_job(data.ffmpeg.close)
+    return unload_ok
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Delete the audio cache of a removed entry."""
+    await hass.async_add_executor_job(shutil.rmtree, _cache_dir(hass, entry), True)
@@ -32,7 +32,28 @@ from .const import (
     CONF_CHIME_ENABLE,    # Use constant for chime enable toggle
     CONF_CHIME_SOUND,
     CONF_NORMALIZE_AUDIO,
+    CONF_NORMALIZE_ENGINE,
+    NORMALIZE_ENGINE_FFMPEG,
+    NORMALIZE_ENGINES,
     CONF_INSTRUCTIONS,
+    CONF_AUDIO_FORMAT,
+    AUDIO_FORMATS,
+    DEFAULT_AUDIO_FORMAT,
+    CONF_MAX_CONCURRENCY,
+    DEFAULT_MAX_CONCURRENCY,
+    CONF_CACHE_SIZE,
+    DEFAULT_CACHE_SIZE,
+    CONF_PREWARM_PHRASES,
+    CONF_LOCAL_SPEED,
+    CONF_HEDGE_PERCENTILE,
+    DEFAULT_HEDGE_PERCENTILE,
+    CONF_MAX_REQUESTS,
+    DEFAULT_MAX_REQUESTS,
+    CONF_RATE_LIMIT,
+    DEFAULT_RATE_LIMIT,
+    CONF_ENDPOINTS,
+    CONF_ADD_ENDPOINT,
+    CONF_PROBE_LATENCY,
     # STT constants
     CONF_STT_MODEL,
     CONF_STT_LANGUAGE,
@@ -43,6 +64,7 @@ from .const import (
     STT_MODELS,
     STT_RESPONSE_FORMATS,
 )
+from .openaitts_engine import async_probe_endpoint
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -144,8 +166,18 @@ class OpenAITTSConfigFlow(ConfigFlow, domain=DOMAIN):
 
 class OpenAITTSOptionsFlow(OptionsFlow):
     """Handle options flow for OpenAI TTS."""
+    def __init__(self):
+        self._options: dict[str, Any] = {}
+
     async def async_step_init(self, user_input: dict | None = None):
+        endpoints = self.config_entry.options.get(CONF_ENDPOINTS, [])
         if user_input is not None:
+            # Endpoints are listed by index; unticking one removes it.
+            kept = user_input.pop(CONF_ENDPOINTS, [str(index) for index in range(len(endpoints))])
+            user_input[CONF_ENDPOINTS] = [endpoints[int(index)] for index in kept]
+            if user_input.pop(CONF_ADD_ENDPOINT, False):
+                self._options = user_input
+                return await self.async_step_endpoint()
             return self.async_create_entry(title="", data=user_input)
         # Retrieve chime options using the executor to avoid blocking the event loop.
         chime_options = await self.hass.async_add_executor_job(get_chime_options)
@@ -201,6 +233,166 @@ class OpenAITTSOptionsFlow(OptionsFlow):
             vol.Optional(
                 CONF_NORMALIZE_AUDIO,
                 default=self.config_entry.options.get(CONF_NORMALIZE_AUDIO, self.config_entry.data.get(CONF_NORMALIZE_AUDIO, False))
-            ): selector({"boolean": {}})
+            ): selector({"boolean": {}}),
+
+            # ffmpeg's loudnorm filter, or the in-process NumPy implementation.
+            vol.Optional(
+                CONF_NORMALIZE_ENGINE,
+                default=self.config_entry.options.get(CONF_NORMALIZE_ENGINE, self.config_entry.data.get(CONF_NORMALIZE_ENGINE, NORMALIZE_ENGINE_FFMPEG))
+            ): selector({
+                "select": {
+                    "options": NORMALIZE_ENGINES,
+                    "mode": "dropdown"
+                }
+            }),
+
+            # Apply speed by time-stretching one base-speed rendering per message.
+            vol.Optional(
+                CONF_LOCAL_SPEED,
+                default=self.config_entry.options.get(CONF_LOCAL_SPEED, self.config_entry.data.get(CONF_LOCAL_SPEED, False))
+            ): selector({"boolean": {}}),
+
+            # Format handed to Home Assistant unless a call or the player asks for another one.
+            vol.Optional(
+                CONF_AUDIO_FORMAT,
+                default=self.config_entry.options.get(CONF_AUDIO_FORMAT, self.config_entry.data.get(CONF_AUDIO_FORMAT, DEFAULT_AUDIO_FORMAT))
+            ): selector({
+                "select": {
+                    "options": AUDIO_FORMATS,
+                    "mode": "dropdown"
+                }
+            }),
+
+            # Number of chunks of a long message that are synthesized in parallel.
+            vol.Optional(
+                CONF_MAX_CONCURRENCY,
+                default=self.config_entry.options.get(CONF_MAX_CONCURRENCY, self.config_entry.data.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY))
+            ): selector({
+                "number": {
+                    "min": 1,
+                    "max": 16,
+                    "step": 1,
+                    "mode": "box"
+                }
+            }),
+
+            # API requests in flight at once, across all messages of this entry.
+            vol.Optional(
+                CONF_MAX_REQUESTS,
+                default=self.config_entry.options.get(CONF_MAX_REQUESTS, DEFAULT_MAX_REQUESTS)
+            ): selector({
+                "number": {
+                    "min": 1,
+                    "max": 64,
+                    "step": 1,
+                    "mode": "box"
+                }
+            }),
+
+            # Requests per minute allowed by the API tier; 0 means no limit.
+            vol.Optional(
+                CONF_RATE_LIMIT,
+                default=self.config_entry.options.get(CONF_RATE_LIMIT, DEFAULT_RATE_LIMIT)
+            ): selector({
+                "number": {
+                    "min": 0,
+                    "max": 10000,
+                    "step": 1,
+                    "mode": "box",
+                    "unit_of_measurement": "requests/min"
+                }
+            }),
+
+            # Latency percentile after which a stalled request is duplicated; 0 disables it.
+            vol.Optional(
+                CONF_HEDGE_PERCENTILE,
+                default=self.config_entry.options.get(CONF_HEDGE_PERCENTILE, DEFAULT_HEDGE_PERCENTILE)
+            ): selector({
+                "number": {
+                    "min": 0,
+                    "max": 99,
+                    "step": 1,
+                    "mode": "box"
+                }
+            }),
+
+            # Size of the on-disk audio cache in MB; 0 disables it.
+            vol.Optional(
+                CONF_CACHE_SIZE,
+                default=self.config_entry.options.get(CONF_CACHE_SIZE, self.config_entry.data.get(CONF_CACHE_SIZE, DEFAULT_CACHE_SIZE))
+            ): selector({
+                "number": {
+                    "min": 0,
+                    "max": 10000,
+                    "step": 1,
+                    "mode": "box",
+                    "unit_of_measurement": "MB"
+                }
+            }),
+
+            # Phrases synthesized into the cache at startup, one per line.
+            vol.Optional(
+                CONF_PREWARM_PHRASES,
+                description={"suggested_value": self.config_entry.options.get(CONF_PREWARM_PHRASES, "")}
+            ): TextSelector(
+                TextSelectorConfig(type=TextSelectorType.TEXT, multiline=True)
+            )
+        })
+        if endpoints:
+            # Endpoints added besides the original one; untick one to remove it.
+            options_schema = options_schema.extend({
+                vol.Optional(
+                    CONF_ENDPOINTS,
+                    default=[str(index) for index in range(len(endpoints))]
+                ): selector({
+                    "select": {
+                        "options": [
+                            {"value": str(index), "label": f"{endpoint[CONF_URL]} ({endpoint[CONF_MODEL]})"}
+                            for index, endpoint in enumerate(endpoints)
+                        ],
+                        "multiple": True
+                    }
+                })
+            })
+        options_schema = options_schema.extend({
+            vol.Optional(CONF_ADD_ENDPOINT, default=False): selector({"boolean": {}})
         })
         return self.async_show_form(step_id="init", data_schema=options_schema)
+
+    async def async_step_endpoint(self, user_input: dict | None = None):
+        """Add an endpoint after checking that it synthesizes speech, and note how fast it answered."""
+        errors = {}
+        if user_input is not None:
+            try:
+                latency = await async_probe_endpoint(
+                    self.hass,
+                    user_input[CONF_URL],
+                    user_input.get(CONF_API_KEY),
+                    user_input[CONF_MODEL],
+                    self.config_entry.options.get(CONF_VOICE, self.config_entry.data.get(CONF_VOICE, "shimmer")),
+                )
+            except HomeAssistantError as e:
+                _LOGGER.warning("Endpoint probe failed: %s", e)
+                errors["base"] = "cannot_connect"
+            else:
+                _LOGGER.info("Endpoint %s answered in %.2f s", user_input[CONF_URL], latency)
+                endpoint = {**user_input, CONF_PROBE_LATENCY: latency}
+                self._options[CONF_ENDPOINTS] = [*self._options[CONF_ENDPOINTS], endpoint]
+                return self.async_create_entry(title="", data=self._options)
+        endpoint_schema = vol.Schema({
+            vol.Required(CONF_URL): str,
+            vol.Optional(CONF_API_KEY): str,
+            vol.Required(CONF_MODEL, default=self.config_entry.data.get(CONF_MODEL, "tts-1")): selector({
+                "select": {
+                    "options": MODELS,
+                    "mode": "dropdown",
+                    "sort": True,
+                    "custom_value": True
+                }
+            })
+        })
+        return self.async_show_form(
+            step_id="endpoint",
+            data_schema=self.add_suggested_values_to_schema(endpoint_schema, user_input),
+            errors=errors
+        )
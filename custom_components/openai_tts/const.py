@@ -16,7 +16,38 @@ VOICES = ["alloy", "ash", "ballad", "coral", "echo", "fable", "onyx", "nova", "s
 CONF_CHIME_ENABLE = "chime"
 CONF_CHIME_SOUND = "chime_sound"
 CONF_NORMALIZE_AUDIO = "normalize_audio"
+CONF_NORMALIZE_ENGINE = "normalize_engine"
+NORMALIZE_ENGINE_FFMPEG = "ffmpeg"
+NORMALIZE_ENGINE_NUMPY = "numpy"
+NORMALIZE_ENGINES = [NORMALIZE_ENGINE_FFMPEG, NORMALIZE_ENGINE_NUMPY]
 CONF_INSTRUCTIONS = "instructions"
+CONF_AUDIO_FORMAT = "audio_format"
+AUDIO_FORMATS = ["mp3", "opus", "aac", "flac", "wav"]
+DEFAULT_AUDIO_FORMAT = "mp3"
+CONF_MAX_CONCURRENCY = "max_concurrency"
+DEFAULT_MAX_CONCURRENCY = 4
+CONF_CACHE_SIZE = "cache_size"
+DEFAULT_CACHE_SIZE = 100  # MB
+CONF_PREWARM_PHRASES = "prewarm_phrases"
+CONF_LOCAL_SPEED = "local_speed"
+CONF_HEDGE_PERCENTILE = "hedge_percentile"
+DEFAULT_HEDGE_PERCENTILE = 95  # 0 disables hedging
+# Endpoints used besides the one the entry was created with, each a dict of
+# url, api_key, model and the latency measured when it was added.
+CONF_ENDPOINTS = "endpoints"
+CONF_ADD_ENDPOINT = "add_endpoint"
+CONF_PROBE_LATENCY = "probe_latency"
+# Concurrent API requests of the entry, across all messages, and the request
+# rate allowed by the API tier (per minute, 0 for no limit).
+CONF_MAX_REQUESTS = "max_requests"
+DEFAULT_MAX_REQUESTS = 8
+CONF_RATE_LIMIT = "rate_limit"
+DEFAULT_RATE_LIMIT = 0
+
+SERVICE_PREWARM = "prewarm"
+ATTR_MESSAGES = "messages"
+ATTR_PRIORITY = "priority"
+PRIORITIES = ["interactive", "alarm", "announcement", "prewarm"]
 
 # STT-specific constants
 STT_DOMAIN = "openai_stt"
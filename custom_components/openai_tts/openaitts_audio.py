@@ -0,0 +1,320 @@
+"""
+Audio helpers for OpenAI TTS.
+"""
+from __future__ import annotations
+import io
+import logging
+import os
+import struct
+import subprocess
+import threading
+import wave
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+_LOGGER = logging.getLogger(__name__)
+
+CHIME_DIR = os.path.join(os.path.dirname(__file__), "chime")
+
+# Format of the audio returned by the speech endpoint.
+TTS_SAMPLE_RATE = 24000
+TTS_CHANNELS = 1
+
+# ffmpeg output options for the formats we hand to Home Assistant. WAV is
+# written as raw PCM and wrapped by us, since ffmpeg can't fill in the header
+# sizes when writing to a pipe.
+ENCODER_ARGS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "128k", "-f", "mp3"],
+    "opus": ["-c:a", "libopus", "-b:a", "64k", "-f", "ogg"],
+    "aac": ["-c:a", "aac", "-b:a", "128k", "-f", "adts"],
+    "flac": ["-c:a", "flac", "-f", "flac"],
+    "wav": ["-f", "s16le"],
+}
+
+# Bitrates in kbit/s indexed by [MPEG-1?][layer][bitrate index].
+_BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+# Sample rates indexed by the version bits of the frame header.
+_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),   # MPEG-2.5
+    2: (22050, 24000, 16000),  # MPEG-2
+    3: (44100, 48000, 32000),  # MPEG-1
+}
+
+
+@dataclass(frozen=True)
+class Mp3FrameHeader:
+    """The fields of an MPEG audio frame header we need for frame-level editing."""
+    version: int
+    layer: int
+    sample_rate: int
+    channels: int
+    length: int
+
+    @property
+    def is_mpeg1(self) -> bool:
+        return self.version == 3
+
+
+def parse_frame_header(data: bytes, offset: int = 0) -> Mp3FrameHeader | None:
+    """Parse the frame header at `offset`, or return None if there isn't a valid one."""
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset:offset + 4]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[mpeg1][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and not mpeg1:
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+    channels = 1 if (b3 >> 6) == 3 else 2
+    return Mp3FrameHeader(version, layer, sample_rate, channels, length)
+
+
+def _id3v2_size(data: bytes) -> int:
+    """Return the size of a leading ID3v2 tag (0 if there is none)."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _is_info_frame(data: bytes, offset: int, header: Mp3FrameHeader) -> bool:
+    """Whether the frame is a Xing/Info/VBRI header frame rather than audio."""
+    if header.is_mpeg1:
+        side_info = 17 if header.channels == 1 else 32
+    else:
+        side_info = 9 if header.channels == 1 else 17
+    tag = data[offset + 4 + side_info:offset + 8 + side_info]
+    return tag in (b"Xing", b"Info") or data[offset + 36:offset + 40] == b"VBRI"
+
+
+def iter_frames(data: bytes) -> Iterator[tuple[int, Mp3FrameHeader]]:
+    """Yield (offset, header) for every audio frame in an MP3 byte string.
+    Tags and Xing/Info header frames are skipped; garbage between frames is
+    resynchronised over.
+    """
+    offset = _id3v2_size(data)
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    first = True
+    while offset + 4 <= end:
+        header = parse_frame_header(data, offset)
+        if header is None:
+            offset += 1
+            continue
+        if offset + header.length > end:
+            # Truncated final frame.
+            break
+        if not (first and _is_info_frame(data, offset, header)):
+            yield offset, header
+        first = False
+        offset += header.length
+
+
+def strip_mp3_metadata(data: bytes) -> bytes:
+    """Return only the audio frames of an MP3, without tags or Xing/Info frames.
+    Such metadata describes a single file and confuses players when it shows
+    up in the middle of a concatenated stream.
+    """
+    frames = [data[offset:offset + header.length] for offset, header in iter_frames(data)]
+    if not frames:
+        _LOGGER.debug("No MP3 frames found; leaving %d bytes untouched", len(data))
+        return data
+    return b"".join(frames)
+
+
+class Mp3FrameFilter:
+    """The streaming counterpart of `strip_mp3_metadata`: pass on the audio
+    frames of an MP3 arriving in chunks as soon as each is complete, without
+    tags or Xing/Info frames. Whatever is left at the end (a truncated frame,
+    an ID3v1 tag) is dropped.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._tag_skipped = False
+        self._first = True
+
+    def feed(self, chunk: bytes) -> bytes:
+        self._buffer.extend(chunk)
+        data = self._buffer
+        offset = 0
+        if not self._tag_skipped:
+            if len(data) < 10 or len(data) < _id3v2_size(bytes(data[:10])):
+                return b""
+            offset = _id3v2_size(bytes(data[:10]))
+            self._tag_skipped = True
+        frames = bytearray()
+        while offset + 4 <= len(data):
+            if data[offset:offset + 3] == b"TAG":
+                # An ID3v1 tag ends the file.
+                break
+            header = parse_frame_header(data, offset)
+            if header is None:
+                offset += 1
+                continue
+            if offset + header.length > len(data):
+                break
+            if not (self._first and _is_info_frame(data, offset, header)):
+                frames.extend(data[offset:offset + header.length])
+            self._first = False
+            offset += header.length
+        del data[:offset]
+        return bytes(frames)
+
+
+def concat_mp3(parts: list[bytes]) -> bytes:
+    """Join MP3 files at the frame level, without re-encoding."""
+    return b"".join(strip_mp3_metadata(part) for part in parts)
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = TTS_SAMPLE_RATE, channels: int = TTS_CHANNELS) -> bytes:
+    """Wrap 16-bit PCM in a WAV container."""
+    with io.BytesIO() as buffer:
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(channels)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(pcm)
+        return buffer.getvalue()
+
+
+def wav_stream_header(sample_rate: int = TTS_SAMPLE_RATE, channels: int = TTS_CHANNELS) -> bytes:
+    """WAV header for 16-bit PCM of unknown length, to be followed by the samples as they arrive."""
+    byte_rate = sample_rate * channels * 2
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, channels * 2, 16)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+
+def run_ffmpeg(args: list[str], audio: bytes = b"") -> bytes:
+    """Run ffmpeg with `audio` on stdin and return what it writes to stdout.
+    Raises subprocess.CalledProcessError if ffmpeg fails.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", *args]
+    _LOGGER.debug("Executing ffmpeg command: %s", " ".join(cmd))
+    result = subprocess.run(cmd, input=audio, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.stdout
+
+
+class ChimeLibrary:
+    """Chime sounds held in memory as MP3 frames, ready to be put in front of speech.
+
+    Frames can only be concatenated when sample rate and channel count match,
+    so a chime whose file has a different format is transcoded with ffmpeg
+    once, the first time that format is requested, and then reused.
+    """
+
+    def __init__(self):
+        # Keyed by (name, sample rate, channels); channels 0 marks decoded PCM.
+        self._frames: dict[tuple[str, int, int], bytes | None] = {}
+        # One lock per chime and format being prepared, so a transcode only
+        # holds up requests for that same chime; `_lock` guards the dicts.
+        self._preparing: dict[tuple[str, int, int], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _prepared(self, key: tuple[str, int, int], prepare: Callable[[], bytes | None]) -> bytes | None:
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+            key_lock = self._preparing.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._frames:
+                    return self._frames[key]
+            frames = prepare()
+            with self._lock:
+                self._frames[key] = frames
+                del self._preparing[key]
+            return frames
+
+    def get(self, name: str, sample_rate: int = TTS_SAMPLE_RATE, channels: int = TTS_CHANNELS) -> bytes | None:
+        """Return the chime's frames in the given format, or None if unavailable."""
+        return self._prepared((name, sample_rate, channels), lambda: self._load(name, sample_rate, channels))
+
+    def prepend(self, name: str, audio: bytes) -> bytes | None:
+        """Put the chime in front of MP3 `audio` without re-encoding the speech.
+        Returns None when the audio isn't MP3 or no matching chime could be
+        prepared, in which case the caller has to fall back to ffmpeg.
+        """
+        first = next(iter_frames(audio), None)
+        if first is None or first[1].layer != 3:
+            return None
+        header = first[1]
+        chime = self.get(name, header.sample_rate, header.channels)
+        if chime is None:
+            return None
+        return chime + strip_mp3_metadata(audio)
+
+    def get_pcm(self, name: str, sample_rate: int = TTS_SAMPLE_RATE) -> bytes | None:
+        """Return the chime decoded to 16-bit mono PCM, or None if unavailable."""
+        return self._prepared((name, sample_rate, 0), lambda: self._decode(name, sample_rate))
+
+    @staticmethod
+    def _decode(name: str, sample_rate: int) -> bytes | None:
+        path = os.path.join(CHIME_DIR, name)
+        try:
+            return run_ffmpeg(["-i", path, "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "pipe:1"])
+        except (OSError, subprocess.CalledProcessError) as err:
+            _LOGGER.warning("Could not decode chime %s: %s", name, err)
+            return None
+
+    @staticmethod
+    def _load(name: str, sample_rate: int, channels: int) -> bytes | None:
+        path = os.path.join(CHIME_DIR, name)
+        try:
+            with open(path, "rb") as chime_file:
+                data = chime_file.read()
+        except OSError as err:
+            _LOGGER.error("Could not read chime file %s: %s", path, err)
+            return None
+        frames = [header for _, header in iter_frames(data)]
+        if frames and all(
+            header.layer == 3 and header.sample_rate == sample_rate and header.channels == channels
+            for header in frames
+        ):
+            return strip_mp3_metadata(data)
+
+        _LOGGER.debug("Transcoding chime %s to %d Hz, %d channel(s)", name, sample_rate, channels)
+        try:
+            transcoded = run_ffmpeg([
+                "-i", path,
+                "-ac", str(channels),
+                "-ar", str(sample_rate),
+                "-b:a", "128k",
+                "-f", "mp3",
+                "pipe:1",
+            ])
+        except (OSError, subprocess.CalledProcessError) as err:
+            _LOGGER.warning("Could not transcode chime %s: %s", name, err)
+            return None
+        return strip_mp3_metadata(transcoded)
@@ -0,0 +1,323 @@
+"""
+Persistent audio cache for OpenAI TTS.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from dataclasses import asdict, dataclass
+from typing import Any, TypeVar
+
+from homeassistant.core import HomeAssistant
+
+_LOGGER = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+# Changes to the index are written at most this often (seconds); `flush`
+# writes what is left.
+INDEX_SAVE_INTERVAL = 60
+
+_T = TypeVar("_T")
+
+
+@dataclass
+class CacheEntry:
+    """A cached rendering on disk."""
+    extension: str
+    size: int
+    last_access: float
+    # Pinned entries (pre-synthesized phrases) are never evicted.
+    pinned: bool = False
+
+
+class OpenAITTSCache:
+    """Content-addressed on-disk cache of final (post-processed) TTS audio.
+
+    Entries are keyed by a hash of everything that influences the audio and
+    kept in an LRU-ordered index, which is persisted next to the audio files so
+    the cache survives restarts. The index is written at most every
+    INDEX_SAVE_INTERVAL and on `flush`; audio files it doesn't list, e.g.
+    stored after the last write before a crash, are removed on `load`. When
+    the total size exceeds `max_bytes`, the least recently used entries that
+    aren't pinned are evicted.
+
+    All methods do blocking file I/O and are meant to run in the executor.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._total_bytes = 0
+        self._dirty = False
+        self._saved_at = -math.inf
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(**params: Any) -> str:
+        """Hash the synthesis parameters into a cache key."""
+        serialized = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self._directory, f"{key}.{extension}")
+
+    def load(self) -> None:
+        """Read the index from disk, dropping entries whose files have gone
+        missing and files no entry refers to.
+        """
+        os.makedirs(self._directory, exist_ok=True)
+        index_path = os.path.join(self._directory, INDEX_FILE)
+        try:
+            with open(index_path, encoding="utf-8") as index_file:
+                raw = json.load(index_file)
+        except FileNotFoundError:
+            raw = {}
+        except (OSError, ValueError) as err:
+            _LOGGER.warning("Discarding unreadable TTS cache index %s: %s", index_path, err)
+            raw = {}
+
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            for key, value in sorted(raw.items(), key=lambda item: item[1].get("last_access", 0)):
+                try:
+                    entry = CacheEntry(**value)
+                except TypeError:
+                    continue
+                if not os.path.isfile(self._path(key, entry.extension)):
+                    continue
+                self._entries[key] = entry
+                self._total_bytes += entry.size
+            self._dirty = len(self._entries) != len(raw)
+            self._evict()
+            self._sweep()
+        _LOGGER.debug("Loaded TTS cache with %d entries (%d bytes)", len(self._entries), self._total_bytes)
+
+    def get(self, key: str) -> tuple[str, bytes] | None:
+        """Return (extension, audio) for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            entry.last_access = time.time()
+            self._dirty = True
+        try:
+            with open(self._path(key, entry.extension), "rb") as audio_file:
+                return entry.extension, audio_file.read()
+        except OSError as err:
+            _LOGGER.warning("Dropping unreadable TTS cache entry %s: %s", key, err)
+            with self._lock:
+                if self._entries.pop(key, None) is not None:
+                    self._total_bytes -= entry.size
+            return None
+
+    def put(self, key: str, extension: str, data: bytes, pinned: bool = False) -> None:
+        """Store audio for `key`, evicting old entries to stay within the size limit."""
+        if len(data) > self._max_bytes:
+            return
+        path = self._path(key, extension)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as audio_file:
+            audio_file.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.size
+                if previous.extension != extension:
+                    self._remove_file(key, previous.extension)
+            pinned = pinned or (previous is not None and previous.pinned)
+            self._entries[key] = CacheEntry(extension, len(data), time.time(), pinned)
+            self._total_bytes += len(data)
+            self._evict()
+            self._dirty = True
+            self._save_index_soon()
+
+    def pin(self, key: str) -> bool:
+        """Exempt `key` from eviction. Returns False if it isn't cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if not entry.pinned:
+                entry.pinned = True
+                self._dirty = True
+                self._save_index_soon()
+            return True
+
+    def flush(self) -> None:
+        """Persist the LRU order if it changed since the last write."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _evict(self) -> None:
+        for key, entry in list(self._entries.items()):
+            if self._total_bytes <= self._max_bytes:
+                break
+            if entry.pinned:
+                continue
+            del self._entries[key]
+            self._total_bytes -= entry.size
+            self._remove_file(key, entry.extension)
+            self._dirty = True
+            _LOGGER.debug("Evicted TTS cache entry %s (%d bytes)", key, entry.size)
+
+    def _sweep(self) -> None:
+        """Remove the files in the cache directory that no entry refers to."""
+        expected = {f"{key}.{entry.extension}" for key, entry in self._entries.items()}
+        expected.add(INDEX_FILE)
+        try:
+            names = os.listdir(self._directory)
+        except OSError as err:
+            _LOGGER.warning("Could not list the TTS cache directory: %s", err)
+            return
+        for name in names:
+            if name in expected:
+                continue
+            try:
+                os.remove(os.path.join(self._directory, name))
+                _LOGGER.debug("Removed unindexed TTS cache file %s", name)
+            except OSError as err:
+                _LOGGER.warning("Could not remove TTS cache file %s: %s", name, err)
+
+    def _remove_file(self, key: str, extension: str) -> None:
+        try:
+            os.remove(self._path(key, extension))
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            _LOGGER.warning("Could not remove TTS cache file for %s: %s", key, err)
+
+    def _save_index_soon(self) -> None:
+        if time.monotonic() - self._saved_at >= INDEX_SAVE_INTERVAL:
+            self._save_index()
+
+    def _save_index(self) -> None:
+        index_path = os.path.join(self._directory, INDEX_FILE)
+        tmp_path = f"{index_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as index_file:
+                json.dump({key: asdict(entry) for key, entry in self._entries.items()}, index_file)
+            os.replace(tmp_path, index_path)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        except OSError as err:
+            _LOGGER.warning("Could not write TTS cache index: %s", err)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller starts the work; callers arriving while it is still
+    running wait for the same result. A caller being cancelled does not
+    cancel the shared work, so the remaining waiters still get their audio.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def async_run(self, key: str, factory: Callable[[], Awaitable[_T]]) -> _T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._hass.async_create_task(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            _LOGGER.debug("Joining in-flight TTS request %s", key)
+        return await asyncio.shield(task)
+
+
+class _Broadcast:
+    """A stream being received, kept whole for the readers sharing it."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.opened: list[Any] = []
+        self.readers = 0
+        self.changed = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class StreamFlight:
+    """Coalesce concurrent streams that share a key into one request.
+
+    The first reader starts the stream; readers arriving while it is still
+    running get the chunks received so far and then follow along. The
+    stream is only cancelled once every reader has left.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._inflight: dict[str, _Broadcast] = {}
+
+    async def async_stream(
+        self, key: str, factory: Callable[[Callable[[Any], None]], AsyncIterator[bytes]],
+        on_open: Callable[[Any], None] | None = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """Yield the chunks of the stream `factory` opens. `factory` is handed
+        a callback for what the stream reports on opening (e.g. the endpoint
+        that answered), which is passed on to the `on_open` of every reader.
+        """
+        broadcast = self._inflight.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._inflight[key] = broadcast
+            broadcast.task = self._hass.async_create_task(self._async_pump(broadcast, factory))
+            broadcast.task.add_done_callback(lambda _: self._forget(key, broadcast))
+        else:
+            _LOGGER.debug("Joining in-flight TTS stream %s", key)
+        broadcast.readers += 1
+        told = False
+        sent = 0
+        try:
+            while True:
+                if not told and broadcast.opened:
+                    told = True
+                    if on_open is not None:
+                        on_open(broadcast.opened[0])
+                if sent < len(broadcast.chunks):
+                    sent += 1
+                    yield broadcast.chunks[sent - 1]
+                elif broadcast.task.done():
+                    # Raises what went wrong.
+                    broadcast.task.result()
+                    return
+                else:
+                    await broadcast.changed.wait()
+        finally:
+            broadcast.readers -= 1
+            if not broadcast.readers and not broadcast.task.done():
+                self._forget(key, broadcast)
+                broadcast.task.cancel()
+
+    def _forget(self, key: str, broadcast: _Broadcast) -> None:
+        if self._inflight.get(key) is broadcast:
+            del self._inflight[key]
+
+    @staticmethod
+    async def _async_pump(broadcast: _Broadcast, factory: Callable[[Callable[[Any], None]], AsyncIterator[bytes]]) -> None:
+        def opened(value: Any) -> None:
+            broadcast.opened.append(value)
+            broadcast.notify()
+
+        try:
+            async for chunk in factory(opened):
+                broadcast.chunks.append(chunk)
+                broadcast.notify()
+        finally:
+            broadcast.notify()
@@ -1,92 +1,309 @@
 """
 TTS Engine for OpenAI TTS.
 """
-import json
+from __future__ import annotations
+import asyncio
 import logging
 import time
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
-from asyncio import CancelledError
+from collections.abc import AsyncGenerator, Callable
+from dataclasses import dataclass
+from urllib.parse import urlparse
 
+import aiohttp
+
+from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import ssl as ssl_util
+
+from .const import DOMAIN
+from .openaitts_balancer import Endpoint, EndpointBalancer
+from .openaitts_retry import (
+    MAX_ATTEMPTS,
+    RETRY_AFTER_MAX,
+    async_hedge,
+    backoff_delay,
+    is_retryable_status,
+    parse_retry_after,
+)
+from .openaitts_scheduler import Priority, RequestScheduler
 
 _LOGGER = logging.getLogger(__name__)
 
+# Keep idle connections around long enough to bridge the gaps between
+# announcements, so consecutive requests skip the TCP and TLS handshake.
+KEEPALIVE_TIMEOUT = 60
+CONNECTION_LIMIT = 10
+REQUEST_TIMEOUT = 30
+STREAM_CHUNK_SIZE = 4096
+
+DATA_SESSIONS = "sessions"
+
+
 class AudioResponse:
-    """A simple response wrapper with a 'content' attribute to hold audio bytes."""
-    def __init__(self, content: bytes):
+    """A simple response wrapper with a 'content' attribute to hold audio bytes
+    and the endpoint that rendered them.
+    """
+    def __init__(self, content: bytes, endpoint: Endpoint | None = None):
         self.content = content
+        self.endpoint = endpoint
+
+
+@dataclass
+class _SharedSession:
+    """A pooled client session and the number of engines using it."""
+    session: aiohttp.ClientSession
+    users: int = 0
+
+
+def _base_url(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+def async_acquire_session(hass: HomeAssistant, url: str) -> aiohttp.ClientSession:
+    """Return the keep-alive session shared by all entries pointing at the base URL of `url`."""
+    sessions: dict[str, _SharedSession] = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_SESSIONS, {})
+    key = _base_url(url)
+    shared = sessions.get(key)
+    if shared is None or shared.session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=CONNECTION_LIMIT,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ssl=ssl_util.get_default_context(),
+        )
+        shared = _SharedSession(aiohttp.ClientSession(connector=connector))
+        sessions[key] = shared
+        _LOGGER.debug("Created pooled HTTP session for %s", key)
+    shared.users += 1
+    return shared.session
+
+
+async def async_release_session(hass: HomeAssistant, url: str) -> None:
+    """Drop one reference to the session for `url` and close it once unused."""
+    sessions: dict[str, _SharedSession] = hass.data.get(DOMAIN, {}).get(DATA_SESSIONS, {})
+    key = _base_url(url)
+    shared = sessions.get(key)
+    if shared is None:
+        return
+    shared.users -= 1
+    if shared.users <= 0:
+        del sessions[key]
+        await shared.session.close()
+        _LOGGER.debug("Closed pooled HTTP session for %s", key)
+
 
 class OpenAITTSEngine:
-    def __init__(self, api_key: str, voice: str, model: str, speed: float, url: str):
-        self._api_key = api_key
+    def __init__(self, voice: str, speed: float, balancer: EndpointBalancer,
+                 sessions: dict[str, aiohttp.ClientSession], scheduler: RequestScheduler):
+        """`sessions` maps the URL of every endpoint to the pooled session used for it.
+        Every request to the API, retries and hedges included, takes a slot from `scheduler`.
+        """
         self._voice = voice
-        self._model = model
         self._speed = speed
-        self._url = url
+        self._balancer = balancer
+        self._sessions = sessions
+        self._scheduler = scheduler
+        self._probing: set[Endpoint] = set()
 
-    def get_tts(self, text: str, speed: float = None, instructions: str = None, voice: str = None) -> AudioResponse:
-        """Synchronous TTS request using urllib.request.
-        If the API call fails, waits for 1 second and retries once.
-        """
+    @property
+    def endpoints(self) -> list[Endpoint]:
+        """The endpoints requests are balanced over, the entry's own first."""
+        return self._balancer.endpoints
+
+    def _build_request(self, endpoint: Endpoint, text: str, speed: float | None, instructions: str | None,
+                       voice: str | None, response_format: str) -> tuple[dict, dict]:
         if speed is None:
             speed = self._speed
         if voice is None:
             voice = self._voice
 
         headers = {"Content-Type": "application/json"}
-        if self._api_key:
-            headers["Authorization"] = f"Bearer {self._api_key}"
+        if endpoint.api_key:
+            headers["Authorization"] = f"Bearer {endpoint.api_key}"
 
         data = {
-            "model": self._model,
+            "model": endpoint.model,
             "input": text,
             "voice": voice,
-            "response_format": "mp3",
+            "response_format": response_format,
             "speed": speed
         }
-        if instructions is not None and self._model == "gpt-4o-mini-tts":
+        if instructions is not None and endpoint.model == "gpt-4o-mini-tts":
             data["instructions"] = instructions
+        return headers, data
+
+    async def async_get_tts(self, text: str, speed: float = None, instructions: str = None,
+                            voice: str = None, response_format: str = "mp3",
+                            priority: Priority = Priority.ANNOUNCEMENT) -> AudioResponse:
+        """Asynchronous TTS request returning the complete audio and the endpoint that rendered it."""
+        result = await self._async_open((text, speed, instructions, voice, response_format), priority)
+        content = bytearray()
+        async for chunk in self._async_read(result):
+            content.extend(chunk)
+        return AudioResponse(bytes(content), result[0])
 
-        max_retries = 1
-        attempt = 0
-        while True:
+    async def _async_attempt(self, endpoint: Endpoint, request: tuple) -> tuple[Endpoint, aiohttp.ClientResponse, bytes]:
+        """Send the request to `endpoint`, which must have been acquired from the
+        balancer along with a scheduler slot, and wait for the first audio bytes.
+        Both are released with the response, or right away if there is none.
+        """
+        headers, data = self._build_request(endpoint, *request)
+        start = time.monotonic()
+        try:
+            # Set a timeout of 30 seconds for the entire request.
+            response = await self._sessions[endpoint.url].post(
+                endpoint.url,
+                json=data,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
             try:
-                req = Request(
-                    self._url,
-                    data=json.dumps(data).encode("utf-8"),
-                    headers=headers,
-                    method="POST"
-                )
-                # Set a timeout of 30 seconds for the entire request.
-                with urlopen(req, timeout=30) as response:
-                    content = response.read()
-                return AudioResponse(content)
-            except CancelledError as ce:
-                _LOGGER.exception("TTS request cancelled")
+                response.raise_for_status()
+                first = await response.content.readany()
+            except BaseException:
+                response.release()
+                raise
+        except asyncio.CancelledError:
+            self._release(endpoint)
+            raise
+        except aiohttp.ClientResponseError as err:
+            # A client error means the endpoint is up; only count what it can be blamed for.
+            self._balancer.report(endpoint, not is_retryable_status(err.status))
+            self._release(endpoint)
+            raise
+        except BaseException:
+            self._balancer.report(endpoint, False)
+            self._release(endpoint)
+            raise
+        latency = time.monotonic() - start
+        endpoint.latency.record(latency)
+        self._balancer.report(endpoint, True, latency)
+        return endpoint, response, first
+
+    def _release(self, endpoint: Endpoint) -> None:
+        self._balancer.release(endpoint)
+        self._scheduler.release()
+
+    def _close(self, result: tuple[Endpoint, aiohttp.ClientResponse, bytes]) -> None:
+        endpoint, response, _ = result
+        response.release()
+        self._release(endpoint)
+
+    async def _async_open(self, request: tuple, priority: Priority) -> tuple[Endpoint, aiohttp.ClientResponse, bytes]:
+        """Send the request, hedged, retrying failures with jittered exponential backoff.
+        A response that hasn't started by the hedge deadline, counted from when
+        the request got its scheduler slot, gets a duplicate request, on
+        another endpoint if there is one, and whichever answers first is used. Rate limits and server errors are retried, preferably
+        on an endpoint that hasn't failed yet, waiting as long as the server's
+        Retry-After asks.
+        """
+        tried: list[Endpoint] = []
+        # Set once the first request of a round holds a scheduler slot and an
+        # endpoint; time spent queueing doesn't count towards the hedge deadline.
+        started = asyncio.Event()
+
+        async def attempt():
+            await self._scheduler.acquire(priority)
+            endpoint = self._balancer.acquire(exclude=tried)
+            tried.append(endpoint)
+            started.set()
+            return await self._async_attempt(endpoint, request)
+
+        for attempt_number in range(MAX_ATTEMPTS):
+            try:
+                delay = self._balancer.select(exclude=tried).latency.hedge_delay()
+                started.clear()
+                return await async_hedge(attempt(), attempt, delay, started.wait, self._close)
+            except asyncio.CancelledError:
+                _LOGGER.debug("TTS request cancelled")
                 raise  # Propagate cancellation.
-            except (HTTPError, URLError) as net_err:
-                _LOGGER.exception("Network error in synchronous get_tts on attempt %d", attempt + 1)
-                if attempt < max_retries:
-                    attempt += 1
-                    time.sleep(1)  # Wait for 1 second before retrying.
-                    _LOGGER.debug("Retrying HTTP call (attempt %d)", attempt + 1)
-                    continue
-                else:
+            except aiohttp.ClientResponseError as err:
+                _LOGGER.warning("TTS request failed with HTTP %d on attempt %d", err.status, attempt_number + 1)
+                if not is_retryable_status(err.status) or attempt_number + 1 == MAX_ATTEMPTS:
+                    raise HomeAssistantError(f"TTS request failed with HTTP {err.status}") from err
+                delay = parse_retry_after(err.headers.get("Retry-After") if err.headers else None)
+                if delay is not None and delay > RETRY_AFTER_MAX:
+                    raise HomeAssistantError(f"TTS API asked to retry after {delay:.0f} s") from err
+            except (aiohttp.ClientError, asyncio.TimeoutError) as net_err:
+                _LOGGER.warning("Network error in async_stream_tts on attempt %d: %r", attempt_number + 1, net_err)
+                if attempt_number + 1 == MAX_ATTEMPTS:
                     raise HomeAssistantError("Network error occurred while fetching TTS audio") from net_err
+                delay = None
             except Exception as exc:
-                _LOGGER.exception("Unknown error in synchronous get_tts on attempt %d", attempt + 1)
-                if attempt < max_retries:
-                    attempt += 1
-                    time.sleep(1)
-                    _LOGGER.debug("Retrying HTTP call (attempt %d)", attempt + 1)
-                    continue
-                else:
-                    raise HomeAssistantError("An unknown error occurred while fetching TTS audio") from exc
-
-    def close(self):
-        """Nothing to close in the synchronous version."""
-        pass
+                _LOGGER.exception("Unknown error in async_stream_tts on attempt %d", attempt_number + 1)
+                raise HomeAssistantError("An unknown error occurred while fetching TTS audio") from exc
+            if len(self._balancer.endpoints) > len(set(tried)):
+                # Another endpoint is available; a Retry-After only applies to the one that sent it.
+                delay = 0.0
+            elif delay is None:
+                delay = backoff_delay(attempt_number)
+            _LOGGER.debug("Retrying HTTP call in %.2f s (attempt %d)", delay, attempt_number + 2)
+            await asyncio.sleep(delay)
+        raise HomeAssistantError("TTS request failed")
+
+    async def async_stream_tts(self, text: str, speed: float = None, instructions: str = None,
+                               voice: str = None, response_format: str = "mp3",
+                               priority: Priority = Priority.ANNOUNCEMENT,
+                               on_open: Callable[[Endpoint], None] | None = None) -> AsyncGenerator[bytes, None]:
+        """Asynchronous TTS request over the pooled keep-alive sessions.
+        Yields audio chunks as the API sends them. Failures before any audio
+        was received are retried, see `_async_open`; once audio has been
+        yielded an error ends the stream. `on_open` is told which endpoint
+        answered before the first chunk.
+        """
+        result = await self._async_open((text, speed, instructions, voice, response_format), priority)
+        if on_open is not None:
+            on_open(result[0])
+        reader = self._async_read(result)
+        try:
+            async for chunk in reader:
+                yield chunk
+        finally:
+            # Release the response now if the caller stops reading early.
+            await reader.aclose()
+
+    async def _async_read(self, result: tuple[Endpoint, aiohttp.ClientResponse, bytes]) -> AsyncGenerator[bytes, None]:
+        """Yield the audio of an opened response, releasing it at the end."""
+        _, response, first = result
+        try:
+            if first:
+                yield first
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                yield chunk
+        except asyncio.CancelledError:
+            _LOGGER.debug("TTS request cancelled")
+            raise  # Propagate cancellation.
+        except (aiohttp.ClientError, asyncio.TimeoutError) as net_err:
+            _LOGGER.exception("Network error while streaming TTS audio")
+            raise HomeAssistantError("Network error occurred while fetching TTS audio") from net_err
+        finally:
+            self._close(result)
+
+    async def async_probe_ejected(self, hass: HomeAssistant) -> None:
+        """Probe the endpoints whose ejection has expired, the entry's own one
+        like those added later, and take back those that answer.
+        """
+        async def probe(endpoint: Endpoint) -> None:
+            try:
+                latency = await async_probe_endpoint(hass, endpoint.url, endpoint.api_key, endpoint.model, self._voice)
+            except HomeAssistantError as err:
+                _LOGGER.debug("Probe of endpoint %s failed: %s", endpoint.name, err)
+                self._balancer.report(endpoint, False)
+            else:
+                self._balancer.report(endpoint, True, latency)
+
+        due = [endpoint for endpoint in self._balancer.due_for_probe() if endpoint not in self._probing]
+        self._probing.update(due)
+        try:
+            await asyncio.gather(*(probe(endpoint) for endpoint in due))
+        finally:
+            self._probing.difference_update(due)
+
+    async def async_close(self, hass: HomeAssistant) -> None:
+        """Release the shared sessions; each is closed when the last engine using it goes away."""
+        self._scheduler.close()
+        for url in self._sessions:
+            await async_release_session(hass, url)
 
     @staticmethod
     def get_supported_langs() -> list:
@@ -96,3 +313,27 @@ class OpenAITTSEngine:
             "kk", "ko", "lv", "lt", "mk", "ms", "mr", "mi", "ne", "no", "fa", "pl", "pt", "ro",
             "ru", "sr", "sk", "sl", "es", "sw", "sv", "tl", "ta", "th", "tr", "uk", "ur", "vi", "cy"
         ]
+
+
+async def async_probe_endpoint(hass: HomeAssistant, url: str, api_key: str | None, model: str,
+                               voice: str) -> float:
+    """Synthesize a short phrase on an endpoint and return the seconds until
+    the first audio byte. Raises HomeAssistantError if it doesn't work.
+    """
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    data = {"model": model, "input": "Hello.", "voice": voice, "response_format": "mp3"}
+    session = async_acquire_session(hass, url)
+    try:
+        start = time.monotonic()
+        async with session.post(url, json=data, headers=headers,
+                                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+            response.raise_for_status()
+            if not await response.content.readany():
+                raise HomeAssistantError(f"{url} returned no audio")
+            return time.monotonic() - start
+    except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+        raise HomeAssistantError(f"Could not reach {url}: {err}") from err
+    finally:
+        await async_release_session(hass, url)
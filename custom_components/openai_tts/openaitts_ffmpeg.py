@@ -0,0 +1,214 @@
+"""
+Pool of pre-started ffmpeg processes for OpenAI TTS post-processing.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, AsyncIterator
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+_LOGGER = logging.getLogger(__name__)
+
+# Jobs waiting for a free worker, per worker, before new jobs are refused.
+QUEUE_PER_WORKER = 4
+QUEUE_TIMEOUT = 30
+JOB_TIMEOUT = 60
+# Idle processes kept at most; the least recently used one is stopped first.
+MAX_IDLE = 4
+# Bytes read from a streaming ffmpeg process at a time.
+STREAM_READ_SIZE = 4096
+
+
+class FFmpegPool:
+    """Run ffmpeg jobs on processes that were started before the job arrived.
+
+    An ffmpeg process handles a single stream, so rather than feeding jobs to
+    one long-running process, the pool keeps an idle process waiting on stdin
+    for each command line registered with `prestart`: the entity's configured
+    defaults. A job with those arguments takes that process, which has
+    already been forked and loaded its libraries, and a replacement is
+    started as soon as the job is done. Jobs with other arguments (a per-call
+    speed or format) start their own process. At most MAX_IDLE processes are
+    kept idle. Idle processes are checked before use and replaced if they
+    have exited.
+
+    At most `workers` jobs run at once (one ffmpeg thread each); further jobs
+    queue in the event loop, before taking an executor thread, and once the
+    queue is full new jobs are refused instead of piling up processes on the
+    host.
+    """
+
+    def __init__(self, hass: HomeAssistant, workers: int | None = None):
+        self._hass = hass
+        self._workers = workers or os.cpu_count() or 1
+        self._max_queued = self._workers * QUEUE_PER_WORKER
+        self._slots = asyncio.Semaphore(self._workers)
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._defaults: set[tuple[str, ...]] = set()
+        self._idle: OrderedDict[tuple[str, ...], subprocess.Popen] = OrderedDict()
+        self._closed = False
+
+    @staticmethod
+    def _command(args: list[str]) -> list[str]:
+        return ["ffmpeg", "-hide_banner", "-loglevel", "error", "-threads", "1", *args]
+
+    def _spawn(self, key: tuple[str, ...]) -> subprocess.Popen:
+        return subprocess.Popen(
+            self._command(list(key)),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def _take(self, key: tuple[str, ...]) -> subprocess.Popen:
+        """Return the idle process for `key` if it is still healthy, else a new one."""
+        with self._lock:
+            process = self._idle.pop(key, None)
+        if process is not None:
+            if process.poll() is None:
+                return process
+            _LOGGER.debug("Idle ffmpeg process exited with %s; starting a new one", process.returncode)
+        return self._spawn(key)
+
+    def prestart(self, args: list[str]) -> None:
+        """Keep an idle process ready for `args` from now on, so jobs with them
+        don't wait for ffmpeg to start. Blocks; meant for the executor.
+        """
+        key = tuple(args)
+        with self._lock:
+            if self._closed:
+                return
+            self._defaults.add(key)
+        self._replenish(key)
+
+    def _replenish(self, key: tuple[str, ...]) -> None:
+        with self._lock:
+            if self._closed or key in self._idle:
+                return
+        try:
+            process = self._spawn(key)
+        except OSError as err:
+            _LOGGER.warning("Could not start ffmpeg: %s", err)
+            return
+        stopped = []
+        with self._lock:
+            if self._closed or key in self._idle:
+                stopped.append(process)
+            else:
+                self._idle[key] = process
+                while len(self._idle) > MAX_IDLE:
+                    stopped.append(self._idle.popitem(last=False)[1])
+        for process in stopped:
+            self._kill(process)
+
+    async def _async_acquire(self) -> None:
+        """Wait for a free worker. Raises HomeAssistantError if the pool is saturated."""
+        if self._queued >= self._max_queued:
+            raise HomeAssistantError("Too many audio post-processing jobs queued")
+        self._queued += 1
+        try:
+            async with asyncio.timeout(QUEUE_TIMEOUT):
+                await self._slots.acquire()
+        except TimeoutError as err:
+            raise HomeAssistantError("Timed out waiting for an audio post-processing worker") from err
+        finally:
+            self._queued -= 1
+
+    async def async_run(self, args: list[str], audio: bytes) -> bytes:
+        """Run ffmpeg with `args`, `audio` on stdin, and return its stdout.
+        Raises HomeAssistantError if the pool is saturated and
+        subprocess.CalledProcessError if ffmpeg fails.
+        """
+        await self._async_acquire()
+        try:
+            return await self._hass.async_add_executor_job(self._run, tuple(args), audio)
+        finally:
+            self._slots.release()
+
+    async def async_stream(self, args: list[str], chunks: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+        """Run ffmpeg with `args`, feeding it `chunks` as they arrive, and yield
+        its output as it is produced. The process is started for the stream
+        rather than taken from the idle ones, and holds a worker until the
+        stream ends. Errors of `chunks` are raised as they are; otherwise the
+        same as `async_run`.
+        """
+        await self._async_acquire()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._command(args),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+
+        async def feed() -> None:
+            try:
+                async for chunk in chunks:
+                    process.stdin.write(chunk)
+                    try:
+                        await process.stdin.drain()
+                    except ConnectionError:
+                        # ffmpeg has exited; its return code tells why.
+                        return
+            except BaseException:
+                # Don't pass on a truncated result.
+                if process.returncode is None:
+                    process.kill()
+                raise
+            finally:
+                process.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        errors = asyncio.create_task(process.stderr.read())
+        try:
+            while output := await process.stdout.read(STREAM_READ_SIZE):
+                yield output
+            await feeder
+            if await process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, self._command(args), None, await errors)
+        finally:
+            feeder.cancel()
+            errors.cancel()
+            await asyncio.gather(feeder, errors, return_exceptions=True)
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            self._slots.release()
+
+    def _run(self, key: tuple[str, ...], audio: bytes) -> bytes:
+        try:
+            process = self._take(key)
+            try:
+                output, errors = process.communicate(audio, timeout=JOB_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self._kill(process)
+                raise
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, process.args, output, errors)
+            return output
+        finally:
+            if key in self._defaults:
+                self._replenish(key)
+
+    def close(self) -> None:
+        """Stop the idle processes; no new ones are started afterwards."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle.values()), OrderedDict()
+        for process in idle:
+            self._kill(process)
+
+    @staticmethod
+    def _kill(process: subprocess.Popen) -> None:
+        process.kill()
+        process.communicate()
@@ -0,0 +1,172 @@
+"""
+In-process EBU R128 loudness normalization for OpenAI TTS.
+
+Implements the ITU-R BS.1770-4 measurement (K-weighting, gated integrated
+loudness, 4x oversampled true peak) with vectorized NumPy, so normalizing a
+message doesn't require starting an ffmpeg process.
+"""
+from __future__ import annotations
+import functools
+import logging
+import math
+
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+TARGET_LOUDNESS = -16.0  # LUFS
+TARGET_TRUE_PEAK = -1.0  # dBTP
+
+BLOCK_SECONDS = 0.4
+BLOCK_OVERLAP = 0.75
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU
+TRUE_PEAK_OVERSAMPLING = 4
+LIMITER_LOOKAHEAD_SECONDS = 0.01
+LIMITER_HEADROOM = 0.1  # dB the limiter aims below the true peak target
+# Tail added before filtering in the frequency domain so the filters' impulse
+# response doesn't wrap around to the start of the signal.
+FILTER_PADDING_SECONDS = 0.5
+
+
+def _k_weighting(sample_rate: int) -> list[tuple[tuple[float, float, float], tuple[float, float, float]]]:
+    """(b, a) coefficients of the two K-weighting biquads at `sample_rate`."""
+    # Stage 1: high shelf modelling the acoustic effect of the head.
+    gain, freq, q = 3.999843853973347, 1681.974450955533, 0.7071752369554196
+    k = math.tan(math.pi * freq / sample_rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (
+        ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0),
+        (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0),
+    )
+    # Stage 2: RLB high pass.
+    freq, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * freq / sample_rate)
+    a0 = 1 + k / q + k * k
+    highpass = (
+        (1.0, -2.0, 1.0),
+        (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0),
+    )
+    return [shelf, highpass]
+
+
+def k_weight(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Apply the K-weighting filter.
+    The biquads are applied as one multiplication in the frequency domain
+    instead of sample by sample, which keeps the work inside NumPy.
+    """
+    length = len(samples)
+    size = 1 << (length + int(sample_rate * FILTER_PADDING_SECONDS) - 1).bit_length()
+    spectrum = np.fft.rfft(samples, size) * _k_weighting_response(sample_rate, size)
+    return np.fft.irfft(spectrum, size)[:length]
+
+
+@functools.lru_cache(maxsize=4)
+def _k_weighting_response(sample_rate: int, size: int) -> np.ndarray:
+    """Frequency response of the K-weighting filter on the bins of a `size`-point FFT."""
+    z = np.exp(-1j * np.linspace(0, math.pi, size // 2 + 1))
+    response = np.ones(len(z), dtype=complex)
+    for b, a in _k_weighting(sample_rate):
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return response
+
+
+def _block_powers(weighted: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Mean square of every overlapping 400 ms gating block; none for audio
+    shorter than one block, whose loudness is undefined.
+    """
+    block = int(sample_rate * BLOCK_SECONDS)
+    if len(weighted) < block:
+        return np.array([])
+    step = int(block * (1 - BLOCK_OVERLAP))
+    energy = np.concatenate(([0.0], np.cumsum(weighted ** 2)))
+    starts = np.arange(0, len(weighted) - block + 1, step)
+    return (energy[starts + block] - energy[starts]) / block
+
+
+def _loudness(power: np.ndarray | float) -> np.ndarray | float:
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(power)
+
+
+def integrated_loudness(samples: np.ndarray, sample_rate: int) -> float:
+    """Gated integrated loudness in LUFS (-inf for silence and audio shorter than a block)."""
+    powers = _block_powers(k_weight(samples, sample_rate), sample_rate)
+    powers = powers[_loudness(powers) > ABSOLUTE_GATE]
+    if not len(powers):
+        return -math.inf
+    relative_gate = _loudness(np.mean(powers)) + RELATIVE_GATE
+    powers = powers[_loudness(powers) > relative_gate]
+    return float(_loudness(np.mean(powers)))
+
+
+def _oversample(samples: np.ndarray) -> np.ndarray:
+    """Band-limited interpolation by TRUE_PEAK_OVERSAMPLING."""
+    length = len(samples)
+    return np.fft.irfft(np.fft.rfft(samples), length * TRUE_PEAK_OVERSAMPLING) * TRUE_PEAK_OVERSAMPLING
+
+
+def true_peak(samples: np.ndarray) -> float:
+    """Maximum inter-sample peak in dBTP."""
+    if not len(samples):
+        return -math.inf
+    peak = np.max(np.abs(_oversample(samples)))
+    with np.errstate(divide="ignore"):
+        return float(20 * np.log10(peak))
+
+
+def _sliding_min(values: np.ndarray, width: int) -> np.ndarray:
+    """Minimum of every window of `width` values (van Herk/Gil-Werman, O(n))."""
+    count = len(values) - width + 1
+    blocks = np.pad(values, (0, -len(values) % width), constant_values=np.inf).reshape(-1, width)
+    prefix = np.minimum.accumulate(blocks, axis=1).ravel()
+    suffix = np.minimum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.minimum(suffix[:count], prefix[width - 1:width - 1 + count])
+
+
+def limit(samples: np.ndarray, sample_rate: int, ceiling_db: float) -> np.ndarray:
+    """Keep the true peak below `ceiling_db` with a smooth look-ahead gain curve.
+    Changing the gain reshapes the waveform between samples, so the curve
+    aims LIMITER_HEADROOM below the ceiling, and the result is measured again:
+    a peak still over the ceiling is taken off with a fixed gain.
+    """
+    ceiling = 10 ** (ceiling_db / 20)
+    envelope = np.abs(_oversample(samples)).reshape(-1, TRUE_PEAK_OVERSAMPLING).max(axis=1)
+    if envelope.max() <= ceiling:
+        return samples
+    target = 10 ** ((ceiling_db - LIMITER_HEADROOM) / 20)
+    needed = np.minimum(1.0, target / np.maximum(envelope, 1e-12))
+    # Every sample of the smoothing window sees a minimum taken over a window
+    # twice as wide, so the smoothed gain never exceeds what a peak needs.
+    radius = max(1, int(sample_rate * LIMITER_LOOKAHEAD_SECONDS) // 2)
+    held = _sliding_min(np.pad(needed, 2 * radius, constant_values=1.0), 4 * radius + 1)
+    kernel = np.full(2 * radius + 1, 1 / (2 * radius + 1))
+    smoothed = np.convolve(np.pad(held, radius, mode="edge"), kernel, mode="valid")
+    limited = samples * smoothed
+    peak = np.max(np.abs(_oversample(limited)))
+    if peak > ceiling:
+        _LOGGER.debug("Limiter overshoot of %.2f dB removed with a fixed gain", 20 * math.log10(peak / ceiling))
+        limited *= ceiling / peak
+    return limited
+
+
+def normalize(samples: np.ndarray, sample_rate: int, target_loudness: float = TARGET_LOUDNESS,
+              target_true_peak: float = TARGET_TRUE_PEAK) -> np.ndarray:
+    """Bring `samples` to the target integrated loudness without exceeding the true peak target."""
+    loudness = integrated_loudness(samples, sample_rate)
+    if math.isinf(loudness):
+        return samples
+    gain_db = target_loudness - loudness
+    _LOGGER.debug("Measured %.1f LUFS, applying %+.1f dB", loudness, gain_db)
+    return limit(samples * 10 ** (gain_db / 20), sample_rate, target_true_peak)
+
+
+def pcm16_to_float(pcm: bytes) -> np.ndarray:
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float64) / 32768
+
+
+def float_to_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 32767 / 32768) * 32768).round().astype("<i2").tobytes()
+
@@ -0,0 +1,130 @@
+"""
+Retry and request hedging policy for OpenAI TTS.
+
+The STT integration has a copy of this module, openai_stt/openaistt_retry.py:
+the two are installed separately and can't import each other. Keep the copies
+identical apart from the hedge timing below, which differs on purpose.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from email.utils import parsedate_to_datetime
+from typing import TypeVar
+
+_LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+# Longest Retry-After we are willing to wait; anything longer fails the request.
+RETRY_AFTER_MAX = 20.0
+
+# Recent latencies kept for the hedge deadline, and how many are needed before
+# the percentile is trusted over the default.
+LATENCY_HISTORY = 100
+LATENCY_MIN_SAMPLES = 10
+# Hedge timing: speech starts streaming within a fraction of a second, so a
+# stalled request is noticed sooner than a transcription, which is timed from
+# the end of the upload and takes longer.
+HEDGE_DEFAULT_DELAY = 2.0
+HEDGE_MIN_DELAY = 0.2
+
+# Statuses worth retrying: timeouts, conflicts, rate limits and server errors.
+RETRYABLE_STATUSES = {408, 409, 425, 429}
+
+
+class LatencyTracker:
+    """Recent latencies of an endpoint, and the hedge deadline derived from them."""
+
+    def __init__(self, percentile: float, history: int = LATENCY_HISTORY):
+        self._percentile = percentile
+        self._samples: deque[float] = deque(maxlen=history)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait for a response before sending a duplicate, or None if hedging is off."""
+        if not self._percentile:
+            return None
+        if len(self._samples) < LATENCY_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self._percentile / 100))
+        return max(HEDGE_MIN_DELAY, ordered[index])
+
+
+def is_retryable_status(status: int) -> bool:
+    return status in RETRYABLE_STATUSES or status >= 500
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the retry after `attempt` (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds requested by a Retry-After header, given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def async_hedge(primary: Awaitable[T], hedge: Callable[[], Awaitable[T]], delay: float | None,
+                      ready: Callable[[], Awaitable] | None = None,
+                      discard: Callable[[T], None] | None = None) -> T:
+    """Await `primary`, starting `hedge()` as well if it hasn't finished `delay`
+    seconds after `ready()` returns (e.g. once the request holds its slot, or
+    the end of an upload; right away if not given). The first attempt to
+    succeed wins and the other is cancelled; a result that arrives for the
+    loser anyway is passed to `discard`. If every attempt fails, the last
+    error is raised. A failure before the deadline is raised at once, so the
+    caller's backoff applies rather than an immediate duplicate.
+    """
+    pending = {asyncio.ensure_future(primary)}
+    timer = None
+    try:
+        if delay is not None:
+            async def hedge_deadline() -> None:
+                if ready is not None:
+                    await ready()
+                await asyncio.sleep(delay)
+
+            timer = asyncio.ensure_future(hedge_deadline())
+            done, _ = await asyncio.wait(pending | {timer}, return_when=asyncio.FIRST_COMPLETED)
+            if done == {timer}:
+                _LOGGER.debug("No response after %.2f s, sending a hedged request", delay)
+                pending.add(asyncio.ensure_future(hedge()))
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task.result()
+                    for other in done - {task}:
+                        if other.exception() is None and discard is not None:
+                            discard(other.result())
+                    return winner
+                error = task.exception()
+        raise error
+    finally:
+        if timer is not None:
+            timer.cancel()
+        for task in pending:
+            task.cancel()
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if not isinstance(result, BaseException) and discard is not None:
+                discard(result)
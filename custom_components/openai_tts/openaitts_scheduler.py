@@ -0,0 +1,136 @@
+"""
+Priority scheduling and rate limiting of OpenAI TTS API requests.
+"""
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from enum import IntEnum
+
+_LOGGER = logging.getLogger(__name__)
+
+# Waiting times kept per priority for the statistics.
+WAIT_HISTORY = 100
+
+
+class Priority(IntEnum):
+    """Request classes, most urgent first."""
+    INTERACTIVE = 0  # Assist replies someone is waiting for
+    ALARM = 1
+    ANNOUNCEMENT = 2  # tts.speak and other one-off messages
+    PREWARM = 3  # Filling the cache in the background
+
+
+class RequestScheduler:
+    """Hand out API request slots by priority, within a concurrency and rate limit.
+
+    A request waits until fewer than `max_concurrency` requests are running
+    and, if `rate_per_minute` is set, a token is available in a bucket that
+    refills at that rate and holds up to `max_concurrency` tokens. Waiting
+    requests are served by priority, first come first served within one, so
+    an assistant reply overtakes a queue of notifications. Lower priorities
+    only run when nothing more urgent is waiting.
+
+    Runs on the event loop; not thread-safe.
+    """
+
+    def __init__(self, max_concurrency: int, rate_per_minute: float = 0):
+        self._max_concurrency = max(1, int(max_concurrency))
+        self._rate = rate_per_minute / 60
+        self._capacity = float(self._max_concurrency)
+        self._tokens = self._capacity
+        self._refilled = time.monotonic()
+        self._running = 0
+        self._order = itertools.count()
+        self._waiters: list[tuple[Priority, int, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._waits: dict[Priority, deque[float]] = {priority: deque(maxlen=WAIT_HISTORY) for priority in Priority}
+
+    async def acquire(self, priority: Priority) -> None:
+        """Wait for a request slot; every successful call must be followed by `release`."""
+        start = time.monotonic()
+        if self._waiters or not self._try_start():
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._order), future))
+            self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we were cancelled.
+                    self.release()
+                else:
+                    self._dispatch()
+                raise
+        wait = time.monotonic() - start
+        self._waits[priority].append(wait)
+        if wait > 0.1:
+            _LOGGER.debug("%s request waited %.2f s for a slot", priority.name.lower(), wait)
+
+    def release(self) -> None:
+        """Return a slot taken with `acquire`."""
+        self._running -= 1
+        self._dispatch()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * self._rate)
+        self._refilled = now
+
+    def _try_start(self) -> bool:
+        if self._running >= self._max_concurrency:
+            return False
+        if self._rate:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+        self._running += 1
+        return True
+
+    def _dispatch(self) -> None:
+        """Start waiting requests while slots and tokens allow."""
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                # Cancelled while waiting.
+                heapq.heappop(self._waiters)
+                continue
+            if not self._try_start():
+                break
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+        if self._waiters and self._rate and self._running < self._max_concurrency and self._timer is None:
+            # Only the rate limit holds the queue up; look again when the next token is due.
+            self._timer = asyncio.get_running_loop().call_later((1 - self._tokens) / self._rate, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self) -> dict:
+        """Queue depth per priority, requests running and recent waiting times in seconds."""
+        queued = {priority.name.lower(): 0 for priority in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[priority.name.lower()] += 1
+        return {
+            "queued": queued,
+            "running": self._running,
+            "average_wait": {
+                priority.name.lower(): round(sum(waits) / len(waits), 3)
+                for priority, waits in self._waits.items() if waits
+            },
+            "max_wait": {
+                priority.name.lower(): round(max(waits), 3)
+                for priority, waits in self._waits.items() if waits
+            },
+        }
@@ -0,0 +1,92 @@
+"""
+Text segmentation helpers for OpenAI TTS.
+"""
+from __future__ import annotations
+import math
+import re
+
+# Maximum number of characters the speech endpoint accepts per request.
+MAX_INPUT_LENGTH = 4096
+
+# Sentence-ending punctuation (including CJK forms) followed by whitespace,
+# or a paragraph break.
+_SENTENCE_END = re.compile(r"(?<=[.!?…。！？])[\"'”’)\]]*\s+|\n\s*\n")
+
+
+class SentenceSplitter:
+    """Cut an incrementally arriving text stream into sentences.
+
+    Feed text as it arrives; complete sentences are returned as soon as the
+    whitespace after their closing punctuation has been seen. Sentences shorter
+    than `min_length` are merged with the next one so that we don't send tiny
+    requests (like "Sure.") whose overhead outweighs their audio.
+    """
+
+    def __init__(self, min_length: int = 20, max_length: int = MAX_INPUT_LENGTH):
+        self._buffer = ""
+        self._min_length = min_length
+        self._max_length = max_length
+
+    def feed(self, text: str) -> list[str]:
+        """Add text and return the sentences completed by it."""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            if match.end() - start < self._min_length:
+                continue
+            sentences.extend(self._limit(self._buffer[start:match.end()].strip()))
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        # Text without any punctuation must still respect the request limit.
+        while len(self._buffer) > self._max_length:
+            head, self._buffer = _split_at_whitespace(self._buffer, self._max_length)
+            sentences.append(head)
+        return [sentence for sentence in sentences if sentence]
+
+    def _limit(self, sentence: str) -> list[str]:
+        """Cut a sentence that is longer than the request limit at whitespace."""
+        pieces = []
+        while len(sentence) > self._max_length:
+            head, sentence = _split_at_whitespace(sentence, self._max_length)
+            pieces.append(head)
+        pieces.append(sentence)
+        return pieces
+
+    def flush(self) -> list[str]:
+        """Return whatever text is left once the stream has ended."""
+        remainder, self._buffer = self._buffer.strip(), ""
+        return [remainder] if remainder else []
+
+
+def split_text(text: str, max_length: int = MAX_INPUT_LENGTH) -> list[str]:
+    """Split `text` into chunks of at most `max_length` characters.
+    Chunks end at paragraph or sentence boundaries wherever possible and are
+    balanced in size, so that synthesizing them in parallel takes about as
+    long as synthesizing any single one of them.
+    """
+    text = text.strip()
+    if len(text) <= max_length:
+        return [text] if text else []
+    target = math.ceil(len(text) / math.ceil(len(text) / max_length))
+    splitter = SentenceSplitter(min_length=1, max_length=max_length)
+    sentences = splitter.feed(text) + splitter.flush()
+    chunks: list[str] = []
+    current = ""
+    for sentence in sentences:
+        candidate = f"{current} {sentence}" if current else sentence
+        if current and (len(candidate) > max_length or len(current) >= target):
+            chunks.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_at_whitespace(text: str, limit: int) -> tuple[str, str]:
+    """Split `text` at the last whitespace before `limit` (or hard at `limit`)."""
+    cut = text.rfind(" ", 0, limit)
+    if cut <= 0:
+        cut = limit
+    return text[:cut].strip(), text[cut:].lstrip()
@@ -5,18 +5,30 @@ from __future__ import annotations
 import io
 import logging
 import os
-import subprocess
-import tempfile
 import time
+import asyncio
 from asyncio import CancelledError
+from collections.abc import AsyncGenerator, Callable
+from typing import Any
 
-from homeassistant.components.tts import TextToSpeechEntity
+import voluptuous as vol
+
+from homeassistant.components.tts import (
+    ATTR_PREFERRED_FORMAT,
+    ATTR_PREFERRED_SAMPLE_BYTES,
+    ATTR_PREFERRED_SAMPLE_CHANNELS,
+    ATTR_PREFERRED_SAMPLE_RATE,
+    TextToSpeechEntity,
+    TTSAudioRequest,
+    TTSAudioResponse,
+)
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers import config_validation as cv, entity_platform
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.entity import generate_entity_id
+from homeassistant.helpers.start import async_at_started
 from .const import (
-    CONF_API_KEY,
     CONF_MODEL,
     CONF_SPEED,
     CONF_VOICE,
@@ -27,34 +39,154 @@ from .const import (
     CONF_CHIME_ENABLE,
     CONF_CHIME_SOUND,
     CONF_NORMALIZE_AUDIO,
+    CONF_NORMALIZE_ENGINE,
+    NORMALIZE_ENGINE_FFMPEG,
+    NORMALIZE_ENGINE_NUMPY,
+    CONF_AUDIO_FORMAT,
+    AUDIO_FORMATS,
+    DEFAULT_AUDIO_FORMAT,
+    CONF_MAX_CONCURRENCY,
+    DEFAULT_MAX_CONCURRENCY,
+    CONF_PREWARM_PHRASES,
+    CONF_LOCAL_SPEED,
+    ATTR_MESSAGES,
+    ATTR_PRIORITY,
+    PRIORITIES,
+    SERVICE_PREWARM,
 )
-from .openaitts_engine import OpenAITTSEngine
-from homeassistant.exceptions import MaxLengthExceeded
+from . import OpenAITTSData
+from .openaitts_audio import (
+    CHIME_DIR,
+    ENCODER_ARGS,
+    TTS_CHANNELS,
+    TTS_SAMPLE_RATE,
+    ChimeLibrary,
+    Mp3FrameFilter,
+    concat_mp3,
+    pcm_to_wav,
+    wav_stream_header,
+)
+from .openaitts_loudness import float_to_pcm16, normalize, pcm16_to_float
+from .openaitts_balancer import Endpoint
+from .openaitts_cache import OpenAITTSCache, SingleFlight, StreamFlight
+from .openaitts_engine import AudioResponse, OpenAITTSEngine
+from .openaitts_ffmpeg import FFmpegPool
+from .openaitts_scheduler import Priority, RequestScheduler
+from .openaitts_text import SentenceSplitter, split_text
+from homeassistant.exceptions import HomeAssistantError
 
 _LOGGER = logging.getLogger(__name__)
 
+# Number of sentences synthesized ahead of the one currently being played.
+STREAM_LOOKAHEAD = 3
+
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1:LRA=5"
+
+# Speed of the rendering that local speed variants are stretched from.
+BASE_SPEED = 1.0
+
+# Phrases pre-synthesized at once, and attempts per phrase before giving up.
+PREWARM_CONCURRENCY = 2
+PREWARM_ATTEMPTS = 3
+PREWARM_RETRY_DELAY = 5
+
+# Formats whose files can't simply be appended to each other.
+UNSPLITTABLE_FORMATS = ("opus", "flac")
+
+
+def _atempo_filters(tempo: float) -> list[str]:
+    """Pitch-preserving time-stretch; atempo takes factors of at least 0.5, so slower ones are chained."""
+    filters = []
+    while tempo < 0.5:
+        filters.append("atempo=0.5")
+        tempo /= 0.5
+    return filters + [f"atempo={tempo:.4f}"]
+
+
+async def _async_whole_message(message_gen: AsyncGenerator[str, None]) -> tuple[str | None, AsyncGenerator[str, None]]:
+    """Tell a message passed in one piece from one streamed as it is written
+    (e.g. token by token from an assistant). Returns the message if the
+    stream ended after its first chunk, else None, and the stream from its
+    start either way.
+    """
+    first = await anext(message_gen, None)
+    second = await anext(message_gen, None) if first is not None else None
+
+    async def replay() -> AsyncGenerator[str, None]:
+        for chunk in (first, second):
+            if chunk is not None:
+                yield chunk
+        if second is not None:
+            async for chunk in message_gen:
+                yield chunk
+
+    return (first or "") if second is None else None, replay()
+
+
+def _ffmpeg_pcm_args(audio_format: str, normalize_audio: bool, chime_path: str | None = None,
+                     tempo: float = 1.0, sample_rate: int = TTS_SAMPLE_RATE,
+                     channels: int = TTS_CHANNELS) -> list[str]:
+    """ffmpeg arguments turning API PCM on stdin into `audio_format` at
+    `sample_rate` and `channels` on stdout. A chime is joined after
+    time-stretching and normalization, so it keeps its own speed and level.
+    """
+    speech_filters = []
+    if tempo != 1.0:
+        speech_filters += _atempo_filters(tempo)
+    if normalize_audio:
+        speech_filters.append(LOUDNORM_FILTER)
+    args = []
+    if chime_path is not None:
+        args += ["-i", chime_path]
+    args += ["-f", "s16le", "-ar", str(TTS_SAMPLE_RATE), "-ac", str(TTS_CHANNELS), "-i", "pipe:0"]
+    if chime_path is not None:
+        speech_filter = ",".join(speech_filters) or "anull"
+        args += [
+            "-filter_complex", f"[1:a]{speech_filter}[speech]; [0:a][speech]concat=n=2:v=0:a=1[out]",
+            "-map", "[out]",
+        ]
+    elif speech_filters:
+        args += ["-af", ",".join(speech_filters)]
+    return args + ["-ac", str(channels), "-ar", str(sample_rate), *ENCODER_ARGS[audio_format], "pipe:1"]
+
+
 async def async_setup_entry(
     hass: HomeAssistant,
     config_entry: ConfigEntry,
     async_add_entities: AddEntitiesCallback,
 ) -> None:
-    api_key = config_entry.data.get(CONF_API_KEY)
-    engine = OpenAITTSEngine(
-        api_key,
-        config_entry.data[CONF_VOICE],
-        config_entry.data[CONF_MODEL],
-        config_entry.data.get(CONF_SPEED, 1.0),
-        config_entry.data[CONF_URL],
+    data: OpenAITTSData = hass.data[DOMAIN][config_entry.entry_id]
+    async_add_entities([OpenAITTSEntity(hass, config_entry, data.engine, data.cache, data.ffmpeg, data.scheduler)])
+
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        SERVICE_PREWARM,
+        {
+            vol.Required(ATTR_MESSAGES): vol.All(cv.ensure_list, [cv.string]),
+            vol.Optional(CONF_VOICE): cv.string,
+            vol.Optional(CONF_SPEED): vol.All(vol.Coerce(float), vol.Range(min=0.25, max=4.0)),
+            vol.Optional(CONF_CHIME_ENABLE): cv.boolean,
+            vol.Optional(CONF_INSTRUCTIONS): cv.string,
+            vol.Optional(CONF_AUDIO_FORMAT): vol.In(AUDIO_FORMATS),
+        },
+        "async_prewarm",
     )
-    async_add_entities([OpenAITTSEntity(hass, config_entry, engine)])
 
 class OpenAITTSEntity(TextToSpeechEntity):
     _attr_has_entity_name = True
     _attr_should_poll = False
 
-    def __init__(self, hass: HomeAssistant, config: ConfigEntry, engine: OpenAITTSEngine) -> None:
+    def __init__(self, hass: HomeAssistant, config: ConfigEntry, engine: OpenAITTSEngine,
+                 cache: OpenAITTSCache | None = None, ffmpeg: FFmpegPool | None = None,
+                 scheduler: RequestScheduler | None = None) -> None:
         self.hass = hass
         self._engine = engine
+        self._scheduler = scheduler
+        self._cache = cache
+        self._ffmpeg = ffmpeg or FFmpegPool(hass)
+        self._inflight = SingleFlight(hass)
+        self._streams = StreamFlight(hass)
+        self._chimes = ChimeLibrary()
         self._config = config
         self._attr_unique_id = config.data.get(UNIQUE_ID)
         if not self._attr_unique_id:
@@ -62,13 +194,62 @@ class OpenAITTSEntity(TextToSpeechEntity):
         base_name = self._config.data.get(CONF_MODEL, "").upper()
         self.entity_id = generate_entity_id("tts.openai_tts_{}", base_name.lower(), hass=hass)
 
+    async def async_added_to_hass(self) -> None:
+        """Prepare the configured chime and ffmpeg so the first message doesn't pay for them."""
+        await super().async_added_to_hass()
+        audio_format = self._audio_format({})
+        chime_enabled = self._config.options.get(CONF_CHIME_ENABLE, self._config.data.get(CONF_CHIME_ENABLE, False))
+        normalize_audio = self._config.options.get(CONF_NORMALIZE_AUDIO, self._config.data.get(CONF_NORMALIZE_AUDIO, False))
+        chime_file = self._config.options.get(CONF_CHIME_SOUND, self._config.data.get(CONF_CHIME_SOUND, "threetone.mp3"))
+        ffmpeg_normalize = normalize_audio and not self._uses_numpy_normalization()
+        tempo = 1.0
+        if self._uses_local_speed():
+            tempo = float(self._config.options.get(CONF_SPEED, self._config.data.get(CONF_SPEED, 1.0))) / BASE_SPEED
+        if ffmpeg_normalize or tempo != 1.0:
+            chime_path = os.path.join(CHIME_DIR, chime_file) if chime_enabled else None
+            await self.hass.async_add_executor_job(
+                self._ffmpeg.prestart, _ffmpeg_pcm_args(audio_format, ffmpeg_normalize, chime_path, tempo)
+            )
+        api_format = "pcm" if self._uses_local_speed() else self._api_format(audio_format, chime_enabled, normalize_audio, 1, False)
+        prepare = self._chimes.get if api_format == "mp3" else self._chimes.get_pcm
+        self.hass.async_create_background_task(
+            self.hass.async_add_executor_job(prepare, chime_file),
+            f"{DOMAIN} prepare chime {chime_file}",
+        )
+
+        phrases = [
+            line.strip()
+            for line in (self._config.options.get(CONF_PREWARM_PHRASES) or "").splitlines()
+            if line.strip()
+        ]
+        if phrases and self._cache is not None:
+            async def prewarm_at_start(hass: HomeAssistant) -> None:
+                self._config.async_create_background_task(
+                    hass, self._async_prewarm(phrases, {}), f"{DOMAIN} prewarm startup phrases"
+                )
+            self.async_on_remove(async_at_started(self.hass, prewarm_at_start))
+
     @property
     def default_language(self) -> str:
         return "en"
 
     @property
     def supported_options(self) -> list:
-        return ["instructions", "chime"]
+        # The preferred_* options are how Home Assistant tells us what the
+        # media player or satellite wants; delivering that saves a conversion.
+        # Audio is always 16-bit, the only sample size Home Assistant asks for.
+        return [
+            "instructions", "chime", CONF_VOICE, CONF_SPEED, CONF_AUDIO_FORMAT, ATTR_PRIORITY,
+            ATTR_PREFERRED_FORMAT, ATTR_PREFERRED_SAMPLE_RATE, ATTR_PREFERRED_SAMPLE_CHANNELS,
+            ATTR_PREFERRED_SAMPLE_BYTES,
+        ]
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        """Queue depth and waiting times of the API request scheduler."""
+        if self._scheduler is None:
+            return None
+        return self._scheduler.stats()
         
     @property
     def supported_languages(self) -> list:
@@ -86,10 +267,11 @@ class OpenAITTSEntity(TextToSpeechEntity):
     def name(self) -> str:
         return self._config.data.get(CONF_MODEL, "").upper()
 
-    def get_tts_audio(
-        self, message: str, language: str, options: dict | None = None
+    async def async_get_tts_audio(
+        self, message: str, language: str, options: dict | None = None,
     ) -> tuple[str, bytes] | tuple[None, None]:
         overall_start = time.monotonic()
+        options = options or {}
 
         _LOGGER.debug(" -------------------------------------------")
         _LOGGER.debug("|  OpenAI TTS                               |")
@@ -97,165 +279,560 @@ class OpenAITTSEntity(TextToSpeechEntity):
         _LOGGER.debug(" -------------------------------------------")
 
         try:
-            if len(message) > 4096:
-                raise MaxLengthExceeded("Message exceeds maximum allowed length")
             # Retrieve settings.
-            current_speed = self._config.options.get(CONF_SPEED, self._config.data.get(CONF_SPEED, 1.0))
-            effective_voice = self._config.options.get(CONF_VOICE, self._config.data.get(CONF_VOICE))
+            current_speed = options.get(CONF_SPEED, self._config.options.get(CONF_SPEED, self._config.data.get(CONF_SPEED, 1.0)))
+            effective_voice = options.get(CONF_VOICE, self._config.options.get(CONF_VOICE, self._config.data.get(CONF_VOICE)))
             instructions = options.get(CONF_INSTRUCTIONS, self._config.options.get(CONF_INSTRUCTIONS, self._config.data.get(CONF_INSTRUCTIONS)))
             _LOGGER.debug("Effective speed: %s", current_speed)
             _LOGGER.debug("Effective voice: %s", effective_voice)
             _LOGGER.debug("Instructions: %s", instructions)
 
-            _LOGGER.debug("Creating TTS API request")
-            api_start = time.monotonic()
-            speech = self._engine.get_tts(message, speed=current_speed, voice=effective_voice, instructions=instructions)
-            api_duration = (time.monotonic() - api_start) * 1000
-            _LOGGER.debug("TTS API call completed in %.2f ms", api_duration)
-            audio_content = speech.content
+            # Identical concurrent requests (e.g. one announcement on several
+            # speakers) share a single API call and post-processing pass.
+            request_key = self._cache_key(message, options, current_speed, effective_voice, instructions)
+            return await self._inflight.async_run(
+                request_key,
+                lambda: self._async_generate_audio(
+                    message, options, current_speed, effective_voice, instructions, overall_start
+                ),
+            )
+        except CancelledError:
+            _LOGGER.debug("async_get_tts_audio cancelled")
+            raise
+        except Exception as e:
+            _LOGGER.exception("Unknown error in async_get_tts_audio")
+        return None, None
+
+    async def async_prewarm(self, messages: list[str], **options: Any) -> None:
+        """Service call: synthesize `messages` into the audio cache in the background.
+        The options (voice, speed, chime, ...) must match those of the later
+        tts.speak calls for them to be served from the cache.
+        """
+        if self._cache is None:
+            raise HomeAssistantError("Pre-synthesizing phrases needs the audio cache; set a cache size above 0")
+        self._config.async_create_background_task(
+            self.hass, self._async_prewarm(messages, options), f"{DOMAIN} prewarm"
+        )
+
+    async def _async_prewarm(self, messages: list[str], options: dict) -> None:
+        """Make sure every message is in the cache and pinned there.
+        Phrases are synthesized a few at a time and retried with a growing delay,
+        so a slow or failing API at that moment only postpones them.
+        """
+        semaphore = asyncio.Semaphore(PREWARM_CONCURRENCY)
+        # Queued behind everything else, so warming the cache never delays a live message.
+        prewarm_options = {**options, ATTR_PRIORITY: Priority.PREWARM.name.lower()}
+        current_speed = options.get(CONF_SPEED, self._config.options.get(CONF_SPEED, self._config.data.get(CONF_SPEED, 1.0)))
+        effective_voice = options.get(CONF_VOICE, self._config.options.get(CONF_VOICE, self._config.data.get(CONF_VOICE)))
+        instructions = options.get(CONF_INSTRUCTIONS, self._config.options.get(CONF_INSTRUCTIONS, self._config.data.get(CONF_INSTRUCTIONS)))
+
+        async def warm(message: str) -> bool:
+            request_key = self._cache_key(message, options, current_speed, effective_voice, instructions)
+
+            def key_for(endpoint: Endpoint) -> str:
+                return self._cache_key(message, options, current_speed, effective_voice, instructions, endpoint)
+
+            async with semaphore:
+                for attempt in range(PREWARM_ATTEMPTS):
+                    try:
+                        if await self.hass.async_add_executor_job(self._cache_pin, key_for):
+                            return True
+                        _, audio = await self._inflight.async_run(
+                            request_key,
+                            lambda: self._async_generate_audio(
+                                message, prewarm_options, current_speed, effective_voice, instructions,
+                                time.monotonic()
+                            ),
+                        )
+                        if audio is not None and await self.hass.async_add_executor_job(self._cache_pin, key_for):
+                            return True
+                    except Exception as err:
+                        _LOGGER.debug("Pre-synthesizing %r failed on attempt %d: %s", message, attempt + 1, err)
+                    await asyncio.sleep(PREWARM_RETRY_DELAY * 2 ** attempt)
+            _LOGGER.warning("Could not pre-synthesize %r", message)
+            return False
+
+        start = time.monotonic()
+        results = await asyncio.gather(*(warm(message) for message in messages))
+        _LOGGER.debug("Pre-synthesized %d of %d phrases in %.2f s", sum(results), len(results), time.monotonic() - start)
+
+    async def _async_generate_audio(
+        self, message: str, options: dict, current_speed: float,
+        effective_voice: str, instructions: str | None, overall_start: float,
+    ) -> tuple[str, bytes] | tuple[None, None]:
+        """Produce the final audio for a request, from the cache or the API."""
+        def key_for(endpoint: Endpoint) -> str:
+            return self._cache_key(message, options, current_speed, effective_voice, instructions, endpoint)
+
+        if self._cache is not None:
+            cached = await self.hass.async_add_executor_job(self._cache_get, key_for)
+            if cached is not None:
+                _LOGGER.debug("Serving TTS audio from cache (%.2f ms)", (time.monotonic() - overall_start) * 1000)
+                return cached[1]
+
+        audio_format = self._audio_format(options)
+        chime_enabled = options.get(CONF_CHIME_ENABLE, self._config.options.get(CONF_CHIME_ENABLE, self._config.data.get(CONF_CHIME_ENABLE, False)))
+        normalize_audio = self._config.options.get(CONF_NORMALIZE_AUDIO, self._config.data.get(CONF_NORMALIZE_AUDIO, False))
+        priority = self._priority(options)
+        tempo = 1.0
+        if self._uses_local_speed():
+            # One rendering at the base speed serves every speed.
+            response_format = "pcm"
+            audio_content, endpoint = await self._async_base_speech(message, effective_voice, instructions, priority)
+            tempo = float(current_speed) / BASE_SPEED
+        else:
+            chunks = split_text(message)
+            response_format = self._api_format(
+                audio_format, chime_enabled, normalize_audio, len(chunks), self._resamples(options)
+            )
+            audio_content, endpoint = await self._async_synthesize(
+                chunks, current_speed, effective_voice, instructions, response_format, priority
+            )
+        _LOGGER.debug("Delivering %s from %s audio (tempo %.2f)", audio_format, response_format, tempo)
+
+        extension, audio = await self._async_post_process(
+            audio_content, response_format, audio_format, options, overall_start, tempo
+        )
+        if self._cache is not None and audio is not None and endpoint is not None:
+            try:
+                await self.hass.async_add_executor_job(self._cache.put, key_for(endpoint), extension, audio)
+            except OSError as err:
+                _LOGGER.warning("Could not store TTS audio in cache: %s", err)
+        return extension, audio
+
+    async def _async_synthesize(
+        self, chunks: list[str], speed: float, voice: str, instructions: str | None, response_format: str,
+        priority: Priority = Priority.ANNOUNCEMENT,
+    ) -> tuple[bytes, Endpoint | None]:
+        """Synthesize the chunks of a message in parallel and join the audio.
+        Also returns the endpoint that rendered it, or None if the chunks came
+        from different endpoints.
+        """
+        max_concurrency = int(self._config.options.get(CONF_MAX_CONCURRENCY, self._config.data.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)))
+        semaphore = asyncio.Semaphore(max_concurrency)
+        if len(chunks) > 1:
+            _LOGGER.debug("Message split into %d chunks (max %d in parallel)", len(chunks), max_concurrency)
+
+        async def synthesize(chunk: str) -> AudioResponse:
+            async with semaphore:
+                return await self._engine.async_get_tts(chunk, speed=speed, voice=voice, instructions=instructions,
+                                                        response_format=response_format, priority=priority)
+
+        _LOGGER.debug("Creating TTS API request")
+        api_start = time.monotonic()
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(synthesize(chunk)) for chunk in chunks]
+        speeches = [task.result() for task in tasks]
+        parts = [speech.content for speech in speeches]
+        endpoint = speeches[0].endpoint
+        if any(speech.endpoint is not endpoint for speech in speeches):
+            endpoint = None
+        if len(parts) == 1:
+            audio_content = parts[0]
+        elif response_format == "mp3":
+            audio_content = concat_mp3(parts)
+        else:
+            # Raw PCM and ADTS (AAC) frames can be appended as they are.
+            audio_content = b"".join(parts)
+        api_duration = (time.monotonic() - api_start) * 1000
+        _LOGGER.debug("TTS API call completed in %.2f ms", api_duration)
+        return audio_content, endpoint
+
+    async def _async_base_speech(self, message: str, voice: str, instructions: str | None,
+                                 priority: Priority = Priority.ANNOUNCEMENT) -> tuple[bytes, Endpoint | None]:
+        """Raw PCM of `message` at the base speed, from the cache or the API,
+        and the endpoint that rendered it (None if several did).
+        """
+        def key_for(endpoint: Endpoint) -> str:
+            return OpenAITTSCache.make_key(
+                url=endpoint.url,
+                model=endpoint.model,
+                voice=voice,
+                speed=BASE_SPEED,
+                instructions=instructions if endpoint.model == "gpt-4o-mini-tts" else None,
+                response_format="pcm",
+                text=message,
+            )
+
+        async def fetch() -> tuple[bytes, Endpoint | None]:
+            if self._cache is not None:
+                cached = await self.hass.async_add_executor_job(self._cache_get, key_for)
+                if cached is not None:
+                    _LOGGER.debug("Using cached base-speed rendering")
+                    endpoint, (_, pcm) = cached
+                    return pcm, endpoint
+            pcm, endpoint = await self._async_synthesize(
+                split_text(message), BASE_SPEED, voice, instructions, "pcm", priority
+            )
+            if self._cache is not None and endpoint is not None:
+                try:
+                    await self.hass.async_add_executor_job(self._cache.put, key_for(endpoint), "pcm", pcm)
+                except OSError as err:
+                    _LOGGER.warning("Could not store base-speed TTS audio in cache: %s", err)
+            return pcm, endpoint
+
+        # Different speeds of one message requested together share the rendering.
+        return await self._inflight.async_run(key_for(self._engine.endpoints[0]), fetch)
 
+    @staticmethod
+    def _priority(options: dict, default: Priority = Priority.ANNOUNCEMENT) -> Priority:
+        """Scheduling class of a request: the per-call `priority` option, else `default`."""
+        if options.get(ATTR_PRIORITY) in PRIORITIES:
+            return Priority[options[ATTR_PRIORITY].upper()]
+        return default
+
+    def _uses_local_speed(self) -> bool:
+        """Whether speed is applied by time-stretching a base-speed rendering instead of by the API."""
+        return bool(self._config.options.get(CONF_LOCAL_SPEED, self._config.data.get(CONF_LOCAL_SPEED, False)))
+
+    def _audio_format(self, options: dict) -> str:
+        """Format to deliver: the per-call choice, else what the player prefers, else the entity setting."""
+        for audio_format in (options.get(CONF_AUDIO_FORMAT), options.get(ATTR_PREFERRED_FORMAT)):
+            if isinstance(audio_format, str) and audio_format.lower() in AUDIO_FORMATS:
+                return audio_format.lower()
+        return self._config.options.get(CONF_AUDIO_FORMAT, self._config.data.get(CONF_AUDIO_FORMAT, DEFAULT_AUDIO_FORMAT))
+
+    @staticmethod
+    def _output_layout(options: dict) -> tuple[int, int]:
+        """Sample rate and channel count to deliver: what the player prefers, else the API's own."""
+        sample_rate = options.get(ATTR_PREFERRED_SAMPLE_RATE)
+        channels = options.get(ATTR_PREFERRED_SAMPLE_CHANNELS)
+        return int(sample_rate or TTS_SAMPLE_RATE), int(channels or TTS_CHANNELS)
+
+    def _resamples(self, options: dict) -> bool:
+        """Whether the audio has to be delivered at another sample rate or channel count than the API's."""
+        return self._output_layout(options) != (TTS_SAMPLE_RATE, TTS_CHANNELS)
+
+    @staticmethod
+    def _api_format(audio_format: str, chime_enabled: bool, normalize_audio: bool, chunks: int,
+                    resample: bool) -> str:
+        """Format to request from the API so that the audio is encoded at most once.
+        The API's own encoding is used whenever nothing needs to change it.
+        Otherwise we ask for raw PCM, which post-processing works on directly
+        and ffmpeg encodes a single time, resampled on the way if needed.
+        """
+        if resample:
+            return "pcm"
+        if audio_format == "wav":
+            # The API's WAV header doesn't carry the length; we write our own.
+            return "pcm"
+        if normalize_audio:
+            return "pcm"
+        if chime_enabled and audio_format != "mp3":
+            return "pcm"
+        if chunks > 1 and audio_format in UNSPLITTABLE_FORMATS:
+            return "pcm"
+        return audio_format
+
+    def _uses_numpy_normalization(self) -> bool:
+        """Whether loudness normalization is enabled and runs in-process instead of in ffmpeg."""
+        normalize_audio = self._config.options.get(CONF_NORMALIZE_AUDIO, self._config.data.get(CONF_NORMALIZE_AUDIO, False))
+        normalize_engine = self._config.options.get(CONF_NORMALIZE_ENGINE, self._config.data.get(CONF_NORMALIZE_ENGINE, NORMALIZE_ENGINE_FFMPEG))
+        return bool(normalize_audio) and normalize_engine == NORMALIZE_ENGINE_NUMPY
+
+    def _cache_key(self, message: str, options: dict, speed: float, voice: str, instructions: str | None,
+                   endpoint: Endpoint | None = None) -> str:
+        """Key for the final audio as rendered by `endpoint` (the entry's own by
+        default): everything that changes what comes out of get_tts_audio.
+        Values are normalized first, so a speed of 1 from a service call and
+        1.0 from the options share an entry.
+        """
+        if endpoint is None:
+            endpoint = self._engine.endpoints[0]
+        chime_enabled = bool(options.get(CONF_CHIME_ENABLE, self._config.options.get(CONF_CHIME_ENABLE, self._config.data.get(CONF_CHIME_ENABLE, False))))
+        normalize_audio = bool(self._config.options.get(CONF_NORMALIZE_AUDIO, self._config.data.get(CONF_NORMALIZE_AUDIO, False)))
+        sample_rate, channels = self._output_layout(options)
+        return OpenAITTSCache.make_key(
+            url=endpoint.url,
+            model=endpoint.model,
+            voice=voice,
+            speed=float(speed),
+            instructions=instructions if endpoint.model == "gpt-4o-mini-tts" else None,
+            chime=chime_enabled,
+            chime_sound=self._config.options.get(CONF_CHIME_SOUND, self._config.data.get(CONF_CHIME_SOUND, "threetone.mp3")) if chime_enabled else None,
+            normalize=normalize_audio,
+            normalize_engine=self._config.options.get(CONF_NORMALIZE_ENGINE, self._config.data.get(CONF_NORMALIZE_ENGINE, NORMALIZE_ENGINE_FFMPEG)) if normalize_audio else None,
+            audio_format=self._audio_format(options),
+            sample_rate=sample_rate,
+            channels=channels,
+            local_speed=self._uses_local_speed(),
+            text=message,
+        )
+
+    def _cache_get(self, key_for: Callable[[Endpoint], str]) -> tuple[Endpoint, tuple[str, bytes]] | None:
+        """Look the audio up under the key of every endpoint, as any of them may
+        have rendered it; returns the endpoint and the cached audio. Blocks.
+        """
+        for endpoint in self._engine.endpoints:
+            cached = self._cache.get(key_for(endpoint))
+            if cached is not None:
+                return endpoint, cached
+        return None
+
+    def _cache_pin(self, key_for: Callable[[Endpoint], str]) -> bool:
+        """Pin the cached audio, whichever endpoint rendered it. Blocks."""
+        return any(self._cache.pin(key_for(endpoint)) for endpoint in self._engine.endpoints)
+
+    def async_supports_streaming_input(self) -> bool:
+        """Accept the message as a text stream (e.g. from a streaming conversation agent)."""
+        return True
+
+    async def async_stream_tts_audio(self, request: TTSAudioRequest) -> TTSAudioResponse:
+        """Stream audio to Home Assistant while the message is still arriving.
+        The incoming text is cut into sentences and every sentence is synthesized
+        as soon as it is complete, a few sentences ahead of playback; the one
+        being played is passed on chunk by chunk as the API sends it. Formats
+        whose files can't be appended to each other and audio that has to be
+        resampled are requested as PCM and encoded by one ffmpeg process for
+        the whole message. Chime, normalization and local speed need the
+        complete audio, so in that case the buffered path is used and its
+        result is yielded in one piece.
+        """
+        options = request.options or {}
+        chime_enabled = options.get(CONF_CHIME_ENABLE, self._config.options.get(CONF_CHIME_ENABLE, self._config.data.get(CONF_CHIME_ENABLE, False)))
+        normalize_audio = self._config.options.get(CONF_NORMALIZE_AUDIO, self._config.data.get(CONF_NORMALIZE_AUDIO, False))
+        audio_format = self._audio_format(options)
+
+        if chime_enabled or normalize_audio or self._uses_local_speed():
+            async def buffered_gen() -> AsyncGenerator[bytes, None]:
+                parts = [chunk async for chunk in request.message_gen]
+                # Someone is waiting for a reply that is streamed as it is written.
+                priority = Priority.INTERACTIVE if len(parts) > 1 else Priority.ANNOUNCEMENT
+                _, audio = await self.async_get_tts_audio(
+                    "".join(parts), request.language, {ATTR_PRIORITY: priority.name.lower(), **options}
+                )
+                if audio is None:
+                    raise HomeAssistantError("Failed to generate TTS audio")
+                yield audio
+            return TTSAudioResponse(audio_format, buffered_gen())
+
+        current_speed = options.get(CONF_SPEED, self._config.options.get(CONF_SPEED, self._config.data.get(CONF_SPEED, 1.0)))
+        effective_voice = options.get(CONF_VOICE, self._config.options.get(CONF_VOICE, self._config.data.get(CONF_VOICE)))
+        instructions = options.get(CONF_INSTRUCTIONS, self._config.options.get(CONF_INSTRUCTIONS, self._config.data.get(CONF_INSTRUCTIONS)))
+        transcode = audio_format in UNSPLITTABLE_FORMATS or self._resamples(options)
+        response_format = "pcm" if transcode else self._api_format(audio_format, False, False, 1, False)
+        sample_rate, channels = self._output_layout(options)
+        _LOGGER.debug("Streaming TTS audio (speed: %s, voice: %s, format: %s)", current_speed, effective_voice, audio_format)
+
+        def synthesize(sentence: str, priority: Priority) -> tuple[asyncio.Task, asyncio.Queue[bytes | None]]:
+            """Start streaming a sentence from the API into a queue of audio
+            chunks, ended by None. The task returns the endpoint that rendered
+            it and raises what went wrong.
+            """
+            chunks: asyncio.Queue[bytes | None] = asyncio.Queue()
+            served: list[Endpoint] = []
+            # The same sentence streamed to several players at once is requested once.
+            sentence_key = OpenAITTSCache.make_key(
+                text=sentence, voice=effective_voice, speed=float(current_speed), instructions=instructions,
+                response_format=response_format,
+            )
+
+            async def receive() -> Endpoint:
+                try:
+                    async for chunk in self._streams.async_stream(
+                        sentence_key,
+                        lambda on_open: self._engine.async_stream_tts(
+                            sentence, speed=current_speed, voice=effective_voice, instructions=instructions,
+                            response_format=response_format, priority=priority, on_open=on_open,
+                        ),
+                        on_open=served.append,
+                    ):
+                        chunks.put_nowait(chunk)
+                finally:
+                    chunks.put_nowait(None)
+                return served[0]
+
+            return self.hass.async_create_task(receive()), chunks
+
+        async def stream_gen() -> AsyncGenerator[bytes, None]:
+            stream_start = time.monotonic()
+            message, message_gen = await _async_whole_message(request.message_gen)
+            # Someone is waiting for a reply that is streamed as it is written;
+            # a message passed in one piece is an announcement like any other.
+            priority = self._priority(options, Priority.ANNOUNCEMENT if message is not None else Priority.INTERACTIVE)
+
+            # A message in one piece may be in the cache (e.g. pre-synthesized);
+            # if not, what is streamed is stored for next time.
+            def key_for(endpoint: Endpoint) -> str:
+                return self._cache_key(message, options, current_speed, effective_voice, instructions, endpoint)
+
+            cacheable = self._cache is not None and message is not None
+            if cacheable:
+                cached = await self.hass.async_add_executor_job(self._cache_get, key_for)
+                if cached is not None:
+                    _LOGGER.debug("Serving streamed TTS audio from cache (%.2f ms)", (time.monotonic() - stream_start) * 1000)
+                    yield cached[1][1]
+                    return
+            audio = bytearray()
+            endpoints: set[Endpoint] = set()
+            # Sentences in message order, each streaming into its own queue;
+            # the semaphore bounds how many are requested ahead of the one
+            # currently being played. That one is passed on chunk by chunk,
+            # the later ones are buffered until it is their turn.
+            pending: asyncio.Queue[tuple[asyncio.Task, asyncio.Queue[bytes | None]] | None] = asyncio.Queue()
+            lookahead = asyncio.Semaphore(STREAM_LOOKAHEAD)
+
+            async def schedule(sentence: str) -> None:
+                await lookahead.acquire()
+                pending.put_nowait(synthesize(sentence, priority))
+
+            async def split_sentences() -> None:
+                splitter = SentenceSplitter()
+                try:
+                    async for text in message_gen:
+                        for sentence in splitter.feed(text):
+                            await schedule(sentence)
+                    for sentence in splitter.flush():
+                        await schedule(sentence)
+                finally:
+                    pending.put_nowait(None)
+
+            async def speech() -> AsyncGenerator[bytes, None]:
+                """The API's audio, sentence after sentence."""
+                splitter_task = self.hass.async_create_task(split_sentences())
+                current = None
+                try:
+                    while (current := await pending.get()) is not None:
+                        sentence_task, chunks = current
+                        # Per-sentence tags and Xing frames would end up mid-stream.
+                        frames = Mp3FrameFilter() if response_format == "mp3" else None
+                        while (chunk := await chunks.get()) is not None:
+                            if frames is not None:
+                                chunk = frames.feed(chunk)
+                            if chunk:
+                                yield chunk
+                        # Surface errors raised while synthesizing the sentence.
+                        endpoints.add(await sentence_task)
+                        lookahead.release()
+                    # Surface errors raised while reading the message stream.
+                    await splitter_task
+                finally:
+                    splitter_task.cancel()
+                    if current is not None:
+                        current[0].cancel()
+                    while not pending.empty():
+                        if (queued := pending.get_nowait()) is not None:
+                            queued[0].cancel()
+
+            output = speech()
+            if transcode:
+                # One encoder for the whole message, so its stream runs on
+                # across sentences.
+                output = self._ffmpeg.async_stream(
+                    _ffmpeg_pcm_args(audio_format, False, None, 1.0, sample_rate, channels), output
+                )
+            if audio_format == "wav":
+                yield wav_stream_header(sample_rate, channels)
+            first_chunk = True
+            try:
+                async for chunk in output:
+                    if first_chunk:
+                        first_chunk = False
+                        _LOGGER.debug("First audio chunk after %.2f ms", (time.monotonic() - stream_start) * 1000)
+                    if cacheable:
+                        audio += chunk
+                    yield chunk
+            finally:
+                await output.aclose()
+            _LOGGER.debug("TTS stream completed in %.2f ms", (time.monotonic() - stream_start) * 1000)
+            # Audio put together from more than one endpoint isn't cached.
+            if cacheable and audio and len(endpoints) == 1:
+                if audio_format == "wav":
+                    audio = pcm_to_wav(bytes(audio), sample_rate, channels)
+                try:
+                    await self.hass.async_add_executor_job(
+                        self._cache.put, key_for(endpoints.pop()), audio_format, bytes(audio)
+                    )
+                except OSError as err:
+                    _LOGGER.warning("Could not store TTS audio in cache: %s", err)
+
+        return TTSAudioResponse(audio_format, stream_gen())
+
+    async def _async_post_process(
+        self, audio_content: bytes, api_format: str, audio_format: str, options: dict, overall_start: float,
+        tempo: float = 1.0,
+    ) -> tuple[str, bytes] | tuple[None, None]:
+        """Apply time-stretching, chime and loudness normalization, delivering `audio_format`.
+        Audio the API already returned in `audio_format` is passed through (an
+        MP3 chime is joined at the frame level). PCM is post-processed as is
+        and then encoded once, by ffmpeg over stdin/stdout, or wrapped as WAV.
+        Blocking steps run on the executor; ffmpeg jobs queue for the pool.
+        """
+        try:
             # Retrieve options.
             chime_enabled = options.get(CONF_CHIME_ENABLE,self._config.options.get(CONF_CHIME_ENABLE, self._config.data.get(CONF_CHIME_ENABLE, False)))
             normalize_audio = self._config.options.get(CONF_NORMALIZE_AUDIO, self._config.data.get(CONF_NORMALIZE_AUDIO, False))
+            chime_file = self._config.options.get(CONF_CHIME_SOUND, self._config.data.get(CONF_CHIME_SOUND, "threetone.mp3"))
+            chime_path = os.path.join(CHIME_DIR, chime_file)
             _LOGGER.debug("Chime enabled: %s", chime_enabled)
             _LOGGER.debug("Normalization option: %s", normalize_audio)
 
-            if chime_enabled:
-                # Write TTS audio to a temp file.
-                with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tts_file:
-                    tts_file.write(audio_content)
-                    tts_path = tts_file.name
-                _LOGGER.debug("TTS audio written to temp file: %s", tts_path)
-
-                # Determine chime file path.
-                chime_file = self._config.options.get(CONF_CHIME_SOUND, self._config.data.get(CONF_CHIME_SOUND, "threetone.mp3"))
-                chime_path = os.path.join(os.path.dirname(__file__), "chime", chime_file)
-                _LOGGER.debug("Using chime file at: %s", chime_path)
-
-                # Create a temporary output file.
-                with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as out_file:
-                    merged_output_path = out_file.name
-
-                if normalize_audio:
-                    _LOGGER.debug("Both chime and normalization enabled; " +
-                                  "using filter_complex to normalize TTS audio and merge with chime in one pass.")
-                    # Use filter_complex to normalize the TTS audio and then concatenate with the chime.
-                    # First input: chime audio, second input: TTS audio (to be normalized).
-                    cmd = [
-                        "ffmpeg",
-                        "-y",
-                        "-i", chime_path,
-                        "-i", tts_path,
-                        "-filter_complex", "[1:a]loudnorm=I=-16:TP=-1:LRA=5[tts_norm]; [0:a][tts_norm]concat=n=2:v=0:a=1[out]",
-                        "-map", "[out]",
-                        "-ac", "1",
-                        "-ar", "24000",
-                        "-b:a", "128k",
-                        "-preset", "superfast",
-                        "-threads", "4",
-                        merged_output_path,
-                    ]
-                    _LOGGER.debug("Executing ffmpeg command: %s", " ".join(cmd))
-                    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if api_format != "pcm":
+                if chime_enabled:
+                    merged_audio = await self.hass.async_add_executor_job(
+                        self._chimes.prepend, chime_file, audio_content
+                    )
+                    if merged_audio is not None:
+                        _LOGGER.debug("Chime prepended at the MP3 frame level.")
+                    else:
+                        _LOGGER.debug("Chime doesn't match the TTS audio format; merging %s via ffmpeg.", chime_path)
+                        merged_audio = await self._ffmpeg.async_run([
+                            "-i", chime_path,
+                            "-f", "mp3",
+                            "-i", "pipe:0",
+                            "-filter_complex", "[0:a][1:a]concat=n=2:v=0:a=1[out]",
+                            "-map", "[out]",
+                            "-ac", "1",
+                            "-ar", "24000",
+                            *ENCODER_ARGS["mp3"],
+                            "pipe:1",
+                        ], audio_content)
+                    audio_content = merged_audio
                 else:
-                    _LOGGER.debug("Chime enabled without normalization; merging using concat method.")
-                    # Create a file list for concatenation.
-                    with tempfile.NamedTemporaryFile(mode="w", delete=False) as list_file:
-                        list_file.write(f"file '{chime_path}'\n")
-                        list_file.write(f"file '{tts_path}'\n")
-                        list_path = list_file.name
-                    _LOGGER.debug("FFmpeg file list created: %s", list_path)
-                    cmd = [
-                        "ffmpeg",
-                        "-y",
-                        "-f", "concat",
-                        "-safe", "0",
-                        "-i", list_path,
-                        "-ac", "1",
-                        "-ar", "24000",
-                        "-b:a", "128k",
-                        "-preset", "superfast",
-                        "-threads", "4",
-                        merged_output_path,
-                    ]
-                    _LOGGER.debug("Executing ffmpeg command: %s", " ".join(cmd))
-                    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    try:
-                        os.remove(list_path)
-                    except Exception:
-                        pass
-
-                with open(merged_output_path, "rb") as merged_file:
-                    final_audio = merged_file.read()
+                    _LOGGER.debug("Chime and normalization disabled; returning the API's %s audio.", audio_format)
                 overall_duration = (time.monotonic() - overall_start) * 1000
                 _LOGGER.debug("Overall TTS processing time: %.2f ms", overall_duration)
-                # Cleanup temporary files.
-                try:
-                    os.remove(tts_path)
-                    os.remove(merged_output_path)
-                except Exception:
-                    pass
-                return "mp3", final_audio
-
-            else:
-                # Chime disabled.
-                if normalize_audio:
-                    _LOGGER.debug("Normalization enabled without chime; processing TTS audio via ffmpeg.")
-                    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tts_file:
-                        tts_file.write(audio_content)
-                        norm_input_path = tts_file.name
-                    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as out_file:
-                        norm_output_path = out_file.name
-                    cmd = [
-                        "ffmpeg",
-                        "-y",
-                        "-i", norm_input_path,
-                        "-ac", "1",
-                        "-ar", "24000",
-                        "-b:a", "128k",
-                        "-preset", "superfast",
-                        "-threads", "4",
-                        "-af", "loudnorm=I=-16:TP=-1:LRA=5",
-                        norm_output_path,
-                    ]
-                    _LOGGER.debug("Executing ffmpeg command: %s", " ".join(cmd))
-                    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    with open(norm_output_path, "rb") as norm_file:
-                        normalized_audio = norm_file.read()
-                    overall_duration = (time.monotonic() - overall_start) * 1000
-                    _LOGGER.debug("Overall TTS processing time: %.2f ms", overall_duration)
-                    try:
-                        os.remove(norm_input_path)
-                        os.remove(norm_output_path)
-                    except Exception:
-                        pass
-                    return "mp3", normalized_audio
+                return audio_format, audio_content
+
+            sample_rate, channels = self._output_layout(options)
+            ffmpeg_normalize = normalize_audio and not self._uses_numpy_normalization()
+            if normalize_audio and not ffmpeg_normalize:
+                _LOGGER.debug("Normalizing TTS audio in-process.")
+                audio_content = await self.hass.async_add_executor_job(self._normalize_pcm, audio_content)
+
+            # Unless ffmpeg filters the speech, the chime is prepended as PCM;
+            # otherwise ffmpeg joins the chime file after the filters.
+            ffmpeg_filters = ffmpeg_normalize or tempo != 1.0
+            ffmpeg_chime = None
+            if chime_enabled:
+                chime = None
+                if not ffmpeg_filters:
+                    chime = await self.hass.async_add_executor_job(self._chimes.get_pcm, chime_file)
+                if chime is not None:
+                    audio_content = chime + audio_content
+                elif ffmpeg_filters or audio_format != "wav":
+                    ffmpeg_chime = chime_path
                 else:
-                    _LOGGER.debug("Chime and normalization disabled; returning TTS MP3 audio only.")
-                    overall_duration = (time.monotonic() - overall_start) * 1000
-                    _LOGGER.debug("Overall TTS processing time: %.2f ms", overall_duration)
-                    return "mp3", audio_content
-
-        except CancelledError as ce:
-            _LOGGER.exception("TTS task cancelled")
-            return None, None
-        except MaxLengthExceeded as mle:
-            _LOGGER.exception("Maximum message length exceeded")
+                    _LOGGER.warning("Chime %s could not be decoded; playing the speech without it", chime_file)
+
+            if ffmpeg_filters or ffmpeg_chime or audio_format != "wav" or self._resamples(options):
+                _LOGGER.debug("Encoding TTS audio to %s at %d Hz, %d channel(s) via ffmpeg.",
+                              audio_format, sample_rate, channels)
+                audio_content = await self._ffmpeg.async_run(
+                    _ffmpeg_pcm_args(audio_format, ffmpeg_normalize, ffmpeg_chime, tempo, sample_rate, channels),
+                    audio_content,
+                )
+            if audio_format == "wav":
+                audio_content = pcm_to_wav(audio_content, sample_rate, channels)
+
+            overall_duration = (time.monotonic() - overall_start) * 1000
+            _LOGGER.debug("Overall TTS processing time: %.2f ms", overall_duration)
+            return audio_format, audio_content
+
         except Exception as e:
-            _LOGGER.exception("Unknown error in get_tts_audio")
+            _LOGGER.exception("Unknown error while post-processing TTS audio")
         return None, None
 
-    async def async_get_tts_audio(
-        self, message: str, language: str, options: dict | None = None,
-    ) -> tuple[str, bytes] | tuple[None, None]:
-        from functools import partial
-        import asyncio
-        try:
-            return await asyncio.shield(
-                self.hass.async_add_executor_job(
-                    partial(self.get_tts_audio, message, language, options=options)
-                )
-            )
-        except asyncio.CancelledError:
-            _LOGGER.exception("async_get_tts_audio cancelled")
-            raise
+    @staticmethod
+    def _normalize_pcm(pcm: bytes) -> bytes:
+        return float_to_pcm16(normalize(pcm16_to_float(pcm), TTS_SAMPLE_RATE))
@@ -0,0 +1,104 @@
+"""Tests for frame-level MP3 editing and the chime library."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from custom_components.openai_tts.openaitts_audio import (
+    ChimeLibrary,
+    Mp3FrameFilter,
+    concat_mp3,
+    iter_frames,
+    parse_frame_header,
+    strip_mp3_metadata,
+)
+
+# MPEG-2 layer III, 32 kbit/s, 24 kHz, mono: what the API sends.
+HEADER = bytes([0xFF, 0xF3, 0x44, 0xC0])
+FRAME_LENGTH = 96
+
+
+def _frame(fill: int) -> bytes:
+    return HEADER + bytes([fill]) * (FRAME_LENGTH - 4)
+
+
+def _xing_frame() -> bytes:
+    # The tag follows the 9 bytes of side information of a mono MPEG-2 frame.
+    return (HEADER + bytes(9) + b"Xing").ljust(FRAME_LENGTH, b"\0")
+
+
+def _id3v2(body: bytes) -> bytes:
+    size = len(body)
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + syncsafe + body
+
+
+def _mp3(*fills: int) -> bytes:
+    """A file as an encoder writes it: ID3v2 tag, Xing frame, audio, ID3v1 tag."""
+    return _id3v2(b"TIT2 title" * 20) + _xing_frame() + b"".join(map(_frame, fills)) + b"TAG".ljust(128, b"\0")
+
+
+def test_frame_header():
+    header = parse_frame_header(_frame(1))
+    assert (header.sample_rate, header.channels, header.length) == (24000, 1, FRAME_LENGTH)
+    assert parse_frame_header(b"ID3\x04") is None
+
+
+def test_strip_removes_tags_and_info_frame():
+    assert strip_mp3_metadata(_mp3(1, 2, 3)) == _frame(1) + _frame(2) + _frame(3)
+
+
+def test_strip_leaves_data_without_frames_alone():
+    assert strip_mp3_metadata(b"not audio") == b"not audio"
+
+
+@pytest.mark.parametrize("size", [1, 7, 10, 50, FRAME_LENGTH, FRAME_LENGTH + 1, 1000])
+def test_filter_passes_frames_split_across_chunks(size):
+    data = _mp3(1, 2, 3, 4)
+    frames = Mp3FrameFilter()
+    output = [frames.feed(data[start:start + size]) for start in range(0, len(data), size)]
+    assert b"".join(output) == _frame(1) + _frame(2) + _frame(3) + _frame(4)
+    # Every frame is passed on whole, as soon as it is complete.
+    assert all(len(chunk) % FRAME_LENGTH == 0 for chunk in output)
+
+
+def test_filter_waits_for_a_split_frame_header():
+    frames = Mp3FrameFilter()
+    data = _frame(1) + _frame(2)
+    assert frames.feed(data[:FRAME_LENGTH + 2]) == _frame(1)
+    assert frames.feed(data[FRAME_LENGTH + 2:]) == _frame(2)
+
+
+def test_concat_keeps_frame_alignment():
+    joined = concat_mp3([_mp3(1, 2), _mp3(3), _mp3(4, 5)])
+    assert joined == b"".join(map(_frame, (1, 2, 3, 4, 5)))
+    # The frames follow each other with nothing in between.
+    offsets = [offset for offset, _ in iter_frames(joined)]
+    assert offsets == [index * FRAME_LENGTH for index in range(5)]
+
+
+def test_chime_transcode_only_holds_up_the_same_chime(monkeypatch):
+    loads = []
+    release = threading.Event()
+
+    def load(name, sample_rate, channels):
+        loads.append(name)
+        if name == "slow.mp3":
+            # A transcode of this chime runs until released.
+            release.wait(5)
+        return name.encode()
+
+    monkeypatch.setattr(ChimeLibrary, "_load", staticmethod(load))
+    chimes = ChimeLibrary()
+    with ThreadPoolExecutor(4) as executor:
+        slow = [executor.submit(chimes.get, "slow.mp3") for _ in range(2)]
+        time.sleep(0.05)
+        start = time.monotonic()
+        assert chimes.get("fast.mp3") == b"fast.mp3"
+        assert time.monotonic() - start < 1
+        assert not any(future.done() for future in slow)
+        release.set()
+        assert [future.result() for future in slow] == [b"slow.mp3"] * 2
+    # Each chime is prepared once.
+    assert sorted(loads) == ["fast.mp3", "slow.mp3"]
@@ -0,0 +1,240 @@
+"""Tests for the persistent TTS audio cache and request coalescing."""
+import asyncio
+import json
+
+from custom_components.openai_tts.openaitts_cache import OpenAITTSCache, SingleFlight, StreamFlight
+
+
+def _cache(tmp_path, max_bytes=30) -> OpenAITTSCache:
+    cache = OpenAITTSCache(str(tmp_path), max_bytes)
+    cache.load()
+    return cache
+
+
+def test_make_key_ignores_parameter_order():
+    assert OpenAITTSCache.make_key(voice="nova", speed=1.0) == OpenAITTSCache.make_key(speed=1.0, voice="nova")
+    assert OpenAITTSCache.make_key(voice="nova", speed=1.0) != OpenAITTSCache.make_key(voice="nova", speed=1.5)
+
+
+def test_get_returns_stored_audio(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("a", "mp3", b"0123456789")
+    assert cache.get("a") == ("mp3", b"0123456789")
+    assert cache.get("b") is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = _cache(tmp_path)
+    for key in "abc":
+        cache.put(key, "mp3", b"0123456789")
+    cache.get("a")
+    cache.put("d", "mp3", b"0123456789")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.get("d") is not None
+
+
+def test_pinned_entries_are_not_evicted(tmp_path):
+    cache = _cache(tmp_path)
+    for key in "abc":
+        cache.put(key, "mp3", b"0123456789")
+    assert cache.pin("a")
+    cache.put("d", "mp3", b"0123456789")
+    cache.put("e", "mp3", b"0123456789")
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is None
+
+
+def test_pin_missing_key(tmp_path):
+    assert not _cache(tmp_path).pin("a")
+
+
+def test_replacing_keeps_pin(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("a", "mp3", b"0123456789", pinned=True)
+    cache.put("a", "wav", b"01234")
+    for key in "bcd":
+        cache.put(key, "mp3", b"0123456789")
+    assert cache.get("a") == ("wav", b"01234")
+    assert not (tmp_path / "a.mp3").exists()
+
+
+def test_audio_over_budget_is_not_stored(tmp_path):
+    cache = _cache(tmp_path, max_bytes=5)
+    cache.put("a", "mp3", b"0123456789")
+    assert cache.get("a") is None
+
+
+def test_survives_reload(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("a", "mp3", b"0123456789", pinned=True)
+    cache.put("b", "mp3", b"0123456789")
+    (tmp_path / "b.mp3").unlink()
+    cache.flush()
+
+    reloaded = _cache(tmp_path)
+    assert reloaded.get("a") == ("mp3", b"0123456789")
+    assert reloaded.get("b") is None
+    for key in "cde":
+        reloaded.put(key, "mp3", b"0123456789")
+    assert reloaded.get("a") is not None
+
+
+class _Hass:
+    """The part of Home Assistant SingleFlight uses."""
+
+    def async_create_task(self, coro):
+        return asyncio.get_running_loop().create_task(coro)
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        flight = SingleFlight(_Hass())
+        results = await asyncio.gather(*(flight.async_run("key", work) for _ in range(3)))
+        assert results == [1, 1, 1]
+        # Finished work isn't shared with later calls.
+        assert await flight.async_run("key", work) == 2
+        assert await flight.async_run("other", work) == 3
+
+    asyncio.run(run())
+
+
+def test_single_flight_survives_a_cancelled_caller():
+    async def work():
+        await asyncio.sleep(0.01)
+        return "audio"
+
+    async def run():
+        flight = SingleFlight(_Hass())
+        first = asyncio.create_task(flight.async_run("key", work))
+        second = asyncio.create_task(flight.async_run("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "audio"
+
+    asyncio.run(run())
+
+
+def test_single_flight_shares_errors():
+    async def work():
+        await asyncio.sleep(0)
+        raise ValueError("failed")
+
+    async def run():
+        flight = SingleFlight(_Hass())
+        results = await asyncio.gather(*(flight.async_run("key", work) for _ in range(2)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(run())
+
+
+async def _chunks(opened, parts, calls, error=None):
+    calls.append(1)
+    opened("endpoint")
+    for part in parts:
+        await asyncio.sleep(0)
+        yield part
+    if error is not None:
+        raise error
+
+
+def test_stream_flight_replays_to_late_readers():
+    calls = []
+
+    async def read(flight, late):
+        # A late reader joins after the first chunks have arrived.
+        for _ in range(3 if late else 0):
+            await asyncio.sleep(0)
+        opened = []
+        chunks = [chunk async for chunk in flight.async_stream(
+            "key", lambda on_open: _chunks(on_open, [b"a", b"b", b"c", b"d"], calls), on_open=opened.append
+        )]
+        return opened, chunks
+
+    async def run():
+        flight = StreamFlight(_Hass())
+        results = await asyncio.gather(read(flight, False), read(flight, True), read(flight, False))
+        assert calls == [1]
+        assert all(result == (["endpoint"], [b"a", b"b", b"c", b"d"]) for result in results)
+
+    asyncio.run(run())
+
+
+def test_stream_flight_shares_errors():
+    async def read(flight):
+        return [chunk async for chunk in flight.async_stream(
+            "key", lambda on_open: _chunks(on_open, [b"a"], [], ValueError("failed"))
+        )]
+
+    async def run():
+        flight = StreamFlight(_Hass())
+        results = await asyncio.gather(read(flight), read(flight), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(run())
+
+
+def test_stream_flight_cancels_the_stream_when_the_last_reader_leaves():
+    closed = []
+
+    async def endless(opened):
+        try:
+            while True:
+                await asyncio.sleep(0)
+                yield b"x"
+        finally:
+            closed.append(1)
+
+    async def run():
+        flight = StreamFlight(_Hass())
+        first = flight.async_stream("key", endless)
+        second = flight.async_stream("key", endless)
+        await anext(first)
+        await anext(second)
+        await first.aclose()
+        await asyncio.sleep(0.01)
+        assert not closed
+        await second.aclose()
+        await asyncio.sleep(0.01)
+        assert closed == [1]
+
+    asyncio.run(run())
+
+
+def _index(tmp_path) -> dict:
+    return json.loads((tmp_path / "index.json").read_text())
+
+
+def test_index_writes_are_batched(tmp_path):
+    cache = _cache(tmp_path, max_bytes=1000)
+    cache.put("a", "mp3", b"0123456789")
+    # The first change is written right away, the ones after it with the next flush.
+    assert set(_index(tmp_path)) == {"a"}
+    cache.put("b", "mp3", b"0123456789")
+    cache.pin("a")
+    assert set(_index(tmp_path)) == {"a"}
+    cache.flush()
+    assert set(_index(tmp_path)) == {"a", "b"}
+    assert _index(tmp_path)["a"]["pinned"]
+
+
+def test_load_removes_unindexed_files(tmp_path):
+    cache = _cache(tmp_path, max_bytes=1000)
+    cache.put("a", "mp3", b"0123456789")
+    cache.put("b", "mp3", b"0123456789")
+    # Left behind by a crash: stored after the last index write, and a partial write.
+    (tmp_path / "c.mp3.tmp").write_bytes(b"01234")
+
+    reloaded = _cache(tmp_path, max_bytes=1000)
+    assert reloaded.get("a") is not None
+    assert reloaded.get("b") is None
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.mp3", "index.json"]
@@ -0,0 +1,58 @@
+"""Tests for choosing the STT upload format."""
+import pytest
+
+from custom_components.openai_stt.openaistt_codec import (
+    FLAC,
+    MAX_LOSSLESS_BACKLOG,
+    OPUS,
+    WAV,
+    UploadFormat,
+    choose_format,
+)
+
+# 16 kHz, 16-bit mono.
+PCM_BYTES_PER_SECOND = 32000
+REALTIME_KBPS = PCM_BYTES_PER_SECOND * 8 / 1000
+# Just above or below a boundary.
+NUDGE = 1.001
+
+
+def _uplink_for_backlog(upload_format: UploadFormat, seconds: float, backlog: float) -> float:
+    """The uplink (kbit/s) at which `upload_format` leaves `backlog` seconds to send."""
+    size = upload_format.estimated_size(PCM_BYTES_PER_SECOND * seconds, seconds)
+    return size * 8 / 1000 / (seconds + backlog - upload_format.startup_time)
+
+
+def _wav_flac(seconds: float) -> float:
+    """Where PCM's backlog equals FLAC's encoder start-up."""
+    return _uplink_for_backlog(WAV, seconds, FLAC.startup_time)
+
+
+def _flac_opus(seconds: float) -> float:
+    """Where FLAC's backlog reaches MAX_LOSSLESS_BACKLOG."""
+    return _uplink_for_backlog(FLAC, seconds, MAX_LOSSLESS_BACKLOG)
+
+
+@pytest.mark.parametrize(("seconds", "uplink_kbps", "expected"), [
+    # PCM as fast as it is recorded, or faster.
+    (3.0, REALTIME_KBPS, WAV),
+    (30.0, 10 * REALTIME_KBPS, WAV),
+    # PCM only falls behind by less than FLAC takes to start.
+    (10.0, _wav_flac(10.0) * NUDGE, WAV),
+    (10.0, _wav_flac(10.0) / NUDGE, FLAC),
+    (1.0, _wav_flac(1.0) * NUDGE, WAV),
+    (1.0, _wav_flac(1.0) / NUDGE, FLAC),
+    # FLAC is kept as long as it leaves at most MAX_LOSSLESS_BACKLOG.
+    (10.0, _flac_opus(10.0) * NUDGE, FLAC),
+    (10.0, _flac_opus(10.0) / NUDGE, OPUS),
+    (1.0, _flac_opus(1.0) * NUDGE, FLAC),
+    (1.0, _flac_opus(1.0) / NUDGE, OPUS),
+    # Short utterances stay lossless on slower links.
+    (0.5, 100, FLAC),
+    (10.0, 100, OPUS),
+    # Opus even where it falls behind too.
+    (10.0, 8, OPUS),
+])
+def test_choose_format(seconds, uplink_kbps, expected):
+    assert choose_format(seconds, PCM_BYTES_PER_SECOND, uplink_kbps) is expected
+
@@ -0,0 +1,139 @@
+"""Tests for the STT request dispatcher."""
+import asyncio
+import time
+
+import pytest
+
+from custom_components.openai_stt.openaistt_dispatcher import (
+    DEFAULT_SERVICE_TIME,
+    DeadlineExceeded,
+    DispatchStats,
+    STTDispatcher,
+)
+
+
+def _later(seconds: float = 60):
+    deadline = time.monotonic() + seconds
+    return lambda: deadline
+
+
+def test_slots_go_round_robin_over_sources():
+    async def run():
+        dispatcher = STTDispatcher(1)
+        order = []
+
+        async def request(source: str, name: str):
+            async def job():
+                order.append(name)
+                await asyncio.sleep(0.01)
+            await dispatcher.async_run(source, _later(), job)
+
+        blocker = asyncio.create_task(request("kitchen", "kitchen 0"))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(request("kitchen", f"kitchen {i}")) for i in range(1, 4)]
+        tasks += [asyncio.create_task(request("office", f"office {i}")) for i in range(1, 3)]
+        tasks.append(asyncio.create_task(request("hall", "hall 1")))
+        await asyncio.sleep(0)
+        assert dispatcher.queued() == 6
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    assert asyncio.run(run()) == [
+        "kitchen 0", "kitchen 1", "office 1", "hall 1", "kitchen 2", "office 2", "kitchen 3",
+    ]
+
+
+def test_requests_without_source_are_queued_on_their_own():
+    async def run():
+        dispatcher = STTDispatcher(1)
+        order = []
+
+        async def request(source, name: str):
+            async def job():
+                order.append(name)
+                await asyncio.sleep(0.01)
+            await dispatcher.async_run(source, _later(), job)
+
+        blocker = asyncio.create_task(request("kitchen", "kitchen 0"))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(request("kitchen", f"kitchen {i}")) for i in range(1, 3)]
+        tasks += [asyncio.create_task(request(None, f"anonymous {i}")) for i in range(1, 3)]
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    assert asyncio.run(run()) == ["kitchen 0", "kitchen 1", "anonymous 1", "anonymous 2", "kitchen 2"]
+
+
+def test_concurrency_cap():
+    async def run():
+        dispatcher = STTDispatcher(2)
+        running = peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(dispatcher.async_run(f"source {i % 3}", _later(), job) for i in range(8)))
+        return peak
+
+    assert asyncio.run(run()) == 2
+
+
+def test_request_that_cannot_make_its_deadline_is_not_started():
+    async def run():
+        dispatcher = STTDispatcher(1)
+        started = []
+
+        async def job():
+            started.append(1)
+
+        with pytest.raises(DeadlineExceeded):
+            await dispatcher.async_run("kitchen", _later(DEFAULT_SERVICE_TIME / 2), job)
+        return started
+
+    assert asyncio.run(run()) == []
+
+
+def test_queued_request_is_dropped_once_its_deadline_is_out_of_reach():
+    async def run():
+        dispatcher = STTDispatcher(1)
+
+        async def slow():
+            await asyncio.sleep(0.2)
+
+        async def fast():
+            return "text"
+
+        blocker = asyncio.create_task(dispatcher.async_run("kitchen", _later(), slow))
+        await asyncio.sleep(0)
+        # Enough time when queued, but not once the running request is done.
+        tight = asyncio.create_task(dispatcher.async_run("office", _later(DEFAULT_SERVICE_TIME + 0.1), fast))
+        relaxed = asyncio.create_task(dispatcher.async_run("hall", _later(), fast))
+        await blocker
+        with pytest.raises(DeadlineExceeded):
+            await tight
+        return await relaxed
+
+    assert asyncio.run(run()) == "text"
+
+
+def test_stats_and_service_time():
+    async def run():
+        dispatcher = STTDispatcher(1)
+        stats = DispatchStats()
+        ready = time.monotonic() + 0.05
+
+        async def job():
+            await asyncio.sleep(0.1)
+
+        # The input is complete halfway through the job, so only the second half counts.
+        await dispatcher.async_run("kitchen", _later(), job, stats, lambda: ready)
+        return dispatcher, stats
+
+    dispatcher, stats = asyncio.run(run())
+    assert stats.queue_delay < 0.01
+    assert 0.04 < stats.service_time < 0.09
+    assert dispatcher.service_time < DEFAULT_SERVICE_TIME
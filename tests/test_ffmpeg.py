@@ -0,0 +1,69 @@
+"""Tests for the ffmpeg process pool."""
+import asyncio
+import math
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from custom_components.openai_tts.openaitts_ffmpeg import FFmpegPool
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+PCM_ARGS = ["-f", "s16le", "-ar", "24000", "-ac", "1", "-i", "pipe:0"]
+
+
+class _Hass:
+    """The part of Home Assistant the pool uses."""
+
+    def async_add_executor_job(self, target, *args):
+        return asyncio.get_running_loop().run_in_executor(None, target, *args)
+
+
+def _tone(seconds: float) -> bytes:
+    samples = int(24000 * seconds)
+    return struct.pack(f"<{samples}h", *(int(8000 * math.sin(2 * math.pi * 440 * i / 24000)) for i in range(samples)))
+
+
+async def _chunks(audio: bytes, size: int = 4800, error: Exception | None = None):
+    for start in range(0, len(audio), size):
+        await asyncio.sleep(0)
+        yield audio[start:start + size]
+    if error is not None:
+        raise error
+
+
+def test_stream_resamples_as_the_audio_arrives():
+    async def run():
+        pool = FFmpegPool(_Hass(), workers=1)
+        output = [chunk async for chunk in pool.async_stream(
+            [*PCM_ARGS, "-ar", "16000", "-f", "s16le", "pipe:1"], _chunks(_tone(1.0))
+        )]
+        # The worker is free again.
+        assert await pool.async_run([*PCM_ARGS, "-f", "s16le", "pipe:1"], _tone(0.1)) == _tone(0.1)
+        return b"".join(output)
+
+    assert abs(len(asyncio.run(run())) - 16000 * 2) <= 64
+
+
+def test_stream_raises_errors_of_the_input():
+    async def run():
+        pool = FFmpegPool(_Hass(), workers=1)
+        with pytest.raises(ValueError):
+            async for _ in pool.async_stream(
+                [*PCM_ARGS, "-f", "s16le", "pipe:1"], _chunks(_tone(0.5), error=ValueError("API failed"))
+            ):
+                pass
+
+    asyncio.run(run())
+
+
+def test_stream_raises_when_ffmpeg_fails():
+    async def run():
+        pool = FFmpegPool(_Hass(), workers=1)
+        with pytest.raises(subprocess.CalledProcessError):
+            async for _ in pool.async_stream([*PCM_ARGS, "-c:a", "no-such-codec", "pipe:1"], _chunks(_tone(0.5))):
+                pass
+
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+"""Tests for the in-process loudness normalization."""
+import math
+
+import numpy as np
+import pytest
+
+from custom_components.openai_tts.openaitts_loudness import (
+    TARGET_LOUDNESS,
+    TARGET_TRUE_PEAK,
+    integrated_loudness,
+    limit,
+    normalize,
+    true_peak,
+)
+
+SAMPLE_RATE = 24000
+# Loudness is stated to 0.1 LU, as ffmpeg's loudnorm reports it.
+TOLERANCE = 0.1
+
+
+def _sine(amplitude: float, seconds: float, frequency: float = 997.0) -> np.ndarray:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * frequency * t)
+
+
+def test_full_scale_sine_measures_as_specified():
+    # BS.1770: a 0 dBFS 997 Hz sine in one channel reads -3.01 LKFS.
+    assert integrated_loudness(_sine(1.0, 3.0), SAMPLE_RATE) == pytest.approx(-3.01, abs=TOLERANCE)
+
+
+@pytest.mark.parametrize("amplitude", [0.01, 0.1, 0.3])
+def test_normalize_reaches_the_target(amplitude):
+    normalized = normalize(_sine(amplitude, 3.0), SAMPLE_RATE)
+    assert integrated_loudness(normalized, SAMPLE_RATE) == pytest.approx(TARGET_LOUDNESS, abs=TOLERANCE)
+    assert true_peak(normalized) <= TARGET_TRUE_PEAK
+
+
+def test_normalize_limits_the_true_peak():
+    # Speech-like: quiet with short loud bursts, so the gain pushes the bursts over the ceiling.
+    samples = _sine(0.05, 3.0, 220.0)
+    samples[SAMPLE_RATE:SAMPLE_RATE + 480] = _sine(0.9, 0.02, 3000.0)
+    normalized = normalize(samples, SAMPLE_RATE, target_loudness=-10.0)
+    assert true_peak(normalized) <= TARGET_TRUE_PEAK
+
+
+@pytest.mark.parametrize("frequency", [100.0, 5000.0, 11000.0])
+def test_limit_keeps_the_true_peak_below_the_ceiling(frequency):
+    # Inter-sample peaks near Nyquist are where sample peaks mislead.
+    samples = _sine(1.5, 1.0, frequency)
+    limited = limit(samples, SAMPLE_RATE, TARGET_TRUE_PEAK)
+    assert true_peak(limited) <= TARGET_TRUE_PEAK
+    # Only what is over the ceiling is taken off.
+    assert true_peak(limited) >= TARGET_TRUE_PEAK - 1.0
+
+
+def test_limit_leaves_quiet_audio_alone():
+    samples = _sine(0.5, 1.0)
+    assert limit(samples, SAMPLE_RATE, TARGET_TRUE_PEAK) is samples
+
+
+@pytest.mark.parametrize("samples", [
+    np.zeros(SAMPLE_RATE * 2),
+    np.array([]),
+    _sine(0.01, 0.39),
+], ids=["silence", "empty", "shorter than a block"])
+def test_unmeasurable_audio_is_returned_unchanged(samples):
+    assert math.isinf(integrated_loudness(samples, SAMPLE_RATE))
+    assert normalize(samples, SAMPLE_RATE) is samples
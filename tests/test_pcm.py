@@ -0,0 +1,114 @@
+"""Tests for the STT PCM front end."""
+import itertools
+
+import numpy as np
+import pytest
+
+from custom_components.openai_stt.openaistt_pcm import (
+    PCMFormat,
+    PCMNormalizer,
+    PolyphaseResampler,
+    decode_pcm,
+    encode_pcm16,
+    parse_wav_header,
+    wav_header,
+)
+
+
+def _tone(frequency: float, sample_rate: int, seconds: float = 0.5) -> np.ndarray:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def _resample_in_chunks(samples: np.ndarray, source: int, target: int, sizes: list[int]) -> np.ndarray:
+    resampler = PolyphaseResampler(source, target)
+    parts = []
+    start = 0
+    for index in itertools.count():
+        if start >= len(samples):
+            break
+        size = sizes[index % len(sizes)]
+        parts.append(resampler.process(samples[start:start + size]))
+        start += size
+    parts.append(resampler.flush())
+    return np.concatenate(parts)
+
+
+@pytest.mark.parametrize(("source", "target"), [(48000, 16000), (44100, 16000), (8000, 16000), (16000, 24000)])
+def test_chunked_resampling_matches_one_shot(source, target):
+    samples = _tone(440, source)
+    resampler = PolyphaseResampler(source, target)
+    whole = np.concatenate([resampler.process(samples), resampler.flush()])
+    assert len(whole) == -(-len(samples) * target // source)
+    chunked = _resample_in_chunks(samples, source, target, [1, 7, 160, 3, 1024])
+    np.testing.assert_allclose(chunked, whole, atol=1e-6)
+
+
+@pytest.mark.parametrize(("source", "target"), [(48000, 16000), (44100, 16000), (8000, 16000)])
+def test_resampling_keeps_a_tone(source, target):
+    output = _resample_in_chunks(_tone(440, source), source, target, [480])
+    expected = _tone(440, target)[:len(output)]
+    # Away from the edges the output is the same tone at the new rate.
+    middle = slice(len(output) // 4, 3 * len(output) // 4)
+    np.testing.assert_allclose(output[middle], expected[middle], atol=2e-3)
+
+
+def test_downsampling_removes_what_would_fold_back():
+    output = _resample_in_chunks(_tone(12000, 48000), 48000, 16000, [480])
+    assert np.max(np.abs(output[100:-100])) < 1e-3
+
+
+@pytest.mark.parametrize("pcm_format", [
+    PCMFormat(16000, 8), PCMFormat(16000, 16, 2), PCMFormat(16000, 24), PCMFormat(16000, 32),
+    PCMFormat(16000, 32, 1, True),
+])
+def test_decode_pcm(pcm_format):
+    samples = np.array([0.0, 0.5, -0.5, -1.0], np.float32)
+    if pcm_format.is_float:
+        data = samples.astype("<f4").tobytes()
+    elif pcm_format.bits_per_sample == 8:
+        data = (samples * 128 + 128).astype(np.uint8).tobytes()
+    else:
+        scale = 2 ** (pcm_format.bits_per_sample - 1)
+        values = (samples * scale).astype(np.int64)
+        width = pcm_format.bits_per_sample // 8
+        data = b"".join(int(value).to_bytes(width, "little", signed=True) for value in values)
+    # The same sample on every channel.
+    data = np.repeat(np.frombuffer(data, np.uint8).reshape(4, -1), pcm_format.channels, axis=0).tobytes()
+    decoded = decode_pcm(data, pcm_format)
+    assert decoded.shape == (4, pcm_format.channels)
+    np.testing.assert_allclose(decoded[:, 0], samples, atol=1 / 128)
+
+
+def test_wav_header_round_trip():
+    pcm_format = PCMFormat(48000, 24, 2)
+    assert parse_wav_header(wav_header(pcm_format, 1000) + b"audio") == (pcm_format, 44)
+    assert parse_wav_header(wav_header(pcm_format)[:30]) is None
+
+
+def _normalize(data: bytes, pcm_format: PCMFormat, chunk: int) -> bytes:
+    normalizer = PCMNormalizer(pcm_format)
+    output = b"".join(normalizer.process(data[i:i + chunk]) for i in range(0, len(data), chunk))
+    return output + normalizer.flush()
+
+
+def test_normalizer_downmixes_and_resamples_across_odd_chunks():
+    left = _tone(440, 48000)
+    stereo = np.stack([left, left], axis=1).ravel()
+    data = encode_pcm16(stereo)
+    expected = _normalize(encode_pcm16(left), PCMFormat(48000), len(data))
+    # Chunks that split frames and samples give the same audio.
+    assert _normalize(data, PCMFormat(48000, 16, 2), 1001) == expected
+    assert len(expected) == 2 * len(left) // 3
+
+
+def test_normalizer_reads_the_wav_header():
+    audio = encode_pcm16(_tone(440, 8000))
+    data = wav_header(PCMFormat(8000)) + audio
+    assert _normalize(data, PCMFormat(16000), 5) == _normalize(audio, PCMFormat(8000), 5)
+
+
+def test_normalizer_passes_target_format_through():
+    audio = encode_pcm16(_tone(440, 16000))
+    normalizer = PCMNormalizer(PCMFormat(16000))
+    assert normalizer.process(audio[:100]) + normalizer.process(audio[100:]) + normalizer.flush() == audio
@@ -0,0 +1,164 @@
+"""Tests for realtime transcription against a local WebSocket server."""
+import asyncio
+import base64
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from homeassistant.exceptions import HomeAssistantError
+
+from custom_components.openai_stt.openaistt_audio import AudioBuffer, AudioStreamError
+from custom_components.openai_stt.openaistt_realtime import REALTIME_SAMPLE_RATE, RealtimeTranscriber
+
+
+class _Server:
+    """A minimal realtime transcription endpoint: transcribes every commit as
+    the number of audio bytes appended, in two deltas, unless told to fail.
+    """
+
+    def __init__(self, fail: bool = False, stale: bool = False):
+        self.fail = fail
+        # Send the events of another item before the commit is acknowledged.
+        self.stale = stale
+        self.connections = 0
+        self.events: list[dict] = []
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.connections += 1
+        appended = 0
+        async for message in websocket:
+            event = json.loads(message.data)
+            self.events.append(event)
+            if event["type"] == "input_audio_buffer.clear":
+                appended = 0
+            elif event["type"] == "input_audio_buffer.append":
+                appended += len(base64.b64decode(event["audio"]))
+            elif event["type"] == "input_audio_buffer.commit":
+                if self.fail:
+                    await websocket.send_json({"type": "error", "error": {"message": "nope"}})
+                    continue
+                item = f"item{len(self.events)}"
+                if self.stale:
+                    for kind, field in (("delta", "delta"), ("completed", "transcript")):
+                        await websocket.send_json({
+                            "type": f"conversation.item.input_audio_transcription.{kind}",
+                            "item_id": "earlier", field: "stale",
+                        })
+                await websocket.send_json({"type": "input_audio_buffer.committed", "item_id": item})
+                for delta in ("bytes ", str(appended)):
+                    await websocket.send_json({
+                        "type": "conversation.item.input_audio_transcription.delta", "item_id": item, "delta": delta,
+                    })
+                await websocket.send_json({
+                    "type": "conversation.item.input_audio_transcription.completed",
+                    "item_id": item, "transcript": f"bytes {appended}",
+                })
+        return websocket
+
+    def count(self, kind: str) -> int:
+        return sum(1 for event in self.events if event["type"] == kind)
+
+
+async def _with_transcriber(server: _Server, test):
+    app = web.Application()
+    app.router.add_get("/realtime", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        async with aiohttp.ClientSession() as session:
+            transcriber = RealtimeTranscriber(session, f"http://127.0.0.1:{port}/realtime", "key", "model")
+            try:
+                return await test(transcriber)
+            finally:
+                await transcriber.async_close()
+    finally:
+        await runner.cleanup()
+
+
+def _audio(seconds: float, sample_rate: int = 16000, error: BaseException | None = None) -> AudioBuffer:
+    audio = AudioBuffer()
+    samples = int(seconds * sample_rate)
+    for start in range(0, samples, 320):
+        audio.append(b"\0\0" * min(320, samples - start))
+    audio.finish(error)
+    return audio
+
+
+def test_transcribes_with_partials_at_the_realtime_rate():
+    server = _Server()
+    partials = []
+
+    async def test(transcriber):
+        return await transcriber.async_transcribe(_audio(0.5), 16000, "en", partials.append)
+
+    text = asyncio.run(_with_transcriber(server, test))
+    assert text == f"bytes {REALTIME_SAMPLE_RATE}"
+    assert partials == ["bytes ", text]
+    update = next(event for event in server.events if event["type"] == "transcription_session.update")
+    assert update["session"]["input_audio_transcription"] == {"model": "model", "language": "en"}
+
+
+def test_session_is_reused():
+    server = _Server()
+
+    async def test(transcriber):
+        return [await transcriber.async_transcribe(_audio(0.1), 16000, "en") for _ in range(3)]
+
+    assert asyncio.run(_with_transcriber(server, test)) == [f"bytes {REALTIME_SAMPLE_RATE // 5}"] * 3
+    assert server.connections == 1
+    assert server.count("transcription_session.update") == 1
+    assert server.count("input_audio_buffer.clear") == 3
+
+
+def test_language_change_reconfigures_the_session():
+    server = _Server()
+
+    async def test(transcriber):
+        await transcriber.async_transcribe(_audio(0.1), 16000, "en")
+        await transcriber.async_transcribe(_audio(0.1), 16000, "de")
+
+    asyncio.run(_with_transcriber(server, test))
+    assert server.connections == 1
+    assert server.count("transcription_session.update") == 2
+
+
+def test_server_error_fails_and_drops_the_session():
+    server = _Server(fail=True)
+
+    async def test(transcriber):
+        for _ in range(2):
+            with pytest.raises(HomeAssistantError, match="nope"):
+                await transcriber.async_transcribe(_audio(0.1), 16000)
+
+    asyncio.run(_with_transcriber(server, test))
+    assert server.connections == 2
+
+
+def test_failed_audio_stream_is_not_committed():
+    server = _Server()
+
+    async def test(transcriber):
+        with pytest.raises(AudioStreamError):
+            await transcriber.async_transcribe(_audio(0.1, error=ConnectionResetError()), 16000)
+
+    asyncio.run(_with_transcriber(server, test))
+    assert server.count("input_audio_buffer.commit") == 0
+
+
+def test_events_of_other_items_are_ignored():
+    server = _Server(stale=True)
+    partials = []
+
+    async def test(transcriber):
+        return await transcriber.async_transcribe(_audio(0.5), 16000, None, partials.append)
+
+    text = asyncio.run(_with_transcriber(server, test))
+    assert text == f"bytes {REALTIME_SAMPLE_RATE}"
+    assert partials == ["bytes ", text]
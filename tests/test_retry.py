@@ -0,0 +1,133 @@
+"""Tests for the retry and hedging policy (the STT copy is kept identical)."""
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+from custom_components.openai_tts.openaitts_retry import (
+    BACKOFF_MAX,
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_MIN_DELAY,
+    LATENCY_MIN_SAMPLES,
+    LatencyTracker,
+    async_hedge,
+    backoff_delay,
+    is_retryable_status,
+    parse_retry_after,
+)
+
+
+async def _answer(value, after: float, log: list | None = None):
+    await asyncio.sleep(after)
+    if log is not None:
+        log.append(value)
+    if isinstance(value, Exception):
+        raise value
+    return value
+
+
+def test_hedge_delay():
+    assert LatencyTracker(0).hedge_delay() is None
+    tracker = LatencyTracker(90)
+    assert tracker.hedge_delay() == HEDGE_DEFAULT_DELAY
+    for latency in range(1, LATENCY_MIN_SAMPLES + 1):
+        tracker.record(latency)
+    assert tracker.hedge_delay() == LATENCY_MIN_SAMPLES
+    fast = LatencyTracker(50)
+    for _ in range(LATENCY_MIN_SAMPLES):
+        fast.record(0.01)
+    assert fast.hedge_delay() == HEDGE_MIN_DELAY
+
+
+@pytest.mark.parametrize(("status", "retryable"), [(400, False), (401, False), (429, True), (500, True), (503, True)])
+def test_retryable_status(status, retryable):
+    assert is_retryable_status(status) is retryable
+
+
+def test_backoff_is_capped():
+    assert all(0 <= backoff_delay(attempt) <= BACKOFF_MAX for attempt in range(20))
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after("soon") is None
+
+
+def test_fast_primary_is_not_hedged():
+    hedges = []
+
+    async def hedge():
+        hedges.append(1)
+        return "hedge"
+
+    assert asyncio.run(async_hedge(_answer("primary", 0.01), hedge, 0.2)) == "primary"
+    assert not hedges
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    log = []
+
+    async def run():
+        result = await async_hedge(_answer("primary", 0.5, log), lambda: _answer("hedge", 0.01), 0.05)
+        await asyncio.sleep(0.6)
+        return result
+
+    assert asyncio.run(run()) == "hedge"
+    assert log == []
+
+
+def test_deadline_counts_from_ready():
+    started = asyncio.Event()
+    hedges = []
+
+    async def hedge():
+        hedges.append(1)
+        return "hedge"
+
+    async def primary():
+        await asyncio.sleep(0.1)
+        started.set()
+        return await _answer("primary", 0.05)
+
+    assert asyncio.run(async_hedge(primary(), hedge, 0.1, started.wait)) == "primary"
+    assert not hedges
+
+
+def test_early_failure_is_raised_without_hedging():
+    hedges = []
+
+    async def hedge():
+        hedges.append(1)
+        return "hedge"
+
+    with pytest.raises(ValueError):
+        asyncio.run(async_hedge(_answer(ValueError(), 0.01), hedge, 0.2))
+    assert not hedges
+
+
+def test_hedge_wins_over_failed_primary():
+    assert asyncio.run(async_hedge(_answer(ValueError(), 0.1), lambda: _answer("hedge", 0.1), 0.05)) == "hedge"
+
+
+def test_last_error_is_raised_when_all_fail():
+    with pytest.raises(KeyError):
+        asyncio.run(async_hedge(_answer(ValueError(), 0.1), lambda: _answer(KeyError(), 0.1), 0.05))
+
+
+def test_loser_result_is_discarded():
+    discarded = []
+
+    async def primary():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            # Finishes anyway, as a request whose response arrived can.
+            return "primary"
+
+    result = asyncio.run(async_hedge(primary(), lambda: _answer("hedge", 0.01), 0.05, discard=discarded.append))
+    assert result == "hedge"
+    assert discarded == ["primary"]
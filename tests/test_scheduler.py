@@ -0,0 +1,106 @@
+"""Tests for the TTS request scheduler."""
+import asyncio
+import time
+
+from custom_components.openai_tts.openaitts_scheduler import Priority, RequestScheduler
+
+
+async def _request(scheduler: RequestScheduler, priority: Priority, name: str, order: list, hold: float = 0.01):
+    await scheduler.acquire(priority)
+    order.append(name)
+    try:
+        await asyncio.sleep(hold)
+    finally:
+        scheduler.release()
+
+
+def test_waiting_requests_are_served_by_priority():
+    async def run():
+        scheduler = RequestScheduler(1)
+        order = []
+        await scheduler.acquire(Priority.ANNOUNCEMENT)
+        tasks = []
+        for priority, name in [
+            (Priority.PREWARM, "prewarm"),
+            (Priority.ANNOUNCEMENT, "announcement 1"),
+            (Priority.INTERACTIVE, "interactive"),
+            (Priority.ANNOUNCEMENT, "announcement 2"),
+            (Priority.ALARM, "alarm"),
+        ]:
+            tasks.append(asyncio.create_task(_request(scheduler, priority, name, order)))
+            await asyncio.sleep(0)
+        assert scheduler.stats()["queued"]["announcement"] == 2
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["interactive", "alarm", "announcement 1", "announcement 2", "prewarm"]
+
+
+def test_concurrency_limit():
+    async def run():
+        scheduler = RequestScheduler(2)
+        running = peak = 0
+
+        async def request():
+            nonlocal running, peak
+            await scheduler.acquire(Priority.ANNOUNCEMENT)
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            scheduler.release()
+
+        await asyncio.gather(*(request() for _ in range(6)))
+        return peak
+
+    assert asyncio.run(run()) == 2
+
+
+def test_rate_limit_spaces_requests_in_priority_order():
+    async def run():
+        # A bucket of two tokens refilled at 20 per second.
+        scheduler = RequestScheduler(2, rate_per_minute=1200)
+        order = []
+        starts = {}
+
+        async def request(priority: Priority, name: str):
+            await scheduler.acquire(priority)
+            starts[name] = time.monotonic()
+            order.append(name)
+            scheduler.release()
+
+        start = time.monotonic()
+        tasks = []
+        for priority, name in [
+            (Priority.ANNOUNCEMENT, "a"), (Priority.ANNOUNCEMENT, "b"),
+            (Priority.PREWARM, "c"), (Priority.ANNOUNCEMENT, "d"), (Priority.INTERACTIVE, "e"),
+        ]:
+            tasks.append(asyncio.create_task(request(priority, name)))
+        await asyncio.gather(*tasks)
+        scheduler.close()
+        return order, {name: at - start for name, at in starts.items()}
+
+    order, starts = asyncio.run(run())
+    assert order == ["a", "b", "e", "d", "c"]
+    assert starts["b"] < 0.02
+    assert 0.04 < starts["e"] < 0.09
+    assert starts["c"] > 0.14
+
+
+def test_cancelled_waiter_gives_up_its_turn():
+    async def run():
+        scheduler = RequestScheduler(1)
+        order = []
+        await scheduler.acquire(Priority.ANNOUNCEMENT)
+        cancelled = asyncio.create_task(_request(scheduler, Priority.INTERACTIVE, "cancelled", order))
+        waiting = asyncio.create_task(_request(scheduler, Priority.PREWARM, "prewarm", order))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        scheduler.release()
+        await waiting
+        assert scheduler.stats()["running"] == 0
+        return order
+
+    assert asyncio.run(run()) == ["prewarm"]
@@ -0,0 +1,23 @@
+"""The retry and balancer modules are copied between the two integrations."""
+import re
+from pathlib import Path
+
+import pytest
+
+COMPONENTS = Path(__file__).parent.parent / "custom_components"
+# Lines allowed to differ once the integration names are masked: the hedge
+# timing, which is tuned per service.
+ALLOWED = re.compile(r"HEDGE_DEFAULT_DELAY =|HEDGE_MIN_DELAY =")
+
+
+def _lines(path: Path, own: str, other: str) -> list[str]:
+    text = re.sub(own, "NAME", path.read_text(), flags=re.IGNORECASE)
+    text = re.sub(other, "OTHER", text, flags=re.IGNORECASE)
+    return [line for line in text.splitlines() if not ALLOWED.search(line)]
+
+
+@pytest.mark.parametrize("name", ["retry", "balancer"])
+def test_copies_in_sync(name):
+    tts = _lines(COMPONENTS / "openai_tts" / f"openaitts_{name}.py", "tts", "stt")
+    stt = _lines(COMPONENTS / "openai_stt" / f"openaistt_{name}.py", "stt", "tts")
+    assert tts == stt
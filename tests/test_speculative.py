@@ -0,0 +1,109 @@
+"""Tests for speculative transcription at pauses."""
+import asyncio
+
+import numpy as np
+
+from homeassistant.exceptions import HomeAssistantError
+
+from custom_components.openai_stt.openaistt_audio import AudioBuffer
+from custom_components.openai_stt.openaistt_speculative import SpeculativeTranscriber
+from custom_components.openai_stt.openaistt_vad import DEFAULT_THRESHOLD_DBFS
+
+SAMPLE_RATE = 16000
+CHUNK = 640  # 20 ms
+
+
+def _speech(seconds: float) -> bytes:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 8))
+    return (0.2 * voice * 32767).astype("<i2").tobytes()
+
+
+def _silence(seconds: float) -> bytes:
+    return bytes(2 * int(SAMPLE_RATE * seconds))
+
+
+class _Engine:
+    """Transcribes a buffer as its size, after a round trip longer than the
+    rest of the recording takes to feed; can be told to fail.
+    """
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.requests: list[int] = []
+        self.cancelled = 0
+
+    async def transcribe(self, audio: AudioBuffer) -> str:
+        await audio.wait_finished()
+        self.requests.append(audio.size)
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise HomeAssistantError("API failed")
+        return f"{audio.size} bytes"
+
+
+def _run(recording: bytes, engine: _Engine) -> tuple[str, SpeculativeTranscriber, list[int]]:
+    full = []
+
+    async def transcribe_all() -> str:
+        full.append(audio.size)
+        return "full"
+
+    async def run():
+        speculation = SpeculativeTranscriber(SAMPLE_RATE, DEFAULT_THRESHOLD_DBFS, engine.transcribe)
+        result = asyncio.create_task(speculation.async_transcribe(audio, transcribe_all))
+        for start in range(0, len(recording), CHUNK):
+            chunk = recording[start:start + CHUNK]
+            audio.append(chunk)
+            speculation.process(chunk)
+            # Let the speculative request make progress while the stream goes on.
+            await asyncio.sleep(0.001)
+        audio.finish()
+        return await result, speculation
+
+    audio = AudioBuffer()
+    text, speculation = asyncio.run(run())
+    return text, speculation, full
+
+
+def test_speculative_transcript_is_adopted_when_the_speaker_stops():
+    engine = _Engine()
+    recording = _speech(1.0) + _silence(0.6)
+    text, speculation, full = _run(recording, engine)
+    # Sent at the pause, with the audio up to then.
+    assert speculation.sent == 1
+    assert len(engine.requests) == 1 and engine.requests[0] < len(recording)
+    assert text == f"{engine.requests[0]} bytes"
+    assert full == []
+
+
+def test_speculative_transcript_is_discarded_when_the_speaker_goes_on():
+    engine = _Engine()
+    # The second pause is too short for another early request.
+    recording = _speech(1.0) + _silence(0.4) + _speech(0.5) + _silence(0.2)
+    text, speculation, full = _run(recording, engine)
+    assert speculation.sent == 1
+    assert engine.cancelled == 1
+    assert (text, full) == ("full", [len(recording)])
+
+
+def test_stale_transcript_is_replaced_at_the_next_pause():
+    engine = _Engine()
+    recording = _speech(1.0) + _silence(0.4) + _speech(0.5) + _silence(0.6)
+    text, speculation, full = _run(recording, engine)
+    assert speculation.sent == 2
+    assert engine.requests[1] > engine.requests[0]
+    assert text == f"{engine.requests[1]} bytes"
+    assert full == []
+
+
+def test_failed_speculative_request_falls_back_to_the_full_audio():
+    engine = _Engine(fail=True)
+    recording = _speech(1.0) + _silence(0.6)
+    text, speculation, full = _run(recording, engine)
+    assert speculation.sent == 1
+    assert (text, full) == ("full", [len(recording)])
@@ -0,0 +1,104 @@
+"""Tests for the STT engine's connection warming against a local HTTP server."""
+import asyncio
+import logging
+
+import aiohttp
+from aiohttp import web
+
+from custom_components.openai_stt import openaistt_engine
+from custom_components.openai_stt.openaistt_balancer import Endpoint, EndpointBalancer
+from custom_components.openai_stt.openaistt_engine import OpenAISTTEngine
+from custom_components.openai_stt.openaistt_retry import LatencyTracker
+
+
+async def _serve(handler) -> tuple[web.AppRunner, str]:
+    app = web.Application()
+    app.router.add_route("*", "/v1/audio/transcriptions", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/audio/transcriptions"
+
+
+def test_warm_keeps_one_connection_alive_for_a_bounded_time(monkeypatch, caplog):
+    monkeypatch.setattr(openaistt_engine, "WARM_INTERVAL", 0.05)
+    monkeypatch.setattr(openaistt_engine, "WARM_LIFETIME", 0.2)
+    warmups = []
+
+    async def handler(request: web.Request) -> web.Response:
+        warmups.append(request.transport.get_extra_info("peername"))
+        # Only POST is routed on most servers. Without a length the client
+        # can't tell where a HEAD response ends and drops the connection;
+        # aiohttp's server leaves it out, servers in front of the APIs don't.
+        return web.Response(status=405, headers={"Content-Length": "0"})
+
+    async def run():
+        runner, url = await _serve(handler)
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(keepalive_timeout=30))
+        try:
+            endpoint = Endpoint(url, None, "whisper-1", LatencyTracker(0))
+            engine = OpenAISTTEngine(EndpointBalancer([endpoint]), {url: session}, "en")
+            engine.warm()
+            await asyncio.sleep(0.1)
+            # Called again while warm: the same connection is kept.
+            engine.warm()
+            await asyncio.sleep(0.5)
+            refreshed = len(warmups)
+            await asyncio.sleep(0.2)
+            assert len(warmups) == refreshed
+            assert not engine._warming
+        finally:
+            await session.close()
+            await runner.cleanup()
+
+    with caplog.at_level(logging.DEBUG, logger=openaistt_engine.__name__):
+        asyncio.run(run())
+    # Refreshed until 0.2 s after the last call, over a single connection.
+    assert 3 <= len(warmups) <= 8
+    assert len(set(warmups)) == 1
+    assert "answered the warm-up request with 405" in caplog.text
+    assert "Could not open" not in caplog.text
+
+
+def test_ejected_primary_is_probed_before_taking_requests_again():
+    answers = {"/v1/audio/transcriptions": 500}
+
+    async def handler(request: web.Request) -> web.Response:
+        await request.read()
+        return web.Response(status=answers[request.path], text="hello")
+
+    async def run():
+        runner, url = await _serve(handler)
+        session = aiohttp.ClientSession()
+        try:
+            primary = Endpoint(url, None, "whisper-1", LatencyTracker(0))
+            fallback = Endpoint(url.replace("127.0.0.1", "localhost"), None, "whisper-1", LatencyTracker(0))
+            balancer = EndpointBalancer([primary, fallback])
+            engine = OpenAISTTEngine(balancer, {primary.url: session, fallback.url: session}, "en")
+            for _ in range(3):
+                balancer.report(primary, False)
+            assert primary.ejections == 1
+
+            # The ejection runs out: the primary waits for a probe meanwhile.
+            primary.ejected_until = 0.0
+            assert balancer.due_for_probe() == [primary]
+            assert balancer.select() is fallback
+
+            await engine.async_probe_ejected()
+            # The probe failed: ejected for twice as long.
+            assert primary.ejections == 2
+            assert balancer.due_for_probe() == []
+
+            primary.ejected_until = 0.0
+            answers["/v1/audio/transcriptions"] = 200
+            await engine.async_probe_ejected()
+            assert primary.ejections == 0
+            assert primary.average_latency is not None
+            assert balancer.due_for_probe() == []
+        finally:
+            await session.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
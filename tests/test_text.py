@@ -0,0 +1,73 @@
+"""Tests for the TTS text segmentation."""
+from custom_components.openai_tts.openaitts_text import SentenceSplitter, split_text
+
+
+def _stream(text: str, step: int, **kwargs) -> list[str]:
+    splitter = SentenceSplitter(**kwargs)
+    sentences = []
+    for start in range(0, len(text), step):
+        sentences += splitter.feed(text[start:start + step])
+    return sentences + splitter.flush()
+
+
+def test_sentence_is_returned_once_the_whitespace_after_it_arrives():
+    splitter = SentenceSplitter(min_length=1)
+    assert splitter.feed("It is sunny.") == []
+    assert splitter.feed(" Tomorrow") == ["It is sunny."]
+    assert splitter.feed(" it rains!\n") == ["Tomorrow it rains!"]
+    assert splitter.flush() == []
+
+
+def test_boundaries_do_not_depend_on_how_the_text_arrives():
+    text = 'He said "go now." Then he left! Did he? Yes… 今日は晴れ。 End of story'
+    expected = ['He said "go now."', "Then he left!", "Did he?", "Yes…", "今日は晴れ。", "End of story"]
+    for step in (1, 2, 5, len(text)):
+        assert _stream(text, step, min_length=1) == expected
+
+
+def test_no_boundary_inside_numbers_or_without_whitespace():
+    assert _stream("Pi is 3.14 and e.g.this stays.", 3, min_length=1) == ["Pi is 3.14 and e.g.this stays."]
+
+
+def test_paragraph_break_ends_a_sentence():
+    assert _stream("A heading\n\nThe first line", 4, min_length=1) == ["A heading", "The first line"]
+
+
+def test_short_sentences_are_merged():
+    assert _stream("Sure. Ok. The lights are off now. Bye.", 4, min_length=20) == [
+        "Sure. Ok. The lights are off now.", "Bye.",
+    ]
+
+
+def test_long_text_is_cut_at_whitespace_within_the_limit():
+    text = " ".join(["word"] * 30)
+    sentences = _stream(text + ". And more text. ", 7, min_length=1, max_length=40)
+    assert all(len(sentence) <= 40 for sentence in sentences)
+    assert " ".join(sentences) == text + ". And more text."
+    assert sentences[-1] == "And more text."
+
+
+def test_split_text_keeps_short_text_whole():
+    assert split_text("  Hello there.  ") == ["Hello there."]
+    assert split_text("   ") == []
+
+
+def test_split_text_balances_chunks_at_sentence_boundaries():
+    sentences = [f"This is sentence number {index}." for index in range(40)]
+    text = " ".join(sentences)
+    chunks = split_text(text, max_length=400)
+    assert " ".join(chunks) == text
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    # As few chunks as the limit allows, each but the last ending at the
+    # first sentence boundary past an even share of the text.
+    assert len(chunks) == -(-len(text) // 400)
+    share = -(-len(text) // len(chunks))
+    assert all(share <= len(chunk) < share + len(sentences[-1]) + 1 for chunk in chunks[:-1])
+
+
+def test_split_text_cuts_unpunctuated_text_at_whitespace():
+    text = " ".join(["word"] * 300)
+    chunks = split_text(text, max_length=100)
+    assert " ".join(chunks) == text
+    assert all(len(chunk) <= 100 for chunk in chunks)
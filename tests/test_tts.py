@@ -0,0 +1,325 @@
+"""Tests for the OpenAI TTS entity."""
+import asyncio
+import math
+import types
+
+import pytest
+
+from homeassistant.components.tts import TTSAudioRequest
+from homeassistant.exceptions import HomeAssistantError
+
+from custom_components.openai_tts.openaitts_balancer import Endpoint
+from custom_components.openai_tts.openaitts_cache import OpenAITTSCache
+from custom_components.openai_tts.openaitts_engine import AudioResponse
+from custom_components.openai_tts.openaitts_retry import LatencyTracker
+from custom_components.openai_tts.openaitts_scheduler import Priority
+from custom_components.openai_tts.tts import BASE_SPEED, STREAM_LOOKAHEAD, OpenAITTSEntity, _async_whole_message, _atempo_filters
+
+ENDPOINT = Endpoint("https://api.example/v1/audio/speech", "key", "tts-1", LatencyTracker(0))
+
+
+class _Hass:
+    """The parts of Home Assistant the entity uses."""
+
+    def __init__(self):
+        self.states = types.SimpleNamespace(async_available=lambda entity_id: True)
+
+    def async_add_executor_job(self, target, *args):
+        return asyncio.get_running_loop().run_in_executor(None, target, *args)
+
+    def async_create_task(self, coro, name=None):
+        return asyncio.get_running_loop().create_task(coro)
+
+
+class _Engine:
+    """Answers every request with the text, speed and format it was asked for."""
+
+    endpoints = [ENDPOINT]
+
+    def __init__(self):
+        self.calls: list[dict] = []
+
+    def _audio(self, text: str, **kwargs) -> bytes:
+        self.calls.append({"text": text, **kwargs})
+        return f"[{text}|{kwargs['speed']}|{kwargs['response_format']}]".encode()
+
+    async def async_get_tts(self, text: str, **kwargs) -> AudioResponse:
+        return AudioResponse(self._audio(text, **kwargs), ENDPOINT)
+
+    async def async_stream_tts(self, text: str, on_open=None, **kwargs):
+        audio = self._audio(text, **kwargs)
+        if on_open is not None:
+            on_open(ENDPOINT)
+        for start in range(0, len(audio), 4):
+            await asyncio.sleep(0)
+            yield audio[start:start + 4]
+
+
+class _FFmpeg:
+    """Records the jobs instead of running ffmpeg."""
+
+    def __init__(self):
+        self.jobs: list[list[str]] = []
+
+    async def async_run(self, args: list[str], audio: bytes) -> bytes:
+        self.jobs.append(args)
+        return audio
+
+    async def async_stream(self, args: list[str], chunks):
+        self.jobs.append(args)
+        async for chunk in chunks:
+            yield chunk
+
+
+def _entity(options: dict | None = None, engine: _Engine | None = None,
+            cache: OpenAITTSCache | None = None) -> OpenAITTSEntity:
+    config = types.SimpleNamespace(
+        entry_id="entry",
+        data={"url": ENDPOINT.url, "model": ENDPOINT.model, "voice": "nova", "speed": 1.0},
+        options=options or {},
+    )
+    return OpenAITTSEntity(_Hass(), config, engine or _Engine(), cache=cache, ffmpeg=_FFmpeg())
+
+
+async def _message(*parts: str):
+    for part in parts:
+        await asyncio.sleep(0)
+        yield part
+
+
+async def _stream(entity: OpenAITTSEntity, *parts: str, options: dict | None = None) -> tuple[str, bytes]:
+    response = await entity.async_stream_tts_audio(TTSAudioRequest("en", options or {}, _message(*parts)))
+    return response.extension, b"".join([chunk async for chunk in response.data_gen])
+
+
+@pytest.mark.parametrize(("tempo", "filters"), [
+    (1.0, ["atempo=1.0000"]),
+    (1.5, ["atempo=1.5000"]),
+    (0.5, ["atempo=0.5000"]),
+    (0.4, ["atempo=0.5", "atempo=0.8000"]),
+    (0.2, ["atempo=0.5", "atempo=0.5", "atempo=0.8000"]),
+])
+def test_atempo_filters(tempo, filters):
+    assert _atempo_filters(tempo) == filters
+
+
+@pytest.mark.parametrize("tempo", [0.1, 0.26, 0.49, 0.5, 2.0, 4.0])
+def test_atempo_chain_multiplies_to_the_tempo(tempo):
+    factors = [float(f.split("=")[1]) for f in _atempo_filters(tempo)]
+    assert all(0.5 <= factor <= 100 for factor in factors)
+    assert math.prod(factors) == pytest.approx(tempo, abs=1e-3)
+
+
+def test_streamed_message_with_local_speed_is_time_stretched():
+    engine = _Engine()
+    entity = _entity({"local_speed": True, "speed": 1.5}, engine)
+    asyncio.run(_stream(entity, "Hello there. ", "How are you today?"))
+    assert [call["speed"] for call in engine.calls] == [BASE_SPEED]
+    assert engine.calls[0]["response_format"] == "pcm"
+    assert any("atempo=1.5000" in arg for arg in entity._ffmpeg.jobs[0])
+
+
+@pytest.mark.parametrize(("parts", "options", "priority"), [
+    (["Turn off the lights. The alarm is set."], {}, Priority.ANNOUNCEMENT),
+    (["Turn off ", "the lights. ", "The alarm is set."], {}, Priority.INTERACTIVE),
+    (["Wake up. It is seven."], {"priority": "alarm"}, Priority.ALARM),
+    (["Wake ", "up."], {"priority": "prewarm"}, Priority.PREWARM),
+])
+@pytest.mark.parametrize("audio_format", ["mp3", "flac"])
+def test_priority_of_streamed_requests(parts, options, priority, audio_format):
+    engine = _Engine()
+    asyncio.run(_stream(_entity({"audio_format": audio_format}, engine), *parts, options=options))
+    assert engine.calls
+    assert {call["priority"] for call in engine.calls} == {priority}
+
+
+def test_whole_message_tells_one_piece_from_a_stream():
+    async def run(*parts):
+        message, stream = await _async_whole_message(_message(*parts))
+        return message, [part async for part in stream]
+
+    assert asyncio.run(run()) == ("", [])
+    assert asyncio.run(run("Hello.")) == ("Hello.", ["Hello."])
+    assert asyncio.run(run("Hel", "lo", ".")) == (None, ["Hel", "lo", "."])
+
+
+def _cache(tmp_path) -> OpenAITTSCache:
+    cache = OpenAITTSCache(str(tmp_path), 1 << 20)
+    cache.load()
+    return cache
+
+
+@pytest.mark.parametrize("audio_format", ["aac", "wav"])
+def test_streamed_message_in_one_piece_is_cached(tmp_path, audio_format):
+    engine = _Engine()
+    entity = _entity({"audio_format": audio_format}, engine, _cache(tmp_path))
+    first = asyncio.run(_stream(entity, "Hello there. How are you today?"))
+    calls = len(engine.calls)
+    again = asyncio.run(_stream(entity, "Hello there. How are you today?"))
+    assert len(engine.calls) == calls
+    assert again[0] == first[0]
+    if audio_format == "wav":
+        assert again[1][44:] == first[1][44:]
+    else:
+        assert again[1] == first[1]
+
+
+def test_token_stream_is_not_cached(tmp_path):
+    engine = _Engine()
+    entity = _entity(engine=engine, cache=_cache(tmp_path))
+    asyncio.run(_stream(entity, "Hello ", "there."))
+    calls = len(engine.calls)
+    asyncio.run(_stream(entity, "Hello ", "there."))
+    assert len(engine.calls) == 2 * calls
+
+
+@pytest.mark.parametrize("audio_format", ["mp3", "wav"])
+def test_prewarmed_phrase_is_streamed_without_an_api_call(tmp_path, audio_format):
+    engine = _Engine()
+    entity = _entity({"audio_format": audio_format}, engine, _cache(tmp_path))
+    asyncio.run(entity._async_prewarm(["The washing machine is done."], {}))
+    assert len(engine.calls) == 1
+    extension, audio = asyncio.run(_stream(entity, "The washing machine is done."))
+    assert len(engine.calls) == 1
+    assert extension == audio_format
+    assert b"[The washing machine is done.|1.0|" in audio
+
+
+def test_concurrent_streams_of_a_sentence_share_one_request():
+    engine = _Engine()
+    entity = _entity(engine=engine)
+
+    async def run():
+        return await asyncio.gather(*(_stream(entity, "Dinner is ready.") for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert len(engine.calls) == 1
+    assert all(result == results[0] for result in results)
+    # A later stream is requested anew.
+    asyncio.run(_stream(entity, "Dinner is ready."))
+    assert len(engine.calls) == 2
+
+
+@pytest.mark.parametrize(("audio_format", "options"), [
+    ("flac", {}),
+    ("flac", {"preferred_sample_rate": 16000}),
+    ("mp3", {"preferred_sample_rate": 16000}),
+    ("wav", {"preferred_sample_rate": 16000, "preferred_sample_channels": 2}),
+])
+def test_streamed_message_is_transcoded_on_the_fly(audio_format, options):
+    engine = _Engine()
+    entity = _entity({"audio_format": audio_format}, engine)
+    extension, audio = asyncio.run(_stream(
+        entity, "The front door has been open for ten minutes now. ", "Please close it before you leave the house.",
+        options=options,
+    ))
+    assert extension == audio_format
+    # Still synthesized sentence by sentence, encoded by a single ffmpeg process.
+    assert [call["response_format"] for call in engine.calls] == ["pcm", "pcm"]
+    [job] = entity._ffmpeg.jobs
+    assert job[job.index("-ar", job.index("pipe:0")) + 1] == str(options.get("preferred_sample_rate", 24000))
+    assert audio.endswith(b"[Please close it before you leave the house.|1.0|pcm]")
+
+
+SENTENCES = [
+    "The first sentence is the one that is played first. ",
+    "The second sentence follows right after the first one. ",
+    "The third sentence should come third in the audio. ",
+    "The fourth sentence waits until there is room for it. ",
+    "The fifth sentence is the last one of this message.",
+]
+
+
+class _GatedEngine(_Engine):
+    """Streams a sentence only once it is released, recording how many are in flight."""
+
+    def __init__(self, fail: str | None = None):
+        super().__init__()
+        self.gates: dict[str, asyncio.Event] = {}
+        self.inflight = 0
+        self.peak = 0
+        self.fail = fail
+
+    def gate(self, text: str) -> asyncio.Event:
+        return self.gates.setdefault(text.strip(), asyncio.Event())
+
+    async def async_stream_tts(self, text: str, on_open=None, **kwargs):
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        try:
+            await self.gate(text).wait()
+            if text == self.fail:
+                raise HomeAssistantError("API failed")
+            async for chunk in super().async_stream_tts(text, on_open, **kwargs):
+                yield chunk
+        finally:
+            self.inflight -= 1
+
+
+def test_stream_plays_sentences_in_message_order():
+    engine = _GatedEngine()
+    entity = _entity({"audio_format": "aac"}, engine)
+
+    async def run():
+        reader = asyncio.create_task(_stream(entity, *SENTENCES))
+        # Later sentences finish first.
+        for sentence in reversed(SENTENCES):
+            await asyncio.sleep(0.01)
+            engine.gate(sentence).set()
+        return await reader
+
+    _, audio = asyncio.run(run())
+    assert audio == b"".join(f"[{sentence.strip()}|1.0|aac]".encode() for sentence in SENTENCES)
+
+
+def test_stream_requests_a_bounded_number_of_sentences_ahead():
+    engine = _GatedEngine()
+    entity = _entity({"audio_format": "aac"}, engine)
+
+    async def run():
+        reader = asyncio.create_task(_stream(entity, *SENTENCES))
+        await asyncio.sleep(0.05)
+        assert engine.peak == STREAM_LOOKAHEAD
+        assert [call["text"] for call in engine.calls] == []
+        for sentence in SENTENCES:
+            engine.gate(sentence).set()
+            await asyncio.sleep(0.01)
+        await reader
+
+    asyncio.run(run())
+    assert engine.peak == STREAM_LOOKAHEAD
+    assert len(engine.calls) == len(SENTENCES)
+
+
+def test_stream_raises_when_a_sentence_fails():
+    engine = _GatedEngine(fail=SENTENCES[1].strip())
+    entity = _entity({"audio_format": "aac"}, engine)
+
+    async def run():
+        for sentence in SENTENCES:
+            engine.gate(sentence).set()
+        response = await entity.async_stream_tts_audio(TTSAudioRequest("en", {}, _message(*SENTENCES)))
+        received = []
+        with pytest.raises(HomeAssistantError, match="API failed"):
+            async for chunk in response.data_gen:
+                received.append(chunk)
+        await asyncio.sleep(0.01)
+        return b"".join(received)
+
+    # What was played before the failure got through; nothing is left running.
+    assert asyncio.run(run()) == f"[{SENTENCES[0].strip()}|1.0|aac]".encode()
+    assert engine.inflight == 0
+
+
+def test_stream_raises_when_the_message_stream_fails():
+    async def message():
+        yield SENTENCES[0]
+        await asyncio.sleep(0)
+        raise ValueError("agent failed")
+
+    async def run():
+        response = await _entity().async_stream_tts_audio(TTSAudioRequest("en", {}, message()))
+        return [chunk async for chunk in response.data_gen]
+
+    with pytest.raises(ValueError, match="agent failed"):
+        asyncio.run(run())
@@ -0,0 +1,81 @@
+"""Tests for splitting STT recordings at pauses."""
+import numpy as np
+import pytest
+
+from custom_components.openai_stt.openaistt_pcm import PCMFormat, wav_header
+from custom_components.openai_stt.openaistt_vad import FRAME_MS, PADDING_MS, PauseSplitter
+
+SAMPLE_RATE = 16000
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000 * 2
+
+
+def _speech(seconds: float) -> bytes:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 8))
+    return (0.2 * voice * 32767).astype("<i2").tobytes()
+
+
+def _silence(seconds: float) -> bytes:
+    return bytes(2 * int(SAMPLE_RATE * seconds))
+
+
+def _split(audio: bytes, part_seconds: float, chunk: int = 1000) -> list[bytes]:
+    splitter = PauseSplitter(SAMPLE_RATE, part_seconds)
+    parts = [b""]
+    for start in range(0, len(audio), chunk):
+        for piece in splitter.split(audio[start:start + chunk]):
+            if piece is None:
+                parts.append(b"")
+            else:
+                parts[-1] += bytes(piece)
+    parts[-1] += bytes(splitter.flush())
+    return [part for part in parts if part]
+
+
+def test_short_recording_stays_whole():
+    audio = _speech(1) + _silence(0.7) + _speech(1)
+    assert _split(audio, 10) == [audio]
+
+
+@pytest.mark.parametrize("chunk", [FRAME_BYTES, 1000, 7777])
+def test_cut_at_a_pause_past_half_the_part_length(chunk):
+    first = _speech(2) + _silence(0.3) + _speech(4)
+    second = _speech(3)
+    audio = first + _silence(1) + second
+    parts = _split(audio, 10, chunk)
+    assert len(parts) == 2
+    # A pause before half the length doesn't count; the first part ends
+    # once the pause is long enough, and the next starts with the padding
+    # before the speech.
+    assert parts[0].startswith(first)
+    assert len(parts[0]) <= len(first) + len(_silence(0.6)) + FRAME_BYTES
+    assert parts[1] == _silence(PADDING_MS / 1000) + second
+
+
+def test_shorter_pauses_do_near_the_part_length():
+    # A 200 ms pause is too short at 5.5 s into a 10 s part, but enough at 8.8 s.
+    early = _speech(5.5) + _silence(0.2)
+    late = _speech(3.1) + _silence(0.2)
+    parts = _split(early + late + _speech(2), 10)
+    assert len(parts) == 2
+    assert parts[0].startswith(early + _speech(3.1))
+    assert len(parts[0]) <= len(early + late)
+
+
+def test_cut_regardless_at_the_part_length():
+    audio = _speech(25)
+    parts = _split(audio, 10)
+    assert [len(part) for part in parts] == [len(_speech(10)), len(_speech(10)), len(_speech(5))]
+    assert b"".join(parts) == audio
+
+
+def test_trailing_silence_is_not_a_part():
+    audio = _speech(6) + _silence(3)
+    parts = _split(audio, 10)
+    assert len(parts) == 1
+    assert parts[0].startswith(_speech(6))
+
+
+def test_wav_header_is_dropped():
+    audio = _speech(1)
+    assert _split(wav_header(PCMFormat(SAMPLE_RATE)) + audio, 10) == [audio]